@@ -1,9 +1,19 @@
 import pickle
+import json
+import sys
 from datetime import datetime
-from typing import List, Optional, Dict, Tuple
+from typing import List, Optional, Dict, Tuple, Iterable, Iterator, Callable, Any
 import os
 import uuid
+import zlib
+import shutil
+import hashlib
+import lzma
 import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 # Current version of the Conversation class
 # x.y.z format where:
@@ -12,74 +22,444 @@ import logging
 # z = patch version (bug fixes)
 CONVERSATION_VERSION = "1.0.0"
 
+# Conversations that can't be loaded by this version are moved here, inside the conversations directory, rather than deleted
+BACKUP_DIRNAME = "backups"
+
+# Conversations that haven't been used for a while can be moved from their snapshot into a pack file by
+# conversation_archive.py, which can be read in place without loading the whole conversation
+ARCHIVE_EXTENSION = ".pack"
+
+# Number of journal entries written after the last snapshot before the journal is compacted into a new snapshot
+JOURNAL_COMPACTION_THRESHOLD = 200
+
+# Snapshots are compressed, conversations hold long and highly repetitive text. A compressed snapshot starts with
+# SNAPSHOT_MAGIC followed by a one byte codec marker, files without it are plain pickles from before compression
+SNAPSHOT_MAGIC = b'LACS'
+SNAPSHOT_CODECS = {'none': b'0', 'zlib': b'z', 'lzma': b'x'}
+# Codec and level used for new snapshots, change with set_storage_compression
+STORAGE_CODEC = 'zlib'
+STORAGE_COMPRESSION_LEVEL = 6
+
+# Conversation files are handed to load_conversations_parallel's workers in chunks of this many files, with at most
+# PARALLEL_CHUNKS_PER_WORKER chunks per worker queued or in flight, so memory stays bounded however large the directory is
+PARALLEL_CHUNK_SIZE = 32
+PARALLEL_CHUNKS_PER_WORKER = 2
+
+# Reader/writer lock guarding a single conversation, many readers may hold it at once,
+# writers get exclusive access. The thread holding the write lock may also re-enter it or read.
+class ReadWriteLock:
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._writer_depth = 0
+
+    @contextmanager
+    def read_locked(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                # Reading while holding the write lock is always safe
+                self._writer_depth += 1
+                reentrant = True
+            else:
+                while self._writer is not None:
+                    self._condition.wait()
+                self._readers += 1
+                reentrant = False
+        try:
+            yield
+        finally:
+            with self._condition:
+                if reentrant:
+                    self._writer_depth -= 1
+                else:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._condition.notify_all()
+
+    @contextmanager
+    def write_locked(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                while self._writer is not None or self._readers > 0:
+                    self._condition.wait()
+                self._writer = me
+                self._writer_depth = 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer_depth -= 1
+                if self._writer_depth == 0:
+                    self._writer = None
+                    self._condition.notify_all()
+
 # Node class represents a single message in the conversation
+# Nodes are kept compact since a conversation can hold tens of thousands of them: no per-instance __dict__, the uuid is
+# held as an integer, the timestamp as epoch seconds, and sender and model names are interned so every node shares one copy.
+# id and timestamp are exposed as the usual string and datetime views.
+# Children are kept oldest first and every node caches its position among its siblings, so sibling navigation never sorts.
+# A node that left the current branch remembers the leaf the user was on below it, so switching back returns there
 class Node:
+    __slots__ = ('_id', 'content', '_sender', '_created', 'children', 'parent', '_model_name', 'internal_monologue', 'sibling_index', 'active_leaf')
+
     def __init__(self, content: str, sender: str, timestamp: datetime, model_name: Optional[str] = None, internal_monologue: Optional[str] = None):
-        self.id = str(uuid.uuid4())
+        self._id = uuid.uuid4().int
         self.content = content
         self.sender = sender
         self.timestamp = timestamp
         self.children: List[Node] = []
         self.parent: Optional[Node] = None
-        self.model_name: Optional[str] = model_name
+        self.model_name = model_name
         self.internal_monologue = internal_monologue
+        self.sibling_index = 0  # Position in parent.children
+        self.active_leaf: Optional[Node] = None  # Where the user last was below this node, set when it leaves the current branch
+
+    # Create a node from stored fields without generating a new id, used when loading
+    @classmethod
+    def restore(cls, compact_id, content: str, sender: str, created: float, model_name: Optional[str], internal_monologue: Optional[str]) -> 'Node':
+        node = cls.__new__(cls)
+        node._id = compact_id
+        node.content = content
+        node.sender = sender
+        node._created = created
+        node.children = []
+        node.parent = None
+        node.model_name = model_name
+        node.internal_monologue = internal_monologue
+        node.sibling_index = 0
+        node.active_leaf = None
+        return node
+
+    @property
+    def id(self) -> str:
+        return _id_string(self._id)
+
+    @id.setter
+    def id(self, value: str):
+        self._id = _compact_id(value)
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self._created)
+
+    @timestamp.setter
+    def timestamp(self, value: datetime):
+        self._created = value.timestamp()
+
+    @property
+    def sender(self) -> str:
+        return self._sender
+
+    @sender.setter
+    def sender(self, value: str):
+        self._sender = sys.intern(value)
+
+    @property
+    def model_name(self) -> Optional[str]:
+        return self._model_name
+
+    @model_name.setter
+    def model_name(self, value: Optional[str]):
+        self._model_name = sys.intern(value) if value is not None else None
+
+    # Pickled with the same fields as the original dict based node, so nodes from older files load and old code can read new ones
+    def __getstate__(self):
+        return {
+            'id': self.id,
+            'content': self.content,
+            'sender': self.sender,
+            'timestamp': self.timestamp,
+            'children': self.children,
+            'parent': self.parent,
+            'model_name': self.model_name,
+            'internal_monologue': self.internal_monologue
+        }
+
+    def __setstate__(self, state):
+        self.id = state['id']
+        self.content = state['content']
+        self.sender = state['sender']
+        self.timestamp = state['timestamp']
+        self.children = state.get('children', [])
+        self.parent = state.get('parent')
+        self.model_name = state.get('model_name')
+        self.internal_monologue = state.get('internal_monologue')
+        self.sibling_index = 0  # Set when the tree rebuilds its index
+        self.active_leaf = None
+
+# Node ids are uuid strings, held as their 128 bit integer, anything that isn't a uuid is kept as given
+def _compact_id(node_id: str):
+    try:
+        return uuid.UUID(node_id).int
+    except (ValueError, AttributeError, TypeError):
+        return node_id
+
+def _id_string(compact_id) -> str:
+    return str(uuid.UUID(int=compact_id)) if isinstance(compact_id, int) else compact_id
 
 # Tree class manages the branching structure of the conversation
 class Tree:
     def __init__(self):
         self.root = self.current_node = Node("", "Root", datetime.now()) # Empty root node, first message in brach is always child of root, to allow for multiple branches including the first message in a conversation 
+        self.nodes: Dict[int, Node] = {self.root._id: self.root}  # Index of every node by compact id
+        self._rebuild_path()
+
+    # Trees are pickled as a flat node table rather than the linked node graph, which pickle would recurse through.
+    # Nodes are listed in pre-order, so every parent comes before its children and children keep their order.
+    # Message contents are stored once each in a blob table that nodes refer to, so text repeated across edits and
+    # regenerations, such as a large pasted input, is only stored once
+    def __getstate__(self):
+        ids, parents, senders, model_names, created, internal_monologues = [], [], [], [], [], []
+        blobs, blob_offsets, content_refs = [], [0], []
+        blob_index: Dict[str, int] = {}
+        index_of: Dict[int, int] = {}
+        order: List[Node] = []
+        stack = [(self.root, -1)]
+        while stack:
+            node, parent_index = stack.pop()
+            index_of[id(node)] = len(ids)
+            order.append(node)
+            ids.append(node._id)
+            parents.append(parent_index)
+            senders.append(node.sender)
+            model_names.append(node.model_name)
+            created.append(node._created)
+            internal_monologues.append(node.internal_monologue)
+            ref = blob_index.get(node.content)
+            if ref is None:
+                ref = blob_index[node.content] = len(blobs)
+                blobs.append(node.content)
+                blob_offsets.append(blob_offsets[-1] + len(node.content))
+            content_refs.append(ref)
+            stack.extend((child, index_of[id(node)]) for child in reversed(node.children))
+        return {
+            'ids': ids,
+            'parents': parents,
+            'senders': senders,
+            'model_names': model_names,
+            'created': created,
+            'internal_monologues': internal_monologues,
+            'blobs': ''.join(blobs),
+            'blob_offsets': blob_offsets,
+            'content_refs': content_refs,
+            'current': index_of.get(id(self.current_node), 0),
+            'active_leaves': [index_of.get(id(node.active_leaf), -1) for node in order]
+        }
+
+    # Rebuild the linked tree from the node table in one linear pass, files saved before the flat table still hold the node graph
+    def __setstate__(self, state):
+        if 'root' in state:
+            self.__dict__.update(state)
+            self.rebuild_index()
+            return
+        # Nodes with the same content share one string in memory as well
+        if 'content_refs' in state:
+            joined, offsets = state['blobs'], state['blob_offsets']
+            blobs = [joined[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+            contents = [blobs[ref] for ref in state['content_refs']]
+        else:
+            # Tables written before the blob table hold every node's content
+            joined, offsets = state['content'], state['content_offsets']
+            contents = [joined[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        senders, model_names, internal_monologues, parents = state['senders'], state['model_names'], state['internal_monologues'], state['parents']
+        # Tables written before nodes were compacted hold uuid strings and datetimes
+        created = state['created'] if 'created' in state else [timestamp.timestamp() for timestamp in state['timestamps']]
+        nodes: List[Node] = []
+        self.nodes = {}
+        for i, node_id in enumerate(state['ids']):
+            if isinstance(node_id, str):
+                node_id = _compact_id(node_id)
+            node = Node.restore(node_id, contents[i], senders[i], created[i], model_names[i], internal_monologues[i])
+            parent_index = parents[i]
+            if parent_index >= 0:
+                node.parent = nodes[parent_index]
+                node.sibling_index = len(node.parent.children)
+                node.parent.children.append(node)
+            nodes.append(node)
+            self.nodes[node_id] = node
+        self.root = nodes[0]
+        self.current_node = nodes[state['current']]
+        for node, leaf_index in zip(nodes, state.get('active_leaves', ())):
+            if leaf_index >= 0:
+                node.active_leaf = nodes[leaf_index]
+        self._rebuild_path()
+
+    # Rebuild the id index, sibling positions and current branch from the tree, iteratively so deep trees can't hit the
+    # recursion limit. Needed after loading the linked node graph, after children were removed or after current_node was
+    # assigned directly. Children are put back in creation order
+    def rebuild_index(self):
+        self.nodes = {}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            self.nodes[node._id] = node
+            node.children.sort(key=lambda child: child._created)
+            for i, child in enumerate(node.children):
+                child.sibling_index = i
+            stack.extend(node.children)
+        # Forget remembered leaves that were removed from the tree
+        for node in self.nodes.values():
+            if node.active_leaf is not None and self.nodes.get(node.active_leaf._id) is not node.active_leaf:
+                node.active_leaf = None
+        # If the current node was removed, move up to its nearest remaining ancestor
+        while self.nodes.get(self.current_node._id) is not self.current_node:
+            self.current_node = self.current_node.parent
+        self._rebuild_path()
+
+    # The current branch is kept as a list from the root to the current node, with each node's position in it, so
+    # reading the branch needs no walk up the tree and moving the current node only changes the part that differs
+    def _rebuild_path(self):
+        path = []
+        node = self.current_node
+        while node is not None:
+            path.append(node)
+            node = node.parent
+        path.reverse()
+        self.path: List[Node] = path
+        self._path_index: Dict[int, int] = {node._id: i for i, node in enumerate(path)}
+
+    # Position of a node in the current branch, with the root at 0, None if it isn't on the current branch
+    def branch_position(self, node: Node) -> Optional[int]:
+        i = self._path_index.get(node._id)
+        return i if i is not None and self.path[i] is node else None
+
+    # Replace the current branch below position i with the given nodes, which continue from path[i]
+    def _replace_path_below(self, i: int, nodes: List[Node]):
+        for removed in self.path[i + 1:]:
+            del self._path_index[removed._id]
+        del self.path[i + 1:]
+        for node in nodes:
+            self._path_index[node._id] = len(self.path)
+            self.path.append(node)
+        self.current_node = self.path[-1]
 
     # Add a new message to the conversation
     def add_node(self, content: str, sender: str, model_name: Optional[str] = None, internal_monologue: Optional[str] = None) -> Node:
         new_node = Node(content, sender, datetime.now(), model_name, internal_monologue)
-        new_node.parent = self.current_node
-        self.current_node.children.append(new_node)
-        self.current_node = new_node
-        return new_node
+        return self.attach_node(new_node, self.current_node)
     
     # Edit an existing message, creating a new branch
     def edit_node(self, node_id: str, new_content: str) -> Optional[Node]:
         node = self.find_node(node_id)
         if node and node != self.root:
+            # Resubmitting a message unchanged shares its content rather than holding a second copy
+            if new_content == node.content:
+                new_content = node.content
             # Don't preserve planning when editing (set to None)
             new_node = Node(new_content, node.sender, datetime.now(), node.model_name, None)
-            new_node.parent = node.parent
-            node.parent.children.append(new_node)
-            self.current_node = new_node
-            return new_node
+            return self.attach_node(new_node, node.parent)
         return None
+
+    # Attach a created node as the newest child of parent and make it the current node
+    def attach_node(self, node: Node, parent: Node) -> Node:
+        node.parent = parent
+        node.sibling_index = len(parent.children)
+        parent.children.append(node)
+        self.nodes[node._id] = node
+        self.set_current(node)
+        return node
+
+    # Move the current node, nodes that leave the current branch remember the current node as where the user last was.
+    # The branch is updated from the point where the old and new branches diverge: adding a message to the current node
+    # appends to it, moving to an ancestor truncates it
+    def set_current(self, node: Node):
+        previous = self.current_node
+        # Walk up from the new node to the current branch
+        below = []
+        shared = node
+        while self.branch_position(shared) is None:
+            below.append(shared)
+            shared = shared.parent
+        i = self.branch_position(shared)
+        for leaving in self.path[i + 1:]:
+            leaving.active_leaf = previous
+        below.reverse()
+        self._replace_path_below(i, below)
+
+    # Move from a message on the current branch to one of its siblings and down to where the user last was below it.
+    # Every message left remembers where the user was, as with set_current, so a message below it returns there when it
+    # is reached again from further up, and replaying the move from the journal records the same leaves
+    def switch_to_sibling(self, node: Node, sibling: Node):
+        i = self.branch_position(node)
+        if i is None:
+            self.set_current(self.get_leaf_node(sibling))
+            return
+        for leaving in self.path[i:]:
+            leaving.active_leaf = self.current_node
+        below = []
+        leaf = self.get_leaf_node(sibling)
+        while leaf is not node.parent:
+            below.append(leaf)
+            leaf = leaf.parent
+        below.reverse()
+        self._replace_path_below(i - 1, below)
     
     # Find a specific node in the conversation
     def find_node(self, node_id: str) -> Optional[Node]:
-        def dfs(node):
-            if node.id == node_id:
-                return node
-            for child in node.children:
-                result = dfs(child)
-                if result:
-                    return result
-            return None
-        return dfs(self.root) if self.root else None
+        return self.nodes.get(_compact_id(node_id))
 
+    # Get a node and its siblings, oldest first
     def get_siblings(self, node_id: str) -> List[Node]:
         node = self.find_node(node_id)
         if node and node.parent and node != self.root:
-            siblings = sorted(node.parent.children, key=lambda x: x.timestamp)
-            return siblings
+            return list(node.parent.children)
         else:
             return []
 
+    # Get the sibling offset places from a node, e.g. -1 for the previous one, None if there is none
+    def get_sibling(self, node: Node, offset: int) -> Optional[Node]:
+        if node.parent is None:
+            return None
+        index = node.sibling_index + offset
+        if 0 <= index < len(node.parent.children):
+            return node.parent.children[index]
+        return None
+
+    # Get a node's position among its siblings and the number of siblings, as in "2 of 5"
+    def get_sibling_position(self, node: Node) -> Tuple[int, int]:
+        if node.parent is None:
+            return 0, 1
+        return node.sibling_index, len(node.parent.children)
+
     def get_current_branch(self) -> List[Node]:
-        branch = []
-        current = self.current_node
-        while current and current != self.root:
-            branch.append(current)
-            current = current.parent
-        return list(reversed(branch))
-    
+        return self.path[1:]
+
+    # Get the part of the current branch from node down to the current node, empty if node isn't on the branch.
+    # After switching branches only this part changed, the messages above node are the same as before
+    def get_current_branch_from(self, node: Node) -> List[Node]:
+        i = self.branch_position(node)
+        return self.path[i:] if i else []
+
+    # Compare a branch the client already shows, ending at known_leaf, with the current branch. Returns how many of
+    # its messages are still on the current branch and the messages that follow them. Only the part that differs is
+    # walked: up from known_leaf to the current branch, then down the current branch
+    def get_branch_delta(self, known_leaf: Node) -> Tuple[int, List[Node]]:
+        shared = known_leaf
+        while self.branch_position(shared) is None:
+            shared = shared.parent
+        i = self.branch_position(shared)
+        return i, self.path[i + 1:]
+
+    # Get at most limit messages of the current branch, the last ones or those just above before. Returns the
+    # messages, the position of the first of them among the branch's messages and the number of messages on the
+    # branch. Only the returned messages are visited, however long the branch is
+    def get_branch_window(self, limit: Optional[int] = None, before: Optional[Node] = None) -> Tuple[List[Node], int, int]:
+        total = len(self.path) - 1
+        end = total if before is None else self.branch_position(before) - 1
+        start = 0 if limit is None else max(0, end - limit)
+        return self.path[start + 1:end + 1], start, total
+
+    # Get the leaf to move to when switching to node: where the user last was below it, otherwise the newest messages
     def get_leaf_node(self, node):
+        if node.active_leaf is not None:
+            return node.active_leaf
         while node.children:
-            node = node.children[0]
+            node = node.children[-1]
         return node
 
 # Conversation class encapsulates the entire conversation structure
@@ -91,48 +471,238 @@ class Conversation:
         self.metadata: Dict[str, any] = {}  # For storing additional information
         self.latest_message_timestamp: Optional[datetime] = None
         self.version = CONVERSATION_VERSION  # Store the current version when created
+        self.journal_seq = 0  # Sequence number of the last journal event included in this state
+        self._init_runtime_state()
+
+    # Attributes that only exist at runtime, they are never pickled and are recreated on load
+    _RUNTIME_ATTRIBUTES = ('_lock', '_save_lock', '_pending_events', '_journal_entries', '_legacy_snapshot')
+
+    def _init_runtime_state(self):
+        self._lock = ReadWriteLock()
+        self._save_lock = threading.Lock()
+        self._pending_events: List[dict] = []  # Journal events not yet written to disk
+        self._journal_entries = 0  # Entries in the on disk journal since the last snapshot
+        self._legacy_snapshot = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attribute in self._RUNTIME_ATTRIBUTES:
+            state.pop(attribute, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_runtime_state()
+        if 'journal_seq' not in state:
+            # Saved before journaling existed
+            self.journal_seq = 0
+            self._legacy_snapshot = True
+
+    # Hold the conversation's read lock, use when several reads must see the same state
+    def read_locked(self):
+        return self._lock.read_locked()
+
+    # Hold the conversation's write lock, use for any mutation of the tree or metadata
+    def write_locked(self):
+        return self._lock.write_locked()
+
+    # Queue a journal event describing a change, must be called while holding the write lock
+    def _record_event(self, op: str, **fields):
+        self.journal_seq += 1
+        self._pending_events.append({'seq': self.journal_seq, 'op': op, **fields})
 
     # Add a new message to the conversation
     def add_message(self, content: str, sender: str, model_name: Optional[str] = None, internal_monologue: Optional[str] = None) -> Node:
-        new_node = self.tree.add_node(content, sender, model_name, internal_monologue)
-        self.latest_message_timestamp = new_node.timestamp
-        return new_node
+        with self.write_locked():
+            new_node = self.tree.add_node(content, sender, model_name, internal_monologue)
+            self.latest_message_timestamp = new_node.timestamp
+            self._record_event('add', node=_node_record(new_node))
+            return new_node
 
     # Edit an existing message in the conversation
     def edit_message(self, node_id: str, new_content: str) -> Optional[Node]:
-        return self.tree.edit_node(node_id, new_content)
+        with self.write_locked():
+            new_node = self.tree.edit_node(node_id, new_content)
+            if new_node:
+                self._record_event('edit', source=node_id, node=_node_record(new_node))
+            return new_node
 
     # Get the current branch of the conversation (path from root to current node)
     def get_current_branch(self) -> List[Node]:
-        return self.tree.get_current_branch()
+        with self.read_locked():
+            return self.tree.get_current_branch()
 
     # Get the siblings of a specific message in the conversation from its ID
     def get_siblings(self, node_id: str) -> List[Node]:
-        return self.tree.get_siblings(node_id)
+        with self.read_locked():
+            return self.tree.get_siblings(node_id)
 
     # Find a specific message in the conversation from its ID
     def find_node(self, node_id: str) -> Optional[Node]:
-        node = self.tree.find_node(node_id)
-        return node if node != self.tree.root else None
+        with self.read_locked():
+            node = self.tree.find_node(node_id)
+            return node if node != self.tree.root else None
 
     # Navigate to a specific message in the conversation
     def navigate_to(self, node_id: str):
-        node = self.tree.find_node(node_id)
-        if node:
-            self.tree.current_node = node
+        with self.write_locked():
+            node = self.tree.find_node(node_id)
+            if node:
+                self.tree.set_current(node)
+                self._record_event('move', node_id=node.id)
+
+    # Switch to the neighbouring sibling of a message and move to where the user last was below it.
+    # Returns the sibling switched to, the branch below it is then get_current_branch_from(sibling)
+    def switch_branch(self, node_id: str, direction: str) -> Optional[Node]:
+        with self.write_locked():
+            node = self.tree.find_node(node_id)
+            if node is None or node is self.tree.root or direction not in ('left', 'right'):
+                return None
+            new_node = self.tree.get_sibling(node, -1 if direction == 'left' else 1)
+            if new_node is None:
+                return None
+
+            self.tree.switch_to_sibling(node, new_node)
+            self._record_event('move', node_id=self.tree.current_node.id)
+            return new_node
+
+    # Get the part of the current branch from a message down to the current message
+    def get_current_branch_from(self, node: Node) -> List[Node]:
+        with self.read_locked():
+            return self.tree.get_current_branch_from(node)
+
+    # Get what changed on the current branch since the client showed the branch ending at known_leaf_id, as
+    # (messages to keep, messages to append). None if the message isn't in this conversation
+    def get_branch_delta(self, known_leaf_id: str) -> Optional[Tuple[int, List[Node]]]:
+        with self.read_locked():
+            node = self.tree.find_node(known_leaf_id)
+            if node is None:
+                return None
+            return self.tree.get_branch_delta(node)
 
-    # Save the conversation to a file
+    # Get a window of at most limit messages of the current branch, the last ones or those just above the message
+    # before_id, as (messages, position of the first, messages on the branch). None if before_id isn't on the branch
+    def get_branch_window(self, limit: Optional[int] = None, before_id: Optional[str] = None) -> Optional[Tuple[List[Node], int, int]]:
+        with self.read_locked():
+            before = None
+            if before_id is not None:
+                before = self.tree.find_node(before_id)
+                if before is None or before is self.tree.root or self.tree.branch_position(before) is None:
+                    return None
+            return self.tree.get_branch_window(limit, before)
+
+    # Changes whenever the conversation changes, every change is a journal event
+    @property
+    def revision(self) -> int:
+        return self.journal_seq
+
+    # Get a message's position among its siblings and the number of siblings
+    def get_sibling_position(self, node: Node) -> Tuple[int, int]:
+        with self.read_locked():
+            return self.tree.get_sibling_position(node)
+
+    # Save the conversation to a file as a full snapshot, replacing its journal
     def save(self, filename: str):
         self.version = CONVERSATION_VERSION
-        with open(filename, 'wb') as f:
-            pickle.dump(self, f)
+        self.write_snapshot(filename)
+
+    # Write a full snapshot without touching the version, replacing the journal
+    def write_snapshot(self, filename: str):
+        # The state is captured under the read lock so readers are never blocked, the disk write then only holds the
+        # save lock, which keeps concurrent saves and journal appends from interleaving
+        with self._save_lock:
+            with self.read_locked():
+                data = pickle.dumps(self)
+                saved_seq = self.journal_seq
+                # Everything queued so far is part of the snapshot
+                self._pending_events = [event for event in self._pending_events if event['seq'] > saved_seq]
+            _write_atomic(filename, encode_snapshot(data))
+            # The snapshot supersedes the journal, if removing it fails its entries are skipped on load by sequence number
+            journal_filename = _journal_filename(filename)
+            try:
+                if os.path.exists(journal_filename):
+                    os.remove(journal_filename)
+            except OSError as e:
+                logging.warning(f"Could not remove compacted journal {journal_filename}: {str(e)}")
+            self._journal_entries = 0
+            self._legacy_snapshot = False
+
+    # Append changes made since the last save to the conversation's journal, a few hundred bytes per turn instead of the
+    # whole tree. Returns False when a full snapshot is needed instead (no snapshot yet, or the journal is due for compaction)
+    def append_to_journal(self, filename: str) -> bool:
+        with self._save_lock:
+            if not os.path.exists(filename) or self._legacy_snapshot:
+                return False
+            with self.read_locked():
+                if self._journal_entries + len(self._pending_events) > JOURNAL_COMPACTION_THRESHOLD:
+                    return False
+                events = list(self._pending_events)
+            if events:
+                data = b''.join(json.dumps(event, ensure_ascii=False).encode('utf-8') + b'\n' for event in events)
+                try:
+                    with open(_journal_filename(filename), 'ab') as f:
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+                except OSError:
+                    # The events stay pending, part of them may have been written torn, so the next save writes a
+                    # full snapshot rather than appending after it
+                    self._journal_entries = JOURNAL_COMPACTION_THRESHOLD + 1
+                    raise
+                self._journal_entries += len(events)
+                written_seq = events[-1]['seq']
+                with self.read_locked():
+                    # Only once they are on disk, events recorded during the write stay pending
+                    self._pending_events = [event for event in self._pending_events if event['seq'] > written_seq]
+            return True
+
+    # Apply the journal written after the snapshot this conversation was loaded from
+    def _replay_journal(self, journal_filename: str):
+        if not os.path.exists(journal_filename):
+            return
+        with open(journal_filename, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("incomplete entry")
+                    event = json.loads(line)
+                except ValueError:
+                    # A write torn by a crash, anything after it is dropped and the next save writes a fresh snapshot
+                    logging.warning(f"Discarding torn journal entry in {journal_filename}")
+                    self._journal_entries = JOURNAL_COMPACTION_THRESHOLD + 1
+                    break
+                self._journal_entries += 1
+                # Entries already in the snapshot are left over from an interrupted compaction
+                if event['seq'] <= self.journal_seq:
+                    continue
+                self._apply_event(event)
+                self.journal_seq = event['seq']
 
-    # Load a conversation from a file
+    def _apply_event(self, event: dict):
+        op = event['op']
+        if op in ('add', 'edit'):
+            record = event['node']
+            parent = self.tree.find_node(record['parent'])
+            if parent is None:
+                logging.warning(f"Skipping journal entry {event['seq']}, parent {record['parent']} not found")
+                return
+            node = Node(record['content'], record['sender'], datetime.fromisoformat(record['timestamp']), record['model_name'], record['internal_monologue'])
+            node.id = record['id']
+            self.tree.attach_node(node, parent)
+            if op == 'add':
+                self.latest_message_timestamp = node.timestamp
+        elif op == 'move':
+            node = self.tree.find_node(event['node_id'])
+            if node:
+                self.tree.set_current(node)
+        elif op == 'rename':
+            self.name = event['name']
+
+    # Load a conversation from a file, replaying any journal written since its snapshot
     @staticmethod
     def load(filename: str) -> Tuple[Optional['Conversation'], Optional[str]]:
         try:
-            with open(filename, 'rb') as f:
-                conversation = pickle.load(f)
+            conversation = read_conversation_file(filename)
             
             # Check versioning
             if not hasattr(conversation, 'version'):
@@ -143,15 +713,14 @@ class Conversation:
             current_parts = [int(p) for p in CONVERSATION_VERSION.split('.')]
             conv_parts = [int(p) for p in conversation.version.split('.')]
             
-            # Major version difference - don't load at all
+            # Major version difference - don't load at all, the file is left in place so conversation_migration.py
+            # upgrades it with the rest of the directory
             if conv_parts[0] < current_parts[0]:
-                os.remove(filename)  # Delete incompatible conversation file
-                return None, f"Deleted incompatible conversation (v{conversation.version})"
+                return None, f"Incompatible conversation (v{conversation.version}), run conversation_migration.py to upgrade it"
             
             # Minor version difference - load but warn
-            warning_message = None
-            if conv_parts[1] < current_parts[1]:
-                warning_message = f"This conversation was created with an older version (v{conversation.version}). Some features may not work as expected."
+            warning_message = get_version_warning(conversation.version)
+            if warning_message:
                 # Update to current version
                 conversation.version = CONVERSATION_VERSION
             
@@ -167,7 +736,97 @@ class Conversation:
         return self.html_content
     
     def set_name(self, new_name: str):
-        self.name = new_name
+        with self.write_locked():
+            self.name = new_name
+            self._record_event('rename', name=new_name)
+
+# Warning shown for conversations created with an older minor version, None if the version is current
+def get_version_warning(version: str) -> Optional[str]:
+    current_parts = [int(p) for p in CONVERSATION_VERSION.split('.')]
+    conv_parts = [int(p) for p in version.split('.')]
+    if conv_parts[1] < current_parts[1]:
+        return f"This conversation was created with an older version (v{version}). Some features may not work as expected."
+    return None
+
+# Read a conversation snapshot and replay its journal, without any version handling. Archived conversations are read
+# from their pack file
+def read_conversation_file(filename: str) -> Conversation:
+    if filename.endswith(ARCHIVE_EXTENSION):
+        # Imported here, the archive module builds on this one
+        from conversation_archive import read_pack
+        return read_pack(filename)
+    with open(filename, 'rb') as f:
+        conversation = pickle.loads(decode_snapshot(f.read()))
+    conversation._replay_journal(_journal_filename(filename))
+    return conversation
+
+# Choose the codec and level used for new snapshots, existing files keep their codec until rewritten or recompressed
+def set_storage_compression(codec: str, level: Optional[int] = None):
+    global STORAGE_CODEC, STORAGE_COMPRESSION_LEVEL
+    if codec not in SNAPSHOT_CODECS:
+        raise ValueError(f"Unknown codec: {codec}, expected one of {', '.join(SNAPSHOT_CODECS)}")
+    STORAGE_CODEC = codec
+    if level is not None:
+        STORAGE_COMPRESSION_LEVEL = level
+
+# Compress pickled snapshot data and prefix it with its codec marker
+def encode_snapshot(data: bytes, codec: Optional[str] = None, level: Optional[int] = None) -> bytes:
+    codec = codec or STORAGE_CODEC
+    level = STORAGE_COMPRESSION_LEVEL if level is None else level
+    if codec == 'zlib':
+        data = zlib.compress(data, level)
+    elif codec == 'lzma':
+        data = lzma.compress(data, preset=level)
+    elif codec != 'none':
+        raise ValueError(f"Unknown codec: {codec}")
+    return SNAPSHOT_MAGIC + SNAPSHOT_CODECS[codec] + data
+
+# Name of the codec a snapshot was written with, 'pickle' for files from before compression
+def snapshot_codec(data: bytes) -> str:
+    if not data.startswith(SNAPSHOT_MAGIC):
+        return 'pickle'
+    marker = data[len(SNAPSHOT_MAGIC):len(SNAPSHOT_MAGIC) + 1]
+    for codec, codec_marker in SNAPSHOT_CODECS.items():
+        if marker == codec_marker:
+            return codec
+    raise ValueError(f"Unknown snapshot codec marker: {marker!r}")
+
+# Get the pickled data back out of a snapshot file's contents
+def decode_snapshot(data: bytes) -> bytes:
+    codec = snapshot_codec(data)
+    payload = data[len(SNAPSHOT_MAGIC) + 1:]
+    if codec == 'pickle':
+        return data
+    if codec == 'zlib':
+        return zlib.decompress(payload)
+    if codec == 'lzma':
+        return lzma.decompress(payload)
+    return payload
+
+# Journal events store nodes as plain records so they can be written as a single JSON line
+def _node_record(node: Node) -> dict:
+    return {
+        'id': node.id,
+        'parent': node.parent.id,
+        'content': node.content,
+        'sender': node.sender,
+        'timestamp': node.timestamp.isoformat(),
+        'model_name': node.model_name,
+        'internal_monologue': node.internal_monologue
+    }
+
+# The journal sits next to the snapshot, e.g. <id>.pickle and <id>.journal
+def _journal_filename(snapshot_filename: str) -> str:
+    return os.path.splitext(snapshot_filename)[0] + '.journal'
+
+# Write a file so that a crash leaves either the old or the new contents, never a partial file
+def _write_atomic(filename: str, data: bytes):
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
 
 def load_all_conversations(directory: str) -> List[Tuple[Conversation, Optional[str]]]:
     conversations = []
@@ -181,16 +840,205 @@ def load_all_conversations(directory: str) -> List[Tuple[Conversation, Optional[
                 logging.error(f"Error loading conversation {f}: {str(e)}")
     return sorted(conversations, key=lambda x: x[0].latest_message_timestamp or datetime.min, reverse=True)
 
+# Ids of the conversations in a directory, whether they have a snapshot or are archived
+def list_conversation_ids(directory: str) -> List[str]:
+    ids = set()
+    for f in os.listdir(directory):
+        if f.endswith('.pickle'):
+            ids.add(f[:-7])
+        elif f.endswith(ARCHIVE_EXTENSION):
+            ids.add(f[:-len(ARCHIVE_EXTENSION)])
+    return sorted(ids)
+
+# The file holding a conversation: its snapshot, or its pack file if it is archived
+def conversation_filename(id: str, directory: str) -> str:
+    filename = os.path.join(directory, f"{id}.pickle")
+    if not os.path.exists(filename):
+        pack_filename = os.path.join(directory, f"{id}{ARCHIVE_EXTENSION}")
+        if os.path.exists(pack_filename):
+            return pack_filename
+    return filename
+
+# List the file of every conversation in a directory, sorted by conversation id
+def list_conversation_files(directory: str) -> List[str]:
+    return [conversation_filename(id, directory) for id in list_conversation_ids(directory)]
+
+# Read a chunk of conversation files in a worker process, one (filename, result, error) per file
+def _load_chunk(filenames: List[str], function: Optional[Callable[[Conversation], Any]]) -> List[Tuple[str, Any, Optional[str]]]:
+    results = []
+    for filename in filenames:
+        try:
+            conversation = read_conversation_file(filename)
+            results.append((filename, function(conversation) if function else conversation, None))
+        except Exception as e:
+            results.append((filename, None, f"{type(e).__name__}: {str(e)}"))
+    return results
+
+def _chunks(filenames: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk = []
+    for filename in filenames:
+        chunk.append(filename)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Read conversation files in a process pool, yielding (filename, result, error) for every file. result is the conversation,
+# or function(conversation) when a function is given. The function runs in the worker, so only its result is sent back,
+# which is much cheaper than sending whole conversations when only part of each is needed. It must be picklable: a module
+# level function or a functools.partial of one. error is None, or describes why the file couldn't be read or function failed.
+# With ordered set results follow the order of filenames, otherwise they are yielded as soon as their chunk is done.
+# workers=1 reads in the calling process, None uses every CPU
+def load_conversations_parallel(filenames: Iterable[str], function: Optional[Callable[[Conversation], Any]] = None,
+                                workers: Optional[int] = None, ordered: bool = False,
+                                chunk_size: int = PARALLEL_CHUNK_SIZE) -> Iterator[Tuple[str, Any, Optional[str]]]:
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(filenames, chunk_size)
+    if workers == 1:
+        for chunk in chunks:
+            yield from _load_chunk(chunk, function)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    max_pending = workers * PARALLEL_CHUNKS_PER_WORKER
+    try:
+        if ordered:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_load_chunk, chunk, function))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        else:
+            pending = set()
+            for chunk in chunks:
+                pending.add(executor.submit(_load_chunk, chunk, function))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+    finally:
+        # Also reached when the caller stops iterating early, queued chunks are dropped rather than read
+        executor.shutdown(wait=True, cancel_futures=True)
+
 # Create a new conversation with a given name
 def create_conversation(name: str = "Unnamed Conversation") -> Conversation:
     return Conversation(name)
 
-# Save a conversation to a file in the specified directory
+# Save a conversation to the specified directory, appending to its journal when possible and compacting into a full snapshot otherwise
 def save_conversation(conversation: Conversation, directory: str):
     filename = os.path.join(directory, f"{conversation.id}.pickle")
-    conversation.save(filename)
+    if not conversation.append_to_journal(filename):
+        conversation.save(filename)
 
 # Load a conversation from a file in the specified directory
 def load_conversation(id: str, directory: str) -> Tuple[Optional[Conversation], Optional[str]]:
     filename = os.path.join(directory, f"{id}.pickle")
     return Conversation.load(filename)
+
+# Rewrite every snapshot in a directory with the given codec and level, without unpickling them.
+# Returns the number of files rewritten and the total size before and after
+def recompress_conversations(directory: str, codec: Optional[str] = None, level: Optional[int] = None) -> Tuple[int, int, int]:
+    count, size_before, size_after = 0, 0, 0
+    for f in os.listdir(directory):
+        if f.endswith('.pickle'):
+            filename = os.path.join(directory, f)
+            try:
+                with open(filename, 'rb') as snapshot:
+                    data = snapshot.read()
+                recompressed = encode_snapshot(decode_snapshot(data), codec, level)
+                _write_atomic(filename, recompressed)
+            except Exception as e:
+                logging.error(f"Error recompressing {f}: {str(e)}")
+                continue
+            count += 1
+            size_before += len(data)
+            size_after += len(recompressed)
+    return count, size_before, size_after
+
+# Measure how much message content is repeated, within each conversation and across the whole directory.
+# Returns character counts: all content, content stored once per conversation (what the blob table stores), and content
+# stored once across the directory
+def content_dedup_report(directory: str) -> Dict[str, int]:
+    report = {'conversations': 0, 'nodes': 0, 'total': 0, 'per_conversation': 0, 'across_store': 0}
+    store_digests = set()
+    for f in os.listdir(directory):
+        if f.endswith('.pickle'):
+            try:
+                conversation = read_conversation_file(os.path.join(directory, f))
+            except Exception as e:
+                logging.error(f"Error reading {f}: {str(e)}")
+                continue
+            report['conversations'] += 1
+            seen = set()
+            for node in conversation.tree.nodes.values():
+                if node is conversation.tree.root:
+                    continue
+                report['nodes'] += 1
+                report['total'] += len(node.content)
+                # Hashes rather than the text itself, so memory doesn't grow with the size of the store
+                digest = hashlib.blake2b(node.content.encode('utf-8'), digest_size=16).digest()
+                if digest not in seen:
+                    seen.add(digest)
+                    report['per_conversation'] += len(node.content)
+                if digest not in store_digests:
+                    store_digests.add(digest)
+                    report['across_store'] += len(node.content)
+    return report
+
+# Latest modification time and total size of a conversation's snapshot, journal and pack file, None if it doesn't exist.
+# Used by indexes to tell whether a conversation changed since they last read it
+def get_conversation_signature(id: str, directory: str) -> Optional[Tuple[float, int]]:
+    mtime, size = None, 0
+    for filename in (os.path.join(directory, f"{id}.pickle"), os.path.join(directory, f"{id}.journal"), os.path.join(directory, f"{id}{ARCHIVE_EXTENSION}")):
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            continue
+        mtime = max(mtime or 0.0, stat.st_mtime)
+        size += stat.st_size
+    return (mtime, size) if mtime is not None else None
+
+# Copy a conversation's snapshot and journal, or its pack file, into the backups directory next to it, named with the
+# version they were saved with, e.g. backups/<id>.v0.9.0.pickle. Returns the backup path of the snapshot or pack
+def backup_conversation_files(filename: str, version: str) -> str:
+    backup_dir = os.path.join(os.path.dirname(filename), BACKUP_DIRNAME)
+    os.makedirs(backup_dir, exist_ok=True)
+    base, extension = os.path.splitext(os.path.basename(filename))
+    backup_filename = os.path.join(backup_dir, f"{base}.v{version}{extension}")
+    for source, target in ((filename, backup_filename), (_journal_filename(filename), _journal_filename(backup_filename))):
+        if os.path.exists(source):
+            shutil.copy2(source, target)
+    return backup_filename
+
+# Delete a conversation's snapshot, journal and pack file, returns False if the conversation does not exist
+def delete_conversation_files(id: str, directory: str) -> bool:
+    filename = os.path.join(directory, f"{id}.pickle")
+    pack_filename = os.path.join(directory, f"{id}{ARCHIVE_EXTENSION}")
+    if not os.path.exists(filename) and not os.path.exists(pack_filename):
+        return False
+    for existing in (filename, _journal_filename(filename), pack_filename):
+        if os.path.exists(existing):
+            os.remove(existing)
+    return True
+
+# One time import of conversations saved before journaling, rewrites each as an atomically written snapshot that
+# journals can be appended to. Returns the number of conversations imported
+def import_legacy_conversations(directory: str) -> int:
+    imported = 0
+    for f in os.listdir(directory):
+        if f.endswith('.pickle'):
+            filename = os.path.join(directory, f)
+            conversation, warning = Conversation.load(filename)
+            if conversation and conversation._legacy_snapshot:
+                conversation.save(filename)
+                imported += 1
+            elif not conversation:
+                logging.error(f"Could not import {f}: {warning}")
+    return imported
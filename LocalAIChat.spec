@@ -5,7 +5,7 @@ a = Analysis(
     ['D:\\ComputerScience\\LocalAIChat\\local-ai-chat-app.py'],
     pathex=[],
     binaries=[],
-    datas=[('D:\\ComputerScience\\LocalAIChat\\system-prompt.txt', '.'), ('D:\\ComputerScience\\LocalAIChat\\chat-interface.html', '.'), ('D:\\ComputerScience\\LocalAIChat\\conversation.py', '.'), ('D:\\ComputerScience\\LocalAIChat\\icon', 'icon')],
+    datas=[('D:\\ComputerScience\\LocalAIChat\\system-prompt.txt', '.'), ('D:\\ComputerScience\\LocalAIChat\\chat-interface.html', '.'), ('D:\\ComputerScience\\LocalAIChat\\static', 'static'), ('D:\\ComputerScience\\LocalAIChat\\conversation.py', '.'), ('D:\\ComputerScience\\LocalAIChat\\icon', 'icon')],
     hiddenimports=[],
     hookspath=['.'],
     hooksconfig={},
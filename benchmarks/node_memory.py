@@ -0,0 +1,68 @@
+"""
+Node Memory Benchmark - Compares the memory used by 10,000 compact Nodes with the original dict based node.
+
+Both variants share the same message content strings, so the difference shown is the per-node overhead:
+instance dicts, uuid strings, datetime objects and repeated sender/model name strings.
+
+Usage:
+    python benchmarks/node_memory.py [node_count]
+"""
+
+import os
+import sys
+import uuid
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conversation import Node
+
+# The node as it was before it was compacted
+class LegacyNode:
+    def __init__(self, content, sender, timestamp, model_name=None, internal_monologue=None):
+        self.id = str(uuid.uuid4())
+        self.content = content
+        self.sender = sender
+        self.timestamp = timestamp
+        self.children = []
+        self.parent = None
+        self.model_name = model_name
+        self.internal_monologue = internal_monologue
+
+def build_chain(node_class, contents, start):
+    nodes = []
+    parent = None
+    for i, content in enumerate(contents):
+        # Sender and model names arrive as fresh strings, as they do from requests and journal replay
+        sender = ("Human" if i % 2 == 0 else "AI").encode().decode()
+        model_name = None if i % 2 == 0 else "llama-3-8b-instruct.Q4_K_M.gguf".encode().decode()
+        node = node_class(content, sender, start + timedelta(seconds=i), model_name)
+        if parent is not None:
+            node.parent = parent
+            parent.children.append(node)
+        nodes.append(node)
+        parent = node
+    return nodes
+
+def measure(node_class, contents, start):
+    tracemalloc.start()
+    nodes = build_chain(node_class, contents, start)
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used, nodes
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    contents = [f"Message {i} " + "lorem ipsum " * 20 for i in range(count)]
+    start = datetime.now()
+
+    legacy_bytes, _ = measure(LegacyNode, contents, start)
+    compact_bytes, _ = measure(Node, contents, start)
+
+    print(f"Nodes:         {count}")
+    print(f"Legacy nodes:  {legacy_bytes / 1024:10.1f} KiB ({legacy_bytes / count:.0f} bytes per node)")
+    print(f"Compact nodes: {compact_bytes / 1024:10.1f} KiB ({compact_bytes / count:.0f} bytes per node)")
+    print(f"Saved:         {(legacy_bytes - compact_bytes) / 1024:10.1f} KiB per {count} nodes ({1 - compact_bytes / legacy_bytes:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Parallel Load Benchmark - Times reading a directory of conversations with load_conversations_parallel at
+increasing worker counts.
+
+A store of conversation files is generated in a temporary directory, then read twice per worker count: once
+returning whole conversations to the calling process, and once with a function that runs in the workers and only
+returns each conversation's name and message count, as the search index and editor listing do.
+
+Usage:
+    python benchmarks/parallel_load.py [conversation_count] [messages_per_conversation]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conversation import Conversation, list_conversation_files, load_conversations_parallel
+
+def build_store(directory, count, messages):
+    for i in range(count):
+        conversation = Conversation(f"Conversation {i}")
+        for j in range(messages):
+            sender = "Human" if j % 2 == 0 else "AI"
+            conversation.add_message(f"Message {j} of conversation {i} " + "lorem ipsum dolor sit amet " * 15, sender)
+        conversation.save(os.path.join(directory, f"{conversation.id}.pickle"))
+
+def summary(conversation):
+    return conversation.name, len(conversation.tree.nodes) - 1
+
+def timed(filenames, function, workers):
+    start = time.perf_counter()
+    errors = sum(1 for _, _, error in load_conversations_parallel(filenames, function, workers) if error)
+    return time.perf_counter() - start, errors
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    directory = tempfile.mkdtemp(prefix="conversations-")
+    try:
+        print(f"Writing {count} conversations of {messages} messages to {directory}")
+        build_store(directory, count, messages)
+        filenames = list_conversation_files(directory)
+
+        cpus = os.cpu_count() or 1
+        worker_counts = sorted({1, 2, 4, 8, 16, cpus} & set(range(1, cpus + 1)))
+        print(f"CPUs: {cpus}")
+        print(f"{'Workers':>8} {'Objects':>10} {'Summaries':>10} {'Speedup':>8}")
+        baseline = None
+        for workers in worker_counts:
+            objects, errors = timed(filenames, None, workers)
+            summaries, _ = timed(filenames, summary, workers)
+            baseline = baseline or summaries
+            print(f"{workers:>8} {objects:>9.2f}s {summaries:>9.2f}s {baseline / summaries:>7.1f}x" + (f"  {errors} errors" if errors else ""))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
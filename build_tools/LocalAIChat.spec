@@ -52,6 +52,7 @@ except Exception as e:
 additional_datas = [
     (os.path.join(root_dir, 'system-prompt.txt'), '.'),
     (os.path.join(root_dir, 'chat-interface.html'), '.'),
+    (os.path.join(root_dir, 'static'), 'static'),
     (os.path.join(root_dir, 'conversation.py'), '.'),
 ]
 
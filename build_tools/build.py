@@ -30,7 +30,10 @@ def ensure_dependencies():
         "pyinstaller",
         "flask",
         "llama-cpp-python",
-        "dataclasses"
+        "dataclasses",
+        "brotli",
+        "markdown-it-py",
+        "pygments"
     ]
     
     for package in required_packages:
@@ -137,6 +140,12 @@ def copy_resources():
     
     print("Resource files copied successfully!")
 
+def build_static_assets():
+    """Build the web interface's hashed and precompressed assets into static/build"""
+    print("Building web interface assets...")
+    subprocess.check_call([sys.executable, get_path("static_assets.py")])
+    print("Web interface assets built successfully!")
+
 def build_executable():
     """Build the executable using PyInstaller"""
     print("Building executable with PyInstaller...")
@@ -172,6 +181,7 @@ def build_executable():
             f"--additional-hooks-dir={os.path.join(root_dir, 'build_tools')}",  # Look for hook-llama in the build_tools directory
             f"--add-data={os.path.join(root_dir, 'system-prompt.txt')}{os.pathsep}.",
             f"--add-data={os.path.join(root_dir, 'chat-interface.html')}{os.pathsep}.",
+            f"--add-data={os.path.join(root_dir, 'static')}{os.pathsep}static",
             f"--add-data={os.path.join(root_dir, 'conversation.py')}{os.pathsep}.",
         ]
         
@@ -270,6 +280,7 @@ def main():
         ensure_dependencies()
     
     create_build_directories()
+    build_static_assets()
     build_executable()
     create_user_data_directories()  # Create user data directories AFTER PyInstaller build
     copy_resources()
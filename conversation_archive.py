@@ -0,0 +1,345 @@
+"""
+Conversation Archive - Pack files for conversations that are no longer in use.
+
+A pack holds the same conversation as a snapshot, laid out so it can be read in place through mmap:
+
+- Header: magic, format version, node count, the current node and the offsets of the regions below
+- Conversation attributes other than the tree (id, name, version, metadata, ...) as a small pickle
+- Node table: one fixed size record per node in pre-order, with its parent, position among its siblings, number of
+  children, timestamp, sender, model name and where its content and internal monologue are in the content region
+- Content region: message contents and internal monologues as UTF-8, each distinct text stored once
+
+Opening an archived conversation to show it reads the header and one record and text per message on the current
+branch, however large the conversation is. The whole tree is only read when the conversation is restored, which
+turns it back into a snapshot so it can be changed again.
+
+Usage:
+python conversation_archive.py archive <conversations dir> --idle-days N [--dry-run]
+python conversation_archive.py restore <conversations dir> [ID ...]
+
+"""
+
+import os
+import sys
+import mmap
+import uuid
+import time
+import pickle
+import struct
+import logging
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+from conversation import Conversation, Node, Tree, ARCHIVE_EXTENSION, read_conversation_file, conversation_filename, get_conversation_signature
+
+PACK_MAGIC = b'LACP'
+PACK_FORMAT_VERSION = 1
+
+# magic, format version, flags, node count, current node, attributes offset and length, node table offset, content offset
+PACK_HEADER = struct.Struct('<4sHHIIQQQQ')
+# id (uuid bytes), parent, sibling index, child count, active leaf, created, sender, model name,
+# content offset and length, internal monologue offset and length
+NODE_RECORD = struct.Struct('<16siIIidHHQIQI')
+
+NO_NODE = -1
+NO_MODEL = 0xFFFF
+NO_MONOLOGUE = 0xFFFFFFFF
+
+# Write a conversation as a pack file, written to a temporary file first so a crash never leaves a partial pack
+def write_pack(conversation: Conversation, filename: str):
+    with conversation.read_locked():
+        tree = conversation.tree
+        order: List[Node] = []
+        stack = [tree.root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(reversed(node.children))
+        index_of = {id(node): i for i, node in enumerate(order)}
+
+        senders: Dict[str, int] = {}
+        model_names: Dict[str, int] = {}
+        string_ids: Dict[int, str] = {}
+        content = bytearray()
+        text_offsets: Dict[str, Tuple[int, int]] = {}
+
+        def text(value: str) -> Tuple[int, int]:
+            if value not in text_offsets:
+                data = value.encode('utf-8')
+                text_offsets[value] = (len(content), len(data))
+                content.extend(data)
+            return text_offsets[value]
+
+        table = bytearray()
+        for i, node in enumerate(order):
+            if isinstance(node._id, int):
+                node_id = node._id.to_bytes(16, 'big')
+            else:
+                # Ids that aren't uuids are kept with the attributes
+                node_id = bytes(16)
+                string_ids[i] = node._id
+            sender = senders.setdefault(node.sender, len(senders))
+            model = NO_MODEL if node.model_name is None else model_names.setdefault(node.model_name, len(model_names))
+            content_offset, content_length = text(node.content)
+            if node.internal_monologue is None:
+                monologue_offset, monologue_length = 0, NO_MONOLOGUE
+            else:
+                monologue_offset, monologue_length = text(node.internal_monologue)
+            table += NODE_RECORD.pack(
+                node_id,
+                index_of[id(node.parent)] if node.parent else NO_NODE,
+                node.sibling_index,
+                len(node.children),
+                index_of.get(id(node.active_leaf), NO_NODE),
+                node._created,
+                sender,
+                model,
+                content_offset, content_length,
+                monologue_offset, monologue_length
+            )
+
+        attributes = {key: value for key, value in conversation.__getstate__().items() if key != 'tree'}
+        attributes['_pack'] = {'senders': list(senders), 'model_names': list(model_names), 'string_ids': string_ids}
+        attributes_data = pickle.dumps(attributes)
+        current = index_of.get(id(tree.current_node), 0)
+
+    attributes_offset = PACK_HEADER.size
+    table_offset = attributes_offset + len(attributes_data)
+    content_offset = table_offset + len(table)
+    header = PACK_HEADER.pack(PACK_MAGIC, PACK_FORMAT_VERSION, 0, len(order), current,
+                              attributes_offset, len(attributes_data), table_offset, content_offset)
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        for part in (header, attributes_data, table, content):
+            f.write(part)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+# An open pack file. The conversation's attributes are available straight away, nodes are only read when asked for
+class ConversationPack:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, format_version, _, self.node_count, self.current_index,
+             attributes_offset, attributes_length, self._table_offset, self._content_offset) = PACK_HEADER.unpack_from(self._map, 0)
+            if magic != PACK_MAGIC:
+                raise ValueError(f"{filename} is not a conversation pack")
+            if format_version > PACK_FORMAT_VERSION:
+                raise ValueError(f"{filename} was written by a newer version (pack format {format_version})")
+            self.attributes = pickle.loads(self._map[attributes_offset:attributes_offset + attributes_length])
+        except Exception:
+            self.close()
+            raise
+        pack = self.attributes['_pack']
+        self._senders, self._model_names, self._string_ids = pack['senders'], pack['model_names'], pack['string_ids']
+        self.id = self.attributes['id']
+        self.name = self.attributes['name']
+        self.version = self.attributes.get('version', "0.0.0")
+        self.latest_message_timestamp = self.attributes.get('latest_message_timestamp')
+        self.metadata = self.attributes.get('metadata', {})
+        # The conversation's revision when it was archived, restoring it keeps the same revision
+        self.revision = self.attributes.get('journal_seq', 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _record(self, index: int) -> tuple:
+        return NODE_RECORD.unpack_from(self._map, self._table_offset + index * NODE_RECORD.size)
+
+    def _text(self, offset: int, length: int) -> str:
+        start = self._content_offset + offset
+        return str(self._map[start:start + length], 'utf-8')
+
+    def _node(self, index: int, record: tuple) -> Node:
+        node_id, _, sibling_index, _, _, created, sender, model, content_offset, content_length, monologue_offset, monologue_length = record
+        node = Node.restore(
+            self._string_ids.get(index, int.from_bytes(node_id, 'big')),
+            self._text(content_offset, content_length),
+            self._senders[sender],
+            created,
+            self._model_names[model] if model != NO_MODEL else None,
+            self._text(monologue_offset, monologue_length) if monologue_length != NO_MONOLOGUE else None
+        )
+        node.sibling_index = sibling_index
+        return node
+
+    def _record_id(self, index: int, record: tuple) -> str:
+        return self._string_ids[index] if index in self._string_ids else str(uuid.UUID(bytes=record[0]))
+
+    # The messages on the current branch from the first message down, each with its number of siblings. Only their
+    # records and texts are read. Nodes link to their parent on the branch, children are not loaded
+    def get_current_branch(self) -> List[Tuple[Node, int]]:
+        return self.get_branch_window()[0]
+
+    # At most limit messages of the current branch, the last ones or those just above the message before_id, as
+    # (messages with their number of siblings, position of the first, messages on the branch), like
+    # Conversation.get_branch_window. The branch's records are walked, only the returned messages' texts are read.
+    # None if before_id isn't on the branch
+    def get_branch_window(self, limit: Optional[int] = None, before_id: Optional[str] = None) -> Optional[Tuple[List[Tuple[Node, int]], int, int]]:
+        indexes, records = [], []
+        index = self.current_index
+        while index != NO_NODE:
+            record = self._record(index)
+            indexes.append(index)
+            records.append(record)
+            index = record[1]
+        # Walked up from the current node, the last entry is the root
+        indexes.reverse()
+        records.reverse()
+        total = len(records) - 1
+        end = total
+        if before_id is not None:
+            end = next((i - 1 for i in range(1, len(records)) if self._record_id(indexes[i], records[i]) == before_id), None)
+            if end is None:
+                return None
+        start = 0 if limit is None else max(0, end - limit)
+        window: List[Tuple[Node, int]] = []
+        parent = None
+        for i in range(start + 1, end + 1):
+            node = self._node(indexes[i], records[i])
+            node.parent = parent
+            # A node's siblings are its parent's children
+            window.append((node, records[i - 1][3]))
+            parent = node
+        return window, start, total
+
+    # Read every node and build the full conversation
+    def load(self) -> Conversation:
+        ids, parents, senders, model_names, created, internal_monologues = [], [], [], [], [], []
+        blobs, blob_offsets, content_refs, active_leaves = [], [0], [], []
+        blob_index: Dict[Tuple[int, int], int] = {}
+        for index in range(self.node_count):
+            node_id, parent, _, _, active_leaf, node_created, sender, model, content_offset, content_length, monologue_offset, monologue_length = self._record(index)
+            ids.append(self._string_ids.get(index, int.from_bytes(node_id, 'big')))
+            parents.append(parent)
+            senders.append(self._senders[sender])
+            model_names.append(self._model_names[model] if model != NO_MODEL else None)
+            created.append(node_created)
+            internal_monologues.append(self._text(monologue_offset, monologue_length) if monologue_length != NO_MONOLOGUE else None)
+            # Contents stored once in the pack are shared by the loaded nodes as well
+            ref = blob_index.get((content_offset, content_length))
+            if ref is None:
+                ref = blob_index[(content_offset, content_length)] = len(blobs)
+                blobs.append(self._text(content_offset, content_length))
+                blob_offsets.append(blob_offsets[-1] + len(blobs[-1]))
+            content_refs.append(ref)
+            active_leaves.append(active_leaf)
+        tree = Tree.__new__(Tree)
+        tree.__setstate__({
+            'ids': ids,
+            'parents': parents,
+            'senders': senders,
+            'model_names': model_names,
+            'created': created,
+            'internal_monologues': internal_monologues,
+            'blobs': ''.join(blobs),
+            'blob_offsets': blob_offsets,
+            'content_refs': content_refs,
+            'current': self.current_index,
+            'active_leaves': active_leaves
+        })
+        attributes = {key: value for key, value in self.attributes.items() if key != '_pack'}
+        conversation = Conversation.__new__(Conversation)
+        conversation.__setstate__({**attributes, 'tree': tree})
+        return conversation
+
+# Read a whole conversation from a pack file
+def read_pack(filename: str) -> Conversation:
+    with ConversationPack(filename) as pack:
+        return pack.load()
+
+def _pack_filename(snapshot_filename: str) -> str:
+    return os.path.splitext(snapshot_filename)[0] + ARCHIVE_EXTENSION
+
+# Move a conversation from its snapshot and journal into a pack file. The pack is written before the snapshot is
+# removed, so the conversation is never missing. Returns the pack's filename
+def archive_conversation(filename: str) -> str:
+    conversation = read_conversation_file(filename)
+    pack_filename = _pack_filename(filename)
+    write_pack(conversation, pack_filename)
+    for old_filename in (filename, os.path.splitext(filename)[0] + '.journal'):
+        if os.path.exists(old_filename):
+            os.remove(old_filename)
+    return pack_filename
+
+# Turn an archived conversation back into a snapshot so it can be changed, the pack is removed once the snapshot is written
+def restore_archived_conversation(pack_filename: str) -> Conversation:
+    conversation = read_pack(pack_filename)
+    conversation.write_snapshot(os.path.splitext(pack_filename)[0] + '.pickle')
+    os.remove(pack_filename)
+    return conversation
+
+# Archive every conversation in a directory whose files haven't changed in idle_days days.
+# Returns the number of conversations archived and the total size of their files before and after
+def archive_idle_conversations(directory: str, idle_days: float, dry_run: bool = False) -> Tuple[int, int, int]:
+    cutoff = time.time() - idle_days * 86400
+    count, size_before, size_after = 0, 0, 0
+    for f in sorted(os.listdir(directory)):
+        if not f.endswith('.pickle'):
+            continue
+        signature = get_conversation_signature(f[:-7], directory)
+        if signature is None or signature[0] > cutoff:
+            continue
+        filename = os.path.join(directory, f)
+        count += 1
+        size_before += signature[1]
+        if dry_run:
+            continue
+        try:
+            size_after += os.path.getsize(archive_conversation(filename))
+        except Exception as e:
+            logging.error(f"Error archiving {f}: {str(e)}")
+            count -= 1
+            size_before -= signature[1]
+    return count, size_before, size_after
+
+def main():
+    parser = argparse.ArgumentParser(description="Move idle conversations into pack files, or restore them")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = subparsers.add_parser("archive", help="Archive conversations that haven't changed in a number of days")
+    archive_parser.add_argument("directory", help="Conversations directory")
+    archive_parser.add_argument("--idle-days", type=float, required=True, help="Archive conversations whose files are older than this")
+    archive_parser.add_argument("--dry-run", action="store_true", help="Report what would be archived without changing anything")
+
+    restore_parser = subparsers.add_parser("restore", help="Turn archived conversations back into snapshots")
+    restore_parser.add_argument("directory", help="Conversations directory")
+    restore_parser.add_argument("ids", nargs="*", help="Conversations to restore, all archived conversations if none are given")
+
+    args = parser.parse_args()
+
+    if args.command == "archive":
+        count, size_before, size_after = archive_idle_conversations(args.directory, args.idle_days, args.dry_run)
+        if args.dry_run:
+            print(f"Would archive {count} conversations ({size_before / 1024:.1f} KiB)")
+        else:
+            print(f"Archived {count} conversations: {size_before / 1024:.1f} KiB → {size_after / 1024:.1f} KiB")
+    else:
+        ids = args.ids or [f[:-len(ARCHIVE_EXTENSION)] for f in os.listdir(args.directory) if f.endswith(ARCHIVE_EXTENSION)]
+        restored = 0
+        for id in ids:
+            filename = conversation_filename(id, args.directory)
+            if not filename.endswith(ARCHIVE_EXTENSION):
+                print(f"{id} is not archived", file=sys.stderr)
+                continue
+            try:
+                restore_archived_conversation(filename)
+                restored += 1
+            except Exception as e:
+                print(f"Error restoring {id}: {str(e)}", file=sys.stderr)
+        print(f"Restored {restored} conversations")
+
+if __name__ == "__main__":
+    main()
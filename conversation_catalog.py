@@ -0,0 +1,208 @@
+"""
+Conversation Catalog - A compact SQLite index of the conversations in a directory.
+
+Listing conversations only needs each conversation's id, name, latest message timestamp and version. Reading
+those from the catalog avoids unpickling every conversation file in the directory.
+
+- Entries are updated when a conversation is saved, renamed or deleted
+- Entries for files changed outside the application are refreshed by comparing file modification times and sizes,
+  either for the whole directory or only for the conversations a ConversationWatcher reports as changed.
+  Conversations the application hasn't finished saving are skipped, their files are behind their entries
+- Listings are indexed reads with cursor pagination and sorting
+- A revision counter changes with every change to the entries, so a listing can be revalidated without reading it
+
+"""
+
+import os
+import json
+import base64
+import sqlite3
+import logging
+import threading
+from typing import Callable, Iterable, List, Optional, Dict, Tuple, Any
+
+from conversation import Conversation, ARCHIVE_EXTENSION, read_conversation_file, get_version_warning, get_conversation_signature, conversation_filename, list_conversation_ids
+from conversation_archive import ConversationPack
+
+CATALOG_FILENAME = "catalog.sqlite3"
+
+# Sort orders available for listings, each is (ORDER BY clause, keyset comparison used to continue after a cursor)
+SORT_ORDERS = {
+    'recent': ("latest_message_timestamp DESC, id DESC", "(latest_message_timestamp, id) < (?, ?)"),
+    'oldest': ("latest_message_timestamp ASC, id ASC", "(latest_message_timestamp, id) > (?, ?)"),
+    'name': ("name COLLATE NOCASE ASC, id ASC", "(name COLLATE NOCASE, id) > (?, ?)"),
+}
+
+class ConversationCatalog:
+    # is_saving tells whether a save of a conversation is still queued or being written, refreshes leave those
+    # conversations' entries alone until update records the written file
+    def __init__(self, directory: str, is_saving: Optional[Callable[[str], bool]] = None):
+        self.directory = directory
+        self.is_saving = is_saving
+        self.db_path = os.path.join(directory, CATALOG_FILENAME)
+        self._lock = threading.Lock()
+        self._refreshed = False
+        # Advanced by every change to the entries. Only kept in memory, it starts again at 0 with each catalog
+        self.revision = 0
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        # update runs on the request path with every change, WAL with relaxed syncing keeps each commit from waiting on
+        # the disk. A crash can lose the last commits, the next refresh rebuilds them from the files
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                latest_message_timestamp TEXT NOT NULL,
+                version TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS conversations_by_timestamp ON conversations (latest_message_timestamp, id);
+            CREATE INDEX IF NOT EXISTS conversations_by_name ON conversations (name COLLATE NOCASE, id);
+        """)
+        self._db.commit()
+
+    def _upsert(self, conversation: Conversation, signature: Tuple[float, int]):
+        timestamp = conversation.latest_message_timestamp.isoformat() if conversation.latest_message_timestamp else ""
+        self._db.execute(
+            "INSERT OR REPLACE INTO conversations (id, name, latest_message_timestamp, version, mtime, size) VALUES (?, ?, ?, ?, ?, ?)",
+            (conversation.id, conversation.name, timestamp, getattr(conversation, 'version', "0.0.0"), signature[0], signature[1])
+        )
+        self.revision += 1
+
+    # Record a conversation's current name and timestamp, called when it changes and again once it has been written.
+    # The entry keeps the signature of the file as it is now, an empty one before the file exists. Refreshes skip it
+    # while its save is pending, the second call then records the written file
+    def update(self, conversation: Conversation):
+        signature = get_conversation_signature(conversation.id, self.directory) or (0.0, 0)
+        with conversation.read_locked(), self._lock:
+            self._upsert(conversation, signature)
+            self._db.commit()
+
+    # Forget a deleted conversation
+    def remove(self, id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM conversations WHERE id = ?", (id,))
+            self._db.commit()
+            self.revision += 1
+
+    # Bring the catalog in line with the directory, only conversations whose files changed are read.
+    # Returns the number of entries added, updated or removed
+    def refresh(self) -> int:
+        on_disk = set(list_conversation_ids(self.directory))
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in self._db.execute("SELECT id, mtime, size FROM conversations")}
+        changes = self._refresh(on_disk | set(known), known)
+        self._refreshed = True
+        return changes
+
+    # Refresh only the given conversations, used when a ConversationWatcher reports which files changed.
+    # Returns the number of entries added, updated or removed
+    def refresh_conversations(self, ids: Iterable[str]) -> int:
+        ids = set(ids)
+        if not ids:
+            return 0
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in self._db.execute(
+                f"SELECT id, mtime, size FROM conversations WHERE id IN ({', '.join('?' * len(ids))})", list(ids))}
+        return self._refresh(ids, known)
+
+    # Re-read the conversations whose signature differs from the one in the catalog, and drop those whose files are gone.
+    # Conversations being saved are left as they are
+    def _refresh(self, ids: Iterable[str], known: Dict[str, Tuple[float, int]]) -> int:
+        changes = 0
+        removed = []
+        for id in ids:
+            if self._saving(id):
+                continue
+            signature = get_conversation_signature(id, self.directory)
+            if signature is None:
+                if id in known:
+                    removed.append(id)
+                continue
+            if known.get(id) == signature:
+                continue
+            filename = conversation_filename(id, self.directory)
+            try:
+                if filename.endswith(ARCHIVE_EXTENSION):
+                    # Only the pack's header is read, it holds everything the catalog needs
+                    with ConversationPack(filename) as conversation, self._lock:
+                        updated = self._upsert_unless_saving(conversation, signature)
+                else:
+                    conversation = read_conversation_file(filename)
+                    with self._lock:
+                        updated = self._upsert_unless_saving(conversation, signature)
+            except Exception as e:
+                logging.error(f"Error indexing conversation {id}: {str(e)}")
+                continue
+            changes += updated
+        with self._lock:
+            # The application may have started saving a conversation since it was checked
+            removed = [id for id in removed if not self._saving(id)]
+            if removed:
+                self._db.executemany("DELETE FROM conversations WHERE id = ?", [(id,) for id in removed])
+                self._db.commit()
+                self.revision += 1
+        return changes + len(removed)
+
+    def _saving(self, id: str) -> bool:
+        return self.is_saving is not None and self.is_saving(id)
+
+    # Called with the lock held, so update can't record a newer state between the check and the write
+    def _upsert_unless_saving(self, conversation: Conversation, signature: Tuple[float, int]) -> bool:
+        if self._saving(conversation.id):
+            return False
+        self._upsert(conversation, signature)
+        return True
+
+    # List conversations in the given sort order. Returns at most limit entries and a cursor for the next page,
+    # which is None when there are no more entries
+    def list(self, limit: Optional[int] = None, cursor: Optional[str] = None, sort: str = 'recent') -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"Unknown sort order: {sort}")
+        if not self._refreshed:
+            self.refresh()
+        order_by, after_cursor = SORT_ORDERS[sort]
+
+        query = "SELECT id, name, latest_message_timestamp, version FROM conversations"
+        params: list = []
+        if cursor:
+            query += f" WHERE {after_cursor}"
+            params.extend(_decode_cursor(cursor))
+        query += f" ORDER BY {order_by}"
+        if limit is not None:
+            # Fetch one extra row to know whether another page follows
+            query += " LIMIT ?"
+            params.append(limit + 1)
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = _encode_cursor(last[1] if sort == 'name' else last[2], last[0])
+
+        return [{
+            'id': id,
+            'name': name,
+            'latest_message_timestamp': timestamp or None,
+            'version_warning': get_version_warning(version)
+        } for id, name, timestamp, version in rows], next_cursor
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+# Cursors are opaque to the client, they hold the sort key and id of the last entry of the previous page
+def _encode_cursor(sort_key: str, id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_key, id]).encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor: str) -> List[str]:
+    try:
+        sort_key, id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return [sort_key, id]
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -21,7 +21,7 @@ import uuid
 
 # Try importing from the current directory first
 try:
-    from conversation import Conversation, Node, Tree, CONVERSATION_VERSION
+    from conversation import Conversation, Node, Tree, CONVERSATION_VERSION, SNAPSHOT_CODECS, read_conversation_file, import_legacy_conversations, recompress_conversations, content_dedup_report, load_conversations_parallel
     IMPORTED_FROM_APP = True
 except ImportError:
     IMPORTED_FROM_APP = False
@@ -61,6 +61,22 @@ except ImportError:
             self.latest_message_timestamp = None
             self.version = CONVERSATION_VERSION
 
+# Extract the basic information shown by view_directory, run in worker processes when loading in parallel
+def _directory_entry(conversation) -> Dict[str, Any]:
+    return {
+        'name': getattr(conversation, 'name', 'Unknown'),
+        'id': getattr(conversation, 'id', None),
+        'version': getattr(conversation, 'version', 'Unknown'),
+        'timestamp': getattr(conversation, 'latest_message_timestamp', None)
+    }
+
+def _read_directory_entry(file_path: str):
+    try:
+        with open(file_path, 'rb') as f:
+            return file_path, _directory_entry(pickle.load(f)), None
+    except Exception as e:
+        return file_path, None, str(e)
+
 class ConversationEditor:
     def __init__(self):
         self.conversation = None
@@ -71,12 +87,16 @@ class ConversationEditor:
     def load_pickle(self, file_path: str) -> bool:
         """Load a conversation pickle file"""
         try:
-            with open(file_path, 'rb') as f:
-                self.conversation = pickle.load(f)
-                self.file_path = file_path
-                self.current_node = self.conversation.tree.current_node
-                print(f"Loaded conversation: {self.conversation.name} (v{self.conversation.version})")
-                return True
+            if IMPORTED_FROM_APP:
+                # Includes any changes recorded in the conversation's journal
+                self.conversation = read_conversation_file(file_path)
+            else:
+                with open(file_path, 'rb') as f:
+                    self.conversation = pickle.load(f)
+            self.file_path = file_path
+            self.current_node = self.conversation.tree.current_node
+            print(f"Loaded conversation: {self.conversation.name} (v{self.conversation.version})")
+            return True
         except Exception as e:
             print(f"Error loading pickle file: {e}")
             return False
@@ -120,8 +140,15 @@ class ConversationEditor:
             # Create directory if it doesn't exist
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             
-            with open(file_path, 'wb') as f:
-                pickle.dump(self.conversation, f)
+            if IMPORTED_FROM_APP:
+                # Edits here bypass the journal, advancing its sequence number changes the conversation's revision so the
+                # application doesn't take the edited tree for the one a client already has
+                self.conversation.journal_seq += 1
+                # Writes a full snapshot and drops the now superseded journal
+                self.conversation.write_snapshot(file_path)
+            else:
+                with open(file_path, 'wb') as f:
+                    pickle.dump(self.conversation, f)
             
             self.file_path = file_path
             print(f"Saved conversation to {file_path}")
@@ -350,10 +377,17 @@ class ConversationEditor:
         if self.current_node and self.current_node.id == target_id:
             self.current_node = parent
             self.conversation.tree.current_node = parent
+        # Also moves the tree's current node out of the deleted branch
+        self.rebuild_node_index()
         
         print(f"Deleted node {target_id[:8]}... and its children")
         self.modified = True
     
+    def rebuild_node_index(self) -> None:
+        """Drop removed nodes from the tree's id index and current branch"""
+        if hasattr(self.conversation.tree, "rebuild_index"):
+            self.conversation.tree.rebuild_index()
+    
     def update_metadata(self, key: str, value: Any) -> None:
         """Update conversation metadata"""
         if not self.conversation:
@@ -391,6 +425,7 @@ class ConversationEditor:
             
             # Replace children with just the one in our branch
             node.children = [child for child in node.children if child == next_in_branch]
+        self.rebuild_node_index()
         
         print(f"Pruned conversation: removed {deleted_count} branches")
         print("Only the current branch remains")
@@ -430,35 +465,27 @@ class ConversationEditor:
         # Track conversations for sorting
         conversation_data = []
         
+        file_paths = [os.path.join(directory_path, file_name) for file_name in conversation_files]
+        if IMPORTED_FROM_APP:
+            # Files are read in a process pool, only the basic info of each is sent back
+            results = load_conversations_parallel(file_paths, _directory_entry)
+        else:
+            results = (_read_directory_entry(file_path) for file_path in file_paths)
+        
         # Process each file
-        for file_name in conversation_files:
-            file_path = os.path.join(directory_path, file_name)
-            try:
-                # Try to load just enough to get basic info
-                with open(file_path, 'rb') as f:
-                    conversation = pickle.load(f)
-                
-                # Extract basic information
-                name = getattr(conversation, 'name', 'Unknown')
-                id_value = getattr(conversation, 'id', file_name.replace('.pickle', ''))
-                version = getattr(conversation, 'version', 'Unknown')
-                
-                # Get timestamp
-                timestamp = getattr(conversation, 'latest_message_timestamp', None)
-                if not timestamp:
-                    # Try to get file modification time as fallback
-                    timestamp = datetime.fromtimestamp(os.path.getmtime(file_path))
-                
-                conversation_data.append({
-                    'name': name,
-                    'id': id_value,
-                    'version': version,
-                    'timestamp': timestamp,
-                    'file_name': file_name
-                })
-                
-            except Exception as e:
-                print(f"Error loading {file_name}: {e}")
+        for file_path, data, error in results:
+            file_name = os.path.basename(file_path)
+            if error:
+                print(f"Error loading {file_name}: {error}")
+                continue
+            
+            if not data['id']:
+                data['id'] = file_name.replace('.pickle', '')
+            if not data['timestamp']:
+                # Try to get file modification time as fallback
+                data['timestamp'] = datetime.fromtimestamp(os.path.getmtime(file_path))
+            data['file_name'] = file_name
+            conversation_data.append(data)
         
         # Sort by timestamp (newest first)
         conversation_data.sort(key=lambda x: x['timestamp'] if x['timestamp'] else datetime.min, reverse=True)
@@ -633,11 +660,42 @@ def main():
     
     # Special operations
     parser.add_argument("--set-version", help="Set conversation version and save")
+    parser.add_argument("--import-legacy", metavar="DIR", help="One time import of pre-journal conversation files in a directory")
+    parser.add_argument("--recompress-all", metavar="DIR", help="Rewrite every conversation file in a directory with --codec and --level, run while the application is closed")
+    parser.add_argument("--codec", help="Compression codec for --recompress-all (none, zlib, lzma)")
+    parser.add_argument("--level", type=int, help="Compression level for --recompress-all")
+    parser.add_argument("--dedup-report", metavar="DIR", help="Report how much message content is repeated in a directory of conversations")
     
     args = parser.parse_args()
     
     editor = ConversationEditor()
     
+    if (args.import_legacy or args.recompress_all or args.dedup_report) and not IMPORTED_FROM_APP:
+        print("Maintenance commands require the application's conversation module")
+        return
+    
+    if args.import_legacy:
+        imported = import_legacy_conversations(args.import_legacy)
+        print(f"Imported {imported} legacy conversation files")
+        return
+    
+    if args.recompress_all:
+        if args.codec and args.codec not in SNAPSHOT_CODECS:
+            print(f"Unknown codec: {args.codec}")
+            return
+        count, size_before, size_after = recompress_conversations(args.recompress_all, args.codec, args.level)
+        print(f"Recompressed {count} conversation files: {size_before / 1024:.1f} KiB → {size_after / 1024:.1f} KiB")
+        return
+    
+    if args.dedup_report:
+        report = content_dedup_report(args.dedup_report)
+        total = report['total'] or 1
+        print(f"Conversations: {report['conversations']}, messages: {report['nodes']}")
+        print(f"Message content:         {report['total'] / 1024:.1f} K characters")
+        print(f"Stored per conversation: {report['per_conversation'] / 1024:.1f} K characters ({total / (report['per_conversation'] or 1):.2f}x dedup)")
+        print(f"Unique across directory: {report['across_store'] / 1024:.1f} K characters ({total / (report['across_store'] or 1):.2f}x dedup)")
+        return
+    
     # Handle special operations
     if args.file and args.set_version:
         if editor.load_pickle(args.file):
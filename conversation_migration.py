@@ -0,0 +1,124 @@
+"""
+Conversation Migration - Batch upgrade of conversation files to the current CONVERSATION_VERSION.
+
+Features:
+- Upgrade functions are registered per version range with @migration and applied in order until a conversation is current
+- Every file in a conversations directory is migrated in a process pool, with progress reported as files finish,
+  snapshots and the pack files of archived conversations alike
+- Files are copied to the backups directory before they are rewritten, nothing is deleted
+- Files that are already current are only read, files without an upgrade path are left untouched and reported
+
+Run it with the application closed, so conversations are upgraded once rather than each time one is opened:
+python conversation_migration.py <conversations dir> [--workers N] [--dry-run]
+
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from conversation import Conversation, CONVERSATION_VERSION, BACKUP_DIRNAME, ARCHIVE_EXTENSION, read_conversation_file, backup_conversation_files
+from conversation_archive import write_pack
+
+# Registered upgrades as (from version, to version, function), each upgrades conversations with from <= version < to
+MIGRATIONS: List[Tuple[Tuple[int, ...], Tuple[int, ...], Callable[[Conversation], None]]] = []
+
+class MigrationError(Exception):
+    pass
+
+def _parse_version(version: str) -> Tuple[int, ...]:
+    return tuple(int(part) for part in version.split('.'))
+
+# Register an upgrade function for conversations saved with a version from from_version up to, not including, to_version.
+# The function changes the conversation in place, its version is then set to to_version
+def migration(from_version: str, to_version: str):
+    def register(function: Callable[[Conversation], None]):
+        MIGRATIONS.append((_parse_version(from_version), _parse_version(to_version), function))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return function
+    return register
+
+# Conversations from before versioning only need a version, loading them already converts their tree and nodes
+@migration("0.0.0", "1.0.0")
+def _add_version(conversation: Conversation):
+    pass
+
+# Apply registered upgrades until the conversation is at the current version. Returns the versions it went through,
+# empty if it was already current. Raises MigrationError if no upgrade covers one of its versions
+def migrate_conversation(conversation: Conversation) -> List[str]:
+    if not hasattr(conversation, 'version'):
+        conversation.version = "0.0.0"
+    target = _parse_version(CONVERSATION_VERSION)
+    steps = []
+    while _parse_version(conversation.version) < target:
+        version = _parse_version(conversation.version)
+        upgrade = next(((to_version, function) for from_version, to_version, function in MIGRATIONS if from_version <= version < to_version), None)
+        if upgrade is None:
+            raise MigrationError(f"No migration from v{conversation.version}")
+        to_version, function = upgrade
+        function(conversation)
+        steps.append(conversation.version)
+        conversation.version = '.'.join(str(part) for part in to_version)
+    return steps
+
+# Migrate one conversation file, run in a worker process. Returns (filename, status, message) where status is
+# 'current', 'migrated' or 'failed'
+def migrate_file(filename: str, dry_run: bool = False) -> Tuple[str, str, Optional[str]]:
+    try:
+        conversation = read_conversation_file(filename)
+        original_version = getattr(conversation, 'version', "0.0.0")
+        steps = migrate_conversation(conversation)
+        if not steps:
+            return filename, 'current', None
+        if not dry_run:
+            backup_conversation_files(filename, original_version)
+            if filename.endswith(ARCHIVE_EXTENSION):
+                # Archived conversations stay archived
+                write_pack(conversation, filename)
+            else:
+                # The snapshot includes any journal entries, so the journal is replaced along with it
+                conversation.write_snapshot(filename)
+        return filename, 'migrated', f"v{original_version} → v{conversation.version}"
+    except Exception as e:
+        return filename, 'failed', str(e)
+
+# Migrate every conversation in a directory in a process pool. progress is called with (done, total, result) as each
+# file finishes. Returns the number of files per status
+def migrate_store(directory: str, workers: Optional[int] = None, dry_run: bool = False,
+                  progress: Optional[Callable[[int, int, Tuple[str, str, Optional[str]]], None]] = None) -> Dict[str, int]:
+    filenames = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(('.pickle', ARCHIVE_EXTENSION))]
+    counts = {'current': 0, 'migrated': 0, 'failed': 0}
+    if not filenames:
+        return counts
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(migrate_file, filename, dry_run) for filename in filenames]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            counts[result[1]] += 1
+            if progress:
+                progress(done, len(filenames), result)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade every conversation in a directory to the current version")
+    parser.add_argument("directory", help="Conversations directory")
+    parser.add_argument("--workers", type=int, help="Number of worker processes, defaults to the number of CPUs")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be migrated without writing anything")
+    args = parser.parse_args()
+
+    def report(done: int, total: int, result: Tuple[str, str, Optional[str]]):
+        filename, status, message = result
+        if status != 'current':
+            print(f"\r{os.path.basename(filename)}: {status} {message}")
+        print(f"\rMigrating conversations: {done}/{total}", end="", file=sys.stderr)
+
+    counts = migrate_store(args.directory, args.workers, args.dry_run, report)
+    print(file=sys.stderr)
+    print(f"{'Would migrate' if args.dry_run else 'Migrated'} {counts['migrated']}, already current {counts['current']}, failed {counts['failed']}")
+    if counts['migrated'] and not args.dry_run:
+        print(f"Original files were copied to {os.path.join(args.directory, BACKUP_DIRNAME)}")
+
+if __name__ == "__main__":
+    main()
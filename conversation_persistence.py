@@ -0,0 +1,122 @@
+"""
+Conversation Persistence - Write-behind saving of conversations on a background thread.
+
+Request handlers schedule a save and return immediately, the worker writes the conversation shortly after.
+
+- Repeated saves of the same conversation within the coalescing window are merged into a single write
+- Writes go through save_conversation, so journal appends are fsynced and snapshots use temp file + fsync + rename
+- Pending writes can be flushed for one conversation, before it is read back from disk, or for all on shutdown
+
+"""
+
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+from conversation import Conversation, save_conversation
+
+logger = logging.getLogger('app')
+
+# Seconds a scheduled save waits for further changes to the same conversation before it is written
+PERSISTENCE_DELAY = 0.5
+
+class PersistenceWorker:
+    def __init__(self, directory: str, on_saved: Optional[Callable[[Conversation], None]] = None, delay: float = PERSISTENCE_DELAY):
+        self.directory = directory
+        self.on_saved = on_saved
+        self.delay = delay
+        self._condition = threading.Condition()
+        # Conversations waiting to be written, by id. Normally one object per id, but a different object for the same
+        # conversation is queued alongside rather than replacing it, its changes would otherwise never be written
+        self._pending: Dict[str, List[Conversation]] = {}
+        self._due: Dict[str, float] = {}  # When each pending conversation should be written
+        self._in_progress: Set[str] = set()  # Conversations being written right now
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="conversation-persistence", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    # Queue a conversation to be saved, a conversation that is already queued keeps its original due time
+    def schedule(self, conversation: Conversation):
+        with self._condition:
+            queued = self._pending.get(conversation.id)
+            if queued is None:
+                self._due[conversation.id] = time.monotonic() + self.delay
+                self._pending[conversation.id] = [conversation]
+            elif not any(other is conversation for other in queued):
+                logger.warning(f"Two copies of conversation {conversation.id} are being saved")
+                queued.append(conversation)
+            self._condition.notify_all()
+
+    # Write queued saves now, for one conversation or all of them, and wait until they are on disk
+    def flush(self, conversation_id: Optional[str] = None):
+        with self._condition:
+            targets = {conversation_id} if conversation_id else set(self._pending) | self._in_progress
+            # A write the worker already started must finish before the file can be relied on
+            while targets & self._in_progress:
+                self._condition.wait()
+            conversations = self._take([id for id in targets if id in self._pending])
+        self._write_all(conversations)
+
+    # Whether a save of the conversation is queued or being written, until then its file is behind the conversation in memory
+    def is_saving(self, conversation_id: str) -> bool:
+        with self._condition:
+            return conversation_id in self._pending or conversation_id in self._in_progress
+
+    # Drop any queued save of a conversation, used before deleting it so the worker can't recreate its files
+    def discard(self, conversation_id: str):
+        with self._condition:
+            self._pending.pop(conversation_id, None)
+            self._due.pop(conversation_id, None)
+            while conversation_id in self._in_progress:
+                self._condition.wait()
+
+    # Flush everything and stop the worker, used on shutdown
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+
+    def _take(self, ids: List[str]) -> List[Conversation]:
+        conversations = []
+        for id in ids:
+            self._due.pop(id, None)
+            conversations.extend(self._pending.pop(id))
+            self._in_progress.add(id)
+        return conversations
+
+    def _write_all(self, conversations: List[Conversation]):
+        try:
+            for conversation in conversations:
+                try:
+                    save_start = time.time()
+                    save_conversation(conversation, self.directory)
+                    if self.on_saved:
+                        self.on_saved(conversation)
+                    logger.info(f"Saving conversation {conversation.id} took {time.time() - save_start:.4f} seconds")
+                except Exception as e:
+                    logger.error(f"Failed to save conversation {conversation.id}: {str(e)}")
+        finally:
+            with self._condition:
+                self._in_progress.difference_update(conversation.id for conversation in conversations)
+                self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                now = time.monotonic()
+                due_ids = [id for id, due in self._due.items() if due <= now]
+                if not due_ids:
+                    self._condition.wait(timeout=min(self._due.values()) - now)
+                    continue
+                conversations = self._take(due_ids)
+            self._write_all(conversations)
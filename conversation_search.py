@@ -0,0 +1,259 @@
+"""
+Conversation Search - A full-text index over every conversation in a directory.
+
+Message content and conversation names, and optionally internal monologues, are kept in an SQLite FTS5 index,
+so searching thousands of conversations doesn't need to open any conversation files.
+
+- Messages are indexed as they are added or edited, names when conversations are renamed
+- Conversations changed outside the application are re-indexed by comparing file modification times and sizes,
+  conversations the application hasn't finished saving are skipped, their files are behind the index
+- A full rebuild can read conversations in a process pool with refresh(workers=None)
+- Results are ranked with BM25 and come with a snippet of the matching text
+
+"""
+
+import os
+import re
+import sqlite3
+import logging
+import threading
+from functools import partial
+from typing import Callable, Iterable, List, Dict, Any, Optional, Tuple
+
+from conversation import Conversation, Node, get_conversation_signature, load_conversations_parallel, conversation_filename, list_conversation_ids
+
+SEARCH_INDEX_FILENAME = "search.sqlite3"
+
+# Marks placed around matched terms in snippets, markdown bold so the UI can render them like message text
+SNIPPET_START = "**"
+SNIPPET_END = "**"
+
+class ConversationSearchIndex:
+    # is_saving tells whether a save of a conversation is still queued or being written, refreshes leave those
+    # conversations alone until the save is recorded with mark_saved
+    def __init__(self, directory: str, index_monologues: bool = False, is_saving: Optional[Callable[[str], bool]] = None):
+        self.directory = directory
+        self.index_monologues = index_monologues
+        self.is_saving = is_saving
+        self.db_path = os.path.join(directory, SEARCH_INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._refreshed = False
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        # Index writes happen on the request path, WAL with relaxed syncing keeps each one cheap
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # Entries live in a plain table indexed by conversation so they can be replaced per conversation,
+        # the FTS5 table indexes their text and is kept in step by triggers
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                rowid INTEGER PRIMARY KEY,
+                conversation_id TEXT NOT NULL,
+                node_id TEXT,
+                kind TEXT NOT NULL,
+                sender TEXT,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_by_conversation ON entries (conversation_id, kind);
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(text, content='entries', content_rowid='rowid');
+            CREATE TRIGGER IF NOT EXISTS entries_after_insert AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts(rowid, text) VALUES (new.rowid, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_after_delete AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+            END;
+        """)
+        self._db.commit()
+
+    def _insert(self, entries: List[tuple]):
+        self._db.executemany("INSERT INTO entries (conversation_id, node_id, kind, sender, text) VALUES (?, ?, ?, ?, ?)", entries)
+
+    def _replace_name(self, conversation_id: str, name: str):
+        self._db.execute("DELETE FROM entries WHERE conversation_id = ? AND kind = 'name'", (conversation_id,))
+        self._insert([(conversation_id, None, 'name', None, name)])
+        self._db.execute(
+            "INSERT INTO conversations (id, name, mtime, size) VALUES (?, ?, 0, 0) ON CONFLICT(id) DO UPDATE SET name = excluded.name",
+            (conversation_id, name)
+        )
+
+    # Index a message that was just added to a conversation, either new or as an edit of another message.
+    # Its save must be scheduled first, so a refresh can't replace the entries from the file written before it
+    def add_node(self, conversation: Conversation, node: Node):
+        if self._index_if_unknown(conversation):
+            return
+        with self._lock:
+            self._insert(_node_entries(self.index_monologues, conversation.id, node))
+            self._db.commit()
+
+    # Re-index a conversation's name after it was renamed
+    def rename(self, conversation: Conversation):
+        if self._index_if_unknown(conversation):
+            return
+        with self._lock:
+            self._replace_name(conversation.id, conversation.name)
+            self._db.commit()
+
+    # Index every message of a conversation the index has no entry for, e.g. one that existed before the index did.
+    # Indexing only the changed message or name would give it an entry, and once mark_saved records its file a refresh
+    # would take the rest of its messages as indexed. Returns False if the conversation was already indexed
+    def _index_if_unknown(self, conversation: Conversation) -> bool:
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation.id,)).fetchone():
+                return False
+        self.index_conversation(conversation)
+        return True
+
+    # Re-index every message of a conversation, used for conversations changed outside the application
+    def index_conversation(self, conversation: Conversation, signature=None):
+        self._replace_entries(conversation.id, conversation.name, _conversation_entries(self.index_monologues, conversation), signature)
+
+    def _replace_entries(self, conversation_id: str, name: str, entries: List[tuple], signature=None, unless_saving: bool = False):
+        with self._lock:
+            # Checked under the lock, add_node can't index a message between the check and the replacement
+            if unless_saving and self._saving(conversation_id):
+                return False
+            self._db.execute("DELETE FROM entries WHERE conversation_id = ?", (conversation_id,))
+            self._replace_name(conversation_id, name)
+            self._insert(entries)
+            if signature:
+                self._db.execute("UPDATE conversations SET mtime = ?, size = ? WHERE id = ?", (signature[0], signature[1], conversation_id))
+            self._db.commit()
+        return True
+
+    def _saving(self, conversation_id: str) -> bool:
+        return self.is_saving is not None and self.is_saving(conversation_id)
+
+    # Record that a conversation's file now matches the index, so a refresh won't re-index it
+    def mark_saved(self, conversation: Conversation):
+        signature = get_conversation_signature(conversation.id, self.directory)
+        if signature is None:
+            return
+        with self._lock:
+            self._db.execute("UPDATE conversations SET mtime = ?, size = ? WHERE id = ?", (signature[0], signature[1], conversation.id))
+            self._db.commit()
+
+    # Forget a deleted conversation
+    def remove(self, conversation_id: str, unless_saving: bool = False):
+        with self._lock:
+            if unless_saving and self._saving(conversation_id):
+                return False
+            self._db.execute("DELETE FROM entries WHERE conversation_id = ?", (conversation_id,))
+            self._db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            self._db.commit()
+        return True
+
+    # Bring the index in line with the directory, only conversations whose files changed are read.
+    # With workers other than 1 changed conversations are read in a process pool, None uses every CPU, which makes
+    # rebuilding the index of a large directory from scratch much faster. Returns the number of conversations indexed or removed
+    def refresh(self, workers: Optional[int] = 1) -> int:
+        on_disk = set(list_conversation_ids(self.directory))
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in self._db.execute("SELECT id, mtime, size FROM conversations")}
+        changes = self._refresh(on_disk | set(known), known, workers)
+        self._refreshed = True
+        return changes
+
+    # Re-index only the given conversations, used when a ConversationWatcher reports which files changed.
+    # Returns the number of conversations indexed or removed
+    def refresh_conversations(self, ids: Iterable[str]) -> int:
+        ids = set(ids)
+        if not ids:
+            return 0
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in self._db.execute(
+                f"SELECT id, mtime, size FROM conversations WHERE id IN ({', '.join('?' * len(ids))})", list(ids))}
+        return self._refresh(ids, known, 1)
+
+    def _refresh(self, ids: Iterable[str], known: Dict[str, Tuple[float, int]], workers: Optional[int]) -> int:
+        changed = {}
+        removed = []
+        for id in ids:
+            if self._saving(id):
+                # The entries are ahead of the file, mark_saved records the file once it is written
+                continue
+            signature = get_conversation_signature(id, self.directory)
+            if signature is None:
+                if id in known:
+                    removed.append(id)
+            elif known.get(id) != signature:
+                changed[conversation_filename(id, self.directory)] = signature
+        changes = 0
+        # Entries are built in the workers, only they are sent back rather than whole conversations
+        for filename, result, error in load_conversations_parallel(changed, partial(_indexed_conversation, self.index_monologues), workers):
+            if error:
+                logging.error(f"Error indexing conversation {os.path.splitext(os.path.basename(filename))[0]} for search: {error}")
+                continue
+            conversation_id, name, entries = result
+            # The application may have started saving the conversation while it was read
+            if self._replace_entries(conversation_id, name, entries, changed[filename], unless_saving=True):
+                changes += 1
+        for id in removed:
+            if self.remove(id, unless_saving=True):
+                changes += 1
+        return changes
+
+    # Search messages and conversation names, best matches first
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        match = _match_expression(query)
+        if not match:
+            return []
+        if not self._refreshed:
+            self.refresh()
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT entries.conversation_id, conversations.name, entries.node_id, entries.kind, entries.sender,
+                       snippet(entries_fts, 0, ?, ?, '…', 16), bm25(entries_fts)
+                FROM entries_fts
+                JOIN entries ON entries.rowid = entries_fts.rowid
+                JOIN conversations ON conversations.id = entries.conversation_id
+                WHERE entries_fts MATCH ?
+                ORDER BY bm25(entries_fts)
+                LIMIT ?
+            """, (SNIPPET_START, SNIPPET_END, match, limit)).fetchall()
+        return [{
+            'conversation_id': conversation_id,
+            'conversation_name': name,
+            'node_id': node_id,
+            'kind': kind,
+            'sender': sender,
+            'snippet': snippet,
+            # bm25 scores are negative with better matches lower, flip them so a higher rank is better
+            'rank': -score
+        } for conversation_id, name, node_id, kind, sender, snippet, score in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def _node_entries(index_monologues: bool, conversation_id: str, node: Node) -> List[tuple]:
+    entries = [(conversation_id, node.id, 'content', node.sender, node.content)]
+    if index_monologues and node.internal_monologue:
+        entries.append((conversation_id, node.id, 'monologue', node.sender, node.internal_monologue))
+    return entries
+
+def _conversation_entries(index_monologues: bool, conversation: Conversation) -> List[tuple]:
+    with conversation.read_locked():
+        entries = []
+        for node in conversation.tree.nodes.values():
+            if node is not conversation.tree.root:
+                entries.extend(_node_entries(index_monologues, conversation.id, node))
+    return entries
+
+# Build a conversation's entries, run in load_conversations_parallel's workers
+def _indexed_conversation(index_monologues: bool, conversation: Conversation) -> Tuple[str, str, List[tuple]]:
+    return conversation.id, conversation.name, _conversation_entries(index_monologues, conversation)
+
+# Turn free text into an FTS5 query matching every word, the last one as a prefix so results update while typing.
+# Words are quoted so characters with a meaning in FTS5 query syntax are searched for literally
+def _match_expression(query: str) -> str:
+    words = re.findall(r"\w+", query)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
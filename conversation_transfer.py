@@ -0,0 +1,211 @@
+"""
+Conversation Transfer - Streaming export and import of conversations as JSON lines.
+
+Features:
+- Export every conversation in a directory, or a subset by id or last activity, to a JSONL file
+- Import a JSONL export into a directory, skipping conversations that already exist unless told to overwrite
+- One conversation is held in memory at a time, so tens of thousands of conversations can be moved between hosts
+- Exports from the command line read and encode conversations in a process pool, a few chunks of files at a time
+- Files ending in .gz are compressed and decompressed on the fly
+
+Each conversation is written as a conversation line followed by one line per message, parents before their children:
+
+{"type": "conversation", "id": ..., "name": ..., "version": ..., "root": ..., "current": ..., ...}
+{"type": "node", "conversation_id": ..., "id": ..., "parent": ..., "content": ..., "sender": ..., ...}
+
+Usage:
+python conversation_transfer.py export <conversations dir> <file.jsonl> [--id ID ...] [--since 2024-01-01] [--workers N]
+python conversation_transfer.py import <conversations dir> <file.jsonl> [--overwrite]
+
+"""
+
+import os
+import sys
+import gzip
+import json
+import logging
+import argparse
+from datetime import datetime
+from functools import partial
+from typing import Iterable, Iterator, List, Optional, Set
+
+from conversation import Conversation, Node, ARCHIVE_EXTENSION, conversation_filename, list_conversation_files, load_conversations_parallel
+
+EXPORT_FORMAT_VERSION = 1
+
+# Yield the export of the conversations in a directory as JSON lines, in the order of their ids.
+# ids limits the export to those conversations, since to conversations with a message at or after that time.
+# With workers other than 1 conversations are read and encoded in a process pool, None uses every CPU
+def export_conversations(directory: str, ids: Optional[Set[str]] = None, since: Optional[datetime] = None,
+                         workers: Optional[int] = 1) -> Iterator[str]:
+    filenames = [filename for filename in list_conversation_files(directory)
+                 if ids is None or os.path.splitext(os.path.basename(filename))[0] in ids]
+    if workers == 1:
+        # Stream each conversation's lines as they are encoded rather than collecting them first
+        for filename, conversation, error in load_conversations_parallel(filenames, workers=1):
+            if error:
+                logging.error(f"Error exporting {os.path.basename(filename)}: {error}")
+            elif _exported_since(conversation, since):
+                yield from _conversation_lines(conversation)
+        return
+    for filename, lines, error in load_conversations_parallel(filenames, partial(_export_lines, since), workers, ordered=True):
+        if error:
+            logging.error(f"Error exporting {os.path.basename(filename)}: {error}")
+        elif lines:
+            yield from lines
+
+def _exported_since(conversation: Conversation, since: Optional[datetime]) -> bool:
+    return not since or (conversation.latest_message_timestamp is not None and conversation.latest_message_timestamp >= since)
+
+# Encode one conversation in a worker process, only the lines are sent back
+def _export_lines(since: Optional[datetime], conversation: Conversation) -> Optional[List[str]]:
+    return list(_conversation_lines(conversation)) if _exported_since(conversation, since) else None
+
+def _conversation_lines(conversation: Conversation) -> Iterator[str]:
+    with conversation.read_locked():
+        tree = conversation.tree
+        yield json.dumps({
+            'type': 'conversation',
+            'format': EXPORT_FORMAT_VERSION,
+            'id': conversation.id,
+            'name': conversation.name,
+            'version': getattr(conversation, 'version', "0.0.0"),
+            'latest_message_timestamp': conversation.latest_message_timestamp.isoformat() if conversation.latest_message_timestamp else None,
+            'metadata': conversation.metadata,
+            'root': tree.root.id,
+            'root_timestamp': tree.root.timestamp.isoformat(),
+            'current': tree.current_node.id,
+            'nodes': len(tree.nodes) - 1
+        }, ensure_ascii=False, default=str) + '\n'
+        # Pre-order, so a node's parent is always written before it
+        stack = list(reversed(tree.root.children))
+        while stack:
+            node = stack.pop()
+            yield json.dumps({
+                'type': 'node',
+                'conversation_id': conversation.id,
+                'id': node.id,
+                'parent': node.parent.id,
+                'content': node.content,
+                'sender': node.sender,
+                'timestamp': node.timestamp.isoformat(),
+                'model_name': node.model_name,
+                'internal_monologue': node.internal_monologue
+            }, ensure_ascii=False) + '\n'
+            stack.extend(reversed(node.children))
+
+# Import conversations from exported JSON lines into a directory, yielding each conversation once it is saved.
+# Only the conversation being read is held in memory. Conversations that already exist are skipped unless overwrite is set
+def import_conversations(lines: Iterable, directory: str, overwrite: bool = False) -> Iterator[Conversation]:
+    conversation, current_id = None, None
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {line_number} is not valid JSON: {str(e)}") from e
+
+        if record.get('type') == 'conversation':
+            if conversation:
+                yield _finish_import(conversation, current_id, directory)
+            conversation = _start_import(record, directory, overwrite)
+            current_id = record.get('current')
+        elif record.get('type') == 'node':
+            if conversation is None or record['conversation_id'] != conversation.id:
+                # Belongs to a conversation that is being skipped
+                continue
+            parent = conversation.tree.find_node(record['parent'])
+            if parent is None:
+                raise ValueError(f"Line {line_number}: parent {record['parent']} of node {record['id']} not found")
+            node = Node(record['content'], record['sender'], datetime.fromisoformat(record['timestamp']), record.get('model_name'), record.get('internal_monologue'))
+            node.id = record['id']
+            conversation.tree.attach_node(node, parent)
+        else:
+            raise ValueError(f"Line {line_number}: unknown record type {record.get('type')}")
+    if conversation:
+        yield _finish_import(conversation, current_id, directory)
+
+def _start_import(record: dict, directory: str, overwrite: bool) -> Optional[Conversation]:
+    if not overwrite and os.path.exists(conversation_filename(record['id'], directory)):
+        logging.info(f"Skipping conversation {record['id']}, it already exists")
+        return None
+    conversation = Conversation(record['name'])
+    conversation.id = record['id']
+    conversation.version = record.get('version', conversation.version)
+    conversation.metadata = record.get('metadata') or {}
+    if record.get('latest_message_timestamp'):
+        conversation.latest_message_timestamp = datetime.fromisoformat(record['latest_message_timestamp'])
+    # Keep the exported root id, messages at the top of the conversation refer to it as their parent
+    conversation.tree.root.id = record['root']
+    if record.get('root_timestamp'):
+        conversation.tree.root.timestamp = datetime.fromisoformat(record['root_timestamp'])
+    conversation.tree.rebuild_index()
+    return conversation
+
+def _finish_import(conversation: Conversation, current_id: Optional[str], directory: str) -> Conversation:
+    current = conversation.tree.find_node(current_id) if current_id else None
+    if current:
+        conversation.tree.set_current(current)
+    # The version is kept as exported, conversations are upgraded by the usual version handling
+    conversation.write_snapshot(os.path.join(directory, f"{conversation.id}.pickle"))
+    # An archived copy being overwritten would otherwise linger next to the new snapshot
+    pack_filename = os.path.join(directory, f"{conversation.id}{ARCHIVE_EXTENSION}")
+    if os.path.exists(pack_filename):
+        os.remove(pack_filename)
+    return conversation
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and import conversations as JSON lines")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export conversations to a JSONL file, - for stdout")
+    export_parser.add_argument("directory", help="Conversations directory")
+    export_parser.add_argument("file", help="Output file, compressed if it ends in .gz")
+    export_parser.add_argument("--id", action="append", dest="ids", help="Only export this conversation, can be repeated")
+    export_parser.add_argument("--since", help="Only export conversations with a message at or after this ISO date")
+    export_parser.add_argument("--workers", type=int, help="Number of worker processes reading conversations, defaults to the number of CPUs")
+
+    import_parser = subparsers.add_parser("import", help="Import conversations from a JSONL file, - for stdin")
+    import_parser.add_argument("directory", help="Conversations directory")
+    import_parser.add_argument("file", help="Input file, decompressed if it ends in .gz")
+    import_parser.add_argument("--overwrite", action="store_true", help="Replace conversations that already exist")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        since = datetime.fromisoformat(args.since) if args.since else None
+        ids = set(args.ids) if args.ids else None
+        output = sys.stdout if args.file == '-' else _open(args.file, 'w')
+        count = 0
+        try:
+            for line in export_conversations(args.directory, ids, since, args.workers):
+                output.write(line)
+                if line.startswith('{"type": "conversation"'):
+                    count += 1
+                    print(f"\rExported {count} conversations", end="", file=sys.stderr)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        print(f"\rExported {count} conversations", file=sys.stderr)
+    else:
+        source = sys.stdin if args.file == '-' else _open(args.file, 'r')
+        count = 0
+        try:
+            for _ in import_conversations(source, args.directory, args.overwrite):
+                count += 1
+                print(f"\rImported {count} conversations", end="", file=sys.stderr)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(f"\rImported {count} conversations", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Conversation Watcher - Reports which conversations in a directory changed on disk.
+
+Conversation files are also changed by other tools, such as conversation_editor.py, sync clients and backups. The
+watcher tells the application which conversations changed, so the catalog and search index only refresh those
+entries rather than rescanning every file in the directory.
+
+- Uses inotify on Linux, through ctypes so no extra dependency is needed
+- Elsewhere, or if inotify can't be set up, polls the directory and compares each file's modification time and size
+- Changes are collected for a short moment and reported together, a snapshot rewrite and its journal count once
+- Only conversation snapshots, journals and pack files are watched, the index databases next to them are ignored
+
+Usage:
+watcher = ConversationWatcher(directory, on_change)
+watcher.start()
+...
+watcher.stop()
+
+on_change is called from the watcher's thread with the set of changed conversation ids, or None when changes may
+have been missed (the inotify queue overflowed) and the whole directory should be refreshed.
+
+"""
+
+import os
+import sys
+import errno
+import select
+import struct
+import logging
+import threading
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from conversation import ARCHIVE_EXTENSION
+
+# Seconds between directory scans when polling
+POLL_INTERVAL = 2.0
+# Seconds to wait for more changes before reporting, files are usually written in several steps
+DEBOUNCE_INTERVAL = 0.25
+
+WATCHED_EXTENSIONS = ('.pickle', '.journal', ARCHIVE_EXTENSION)
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Journals are appended to and closed, snapshots are written to a temporary file and moved into place
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+INOTIFY_EVENT = struct.Struct('iIII')
+
+def _conversation_id(filename: str) -> Optional[str]:
+    for extension in WATCHED_EXTENSIONS:
+        if filename.endswith(extension):
+            return filename[:-len(extension)]
+    return None
+
+class ConversationWatcher:
+    def __init__(self, directory: str, on_change: Callable[[Optional[Set[str]]], None],
+                 poll_interval: float = POLL_INTERVAL, use_inotify: bool = True):
+        self.directory = directory
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        # 'inotify' or 'polling' once started
+        self.backend = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = None
+
+    def start(self):
+        if self.use_inotify:
+            self._fd = _inotify_watch(self.directory)
+        self.backend = 'inotify' if self._fd is not None else 'polling'
+        target = self._run_inotify if self._fd is not None else self._run_polling
+        self._thread = threading.Thread(target=target, name="ConversationWatcher", daemon=True)
+        self._thread.start()
+        logging.info(f"Watching {self.directory} for conversation changes using {self.backend}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _report(self, ids: Optional[Set[str]]):
+        try:
+            self.on_change(ids)
+        except Exception as e:
+            logging.error(f"Error handling conversation changes: {str(e)}")
+
+    def _run_inotify(self):
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        while not self._stop.is_set():
+            # Wake up now and then to notice stop() even when nothing changes
+            if not poller.poll(500):
+                continue
+            changed: Set[str] = set()
+            overflowed = False
+            # Keep reading until the directory has been quiet for DEBOUNCE_INTERVAL
+            while True:
+                for mask, name in self._read_events():
+                    if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF):
+                        overflowed = True
+                    id = _conversation_id(name)
+                    if id:
+                        changed.add(id)
+                if self._stop.is_set() or not poller.poll(int(DEBOUNCE_INTERVAL * 1000)):
+                    break
+            if overflowed:
+                self._report(None)
+            elif changed:
+                self._report(changed)
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += length
+            yield mask, name
+
+    def _run_polling(self):
+        previous = self._scan()
+        while not self._stop.wait(self.poll_interval):
+            current = self._scan()
+            if current is None or previous is None:
+                previous = current
+                continue
+            changed = {id for id in current.keys() | previous.keys() if current.get(id) != previous.get(id)}
+            previous = current
+            if changed:
+                self._report(changed)
+
+    # Modification time and size of every watched file, grouped by conversation. On Windows the directory listing
+    # already holds both, elsewhere each file is stat'ed, either way no conversation is read
+    def _scan(self) -> Optional[Dict[str, Tuple[Tuple[str, float, int], ...]]]:
+        files: Dict[str, list] = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    id = _conversation_id(entry.name)
+                    if not id:
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.setdefault(id, []).append((entry.name, stat.st_mtime, stat.st_size))
+        except OSError as e:
+            logging.error(f"Error scanning {self.directory} for conversation changes: {str(e)}")
+            return None
+        return {id: tuple(sorted(entries)) for id, entries in files.items()}
+
+# Start watching a directory with inotify, returns the inotify file descriptor or None where inotify isn't available
+def _inotify_watch(directory: str) -> Optional[int]:
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        if libc.inotify_add_watch(fd, os.fsencode(directory), INOTIFY_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(error, os.strerror(error))
+        return fd
+    except (OSError, AttributeError) as e:
+        # e.g. the per-user watch limit is reached (ENOSPC), or the C library has no inotify
+        if getattr(e, 'errno', None) == errno.ENOSPC:
+            logging.warning("inotify watch limit reached, polling for conversation changes instead")
+        else:
+            logging.warning(f"inotify is unavailable, polling for conversation changes instead: {str(e)}")
+        return None
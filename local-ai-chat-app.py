@@ -1,21 +1,48 @@
+import sys
+import time
+
+# With --profile-startup the time taken by each stage of startup is logged once the first page has been served,
+# then the application exits. Each stage is recorded with mark_startup, the time since the previous mark is its cost
+PROFILE_STARTUP = '--profile-startup' in sys.argv
+startup_marks = [('interpreter', time.perf_counter())]
+
+def mark_startup(stage: str):
+    startup_marks.append((stage, time.perf_counter()))
+
 import importlib
-from llama_cpp import Llama
 import os
+import gzip
+import mimetypes
 from datetime import datetime
 import logging
 from logging.handlers import RotatingFileHandler
 import re
-import sys
 import platform
-from typing import List
-from flask import Flask, Response, request, jsonify, send_from_directory
-from conversation import Conversation, create_conversation, save_conversation, load_conversation, load_all_conversations, Node, CONVERSATION_VERSION
+from typing import Callable, List, Optional
 import json
-import time
+import sqlite3
 import subprocess
 import webbrowser
 import threading
+import atexit
+import uuid
+import weakref
 from dataclasses import dataclass
+mark_startup('standard library imports')
+from flask import Flask, Response, request, jsonify, send_from_directory
+mark_startup('flask import')
+from conversation import Conversation, create_conversation, load_conversation, delete_conversation_files, Node, CONVERSATION_VERSION, ARCHIVE_EXTENSION, conversation_filename, get_version_warning
+from conversation_archive import ConversationPack, restore_archived_conversation
+from conversation_catalog import ConversationCatalog
+from conversation_persistence import PersistenceWorker
+from conversation_search import ConversationSearchIndex
+from conversation_transfer import export_conversations, import_conversations
+from conversation_watcher import ConversationWatcher
+from message_renderer import RENDERER_AVAILABLE, RenderCache, render_markdown
+from static_assets import STATIC_DIRNAME, BUILD_DIRNAME, PAGE_FILENAME, find_precompressed
+mark_startup('conversation module imports')
+# llama_cpp is not imported here, loading it and its native libraries takes longer than everything else at startup.
+# It is imported by get_llama_class when a model is first loaded, or shortly after the first page is served
 
 # Determine if running in packaged mode or development mode
 def is_packaged():
@@ -82,8 +109,10 @@ def setup_logging():
 
 app_logger = setup_logging()
 logger = logging.getLogger(__name__)
+mark_startup('logging setup')
 
-app = Flask(__name__)
+# Static files are served by the routes below, which send precompressed copies and set cache headers
+app = Flask(__name__, static_folder=None)
 
 # Disable Flask's default logging
 app.logger.handlers = []
@@ -100,10 +129,91 @@ SYSTEM_PROMPT_PATH = os.path.join(BASE_DIR, "system-prompt.txt")
 os.makedirs(MODELS_DIR, exist_ok=True)
 os.makedirs(CONVERSATIONS_DIR, exist_ok=True)
 
+mark_startup('directories')
+
+# Whether the AI's internal monologues are included in search results as well as the messages themselves
+SEARCH_INTERNAL_MONOLOGUES = False
+
+# Saves conversations in the background so requests never wait on disk, anything still queued is written on shutdown
+persistence: Optional[PersistenceWorker] = None
+# Index of conversation names and timestamps used for the sidebar listing
+catalog: Optional[ConversationCatalog] = None
+# Full-text index of message content and conversation names, None if this SQLite build lacks FTS5
+search_index: Optional[ConversationSearchIndex] = None
+# Watches the conversations directory with inotify where available, polling file times and sizes otherwise
+watcher: Optional[ConversationWatcher] = None
+services_lock = threading.Lock()
+
+# Start the services over the conversations directory, called with the first request rather than on import. With the
+# reloader the module is also run by the parent process that watches the source files, it never serves a request and
+# must not save, index or watch conversations alongside the process that does
+def start_conversation_services():
+    global persistence, catalog, search_index, watcher
+    with services_lock:
+        if persistence is not None:
+            return
+        # The indexes ask the persistence worker which conversations are still being saved, their files are behind
+        # what the indexes hold
+        worker = PersistenceWorker(CONVERSATIONS_DIR, on_saved=conversation_saved)
+        catalog = ConversationCatalog(CONVERSATIONS_DIR, is_saving=worker.is_saving)
+        try:
+            search_index = ConversationSearchIndex(CONVERSATIONS_DIR, index_monologues=SEARCH_INTERNAL_MONOLOGUES,
+                                                   is_saving=worker.is_saving)
+        except sqlite3.OperationalError as e:
+            search_index = None
+            app_logger.warning(f"Conversation search is unavailable: {str(e)}")
+        worker.start()
+        atexit.register(worker.stop)
+        watcher = ConversationWatcher(CONVERSATIONS_DIR, conversations_changed)
+        watcher.start()
+        atexit.register(watcher.stop)
+        # Set last, requests check it to know the services are running
+        persistence = worker
+        mark_startup('server start, indexes and persistence')
+
+@app.before_request
+def start_services_on_first_request():
+    if persistence is None:
+        start_conversation_services()
+
+# Once a conversation is on disk the catalog and search index record its file, so a refresh won't read it again
+def conversation_saved(conversation: Conversation):
+    catalog.update(conversation)
+    if search_index:
+        search_index.mark_saved(conversation)
+
+# Refresh the entries of conversations changed by other tools, such as the conversation editor or a sync client,
+# so listings and search stay current without rescanning the directory. ids is None if changes may have been missed
+def conversations_changed(ids):
+    if ids is None:
+        catalog.refresh()
+        if search_index:
+            search_index.refresh()
+        return
+    changes = catalog.refresh_conversations(ids)
+    if search_index:
+        search_index.refresh_conversations(ids)
+    if changes:
+        app_logger.info(f"Refreshed {changes} conversations changed on disk")
+
 current_model = None 
 current_model_name = None
+# Serializes model loading and inference, llama_cpp models must not be used from two threads at once
+model_lock = threading.Lock()
 
 current_conversation = None
+# Id of an archived conversation open in the UI, in which case current_conversation is None. It is shown straight from its
+# pack file and only restored into current_conversation once something needs the whole conversation, e.g. a new message
+current_archived_id = None
+
+# Conversations loaded or created by this process, by id, so each has at most one live object. Two objects for the same
+# conversation would hand out the same journal sequence numbers, and loading the journal would skip one of their changes.
+# Held weakly, once nothing uses a conversation any more its next load reads it from disk
+live_conversations: 'weakref.WeakValueDictionary[str, Conversation]' = weakref.WeakValueDictionary()
+live_conversations_lock = threading.Lock()
+# Guards replacing current_conversation and current_archived_id. Routes take a local reference under this lock and from then on
+# only rely on the conversation's own read/write lock, so UI reads never wait behind a generating reply
+current_conversation_lock = threading.Lock()
 
 NAMING_PROMPT = """Based on the user's first message, generate a short, concise title for this conversation. The title should be no more than 5 words long and should capture the essence of the topic or query. if the message is vague or doesn't describe a definitive topic, try to include words form the users message in the title, if that still doesn't work, use a more general title. Respond with only the title, nothing else."""
 
@@ -182,6 +292,10 @@ class TokenLimits:
 
 # Generate AI response for a given conversation, user message must already be added to conversation
 def generate_ai_response(conversation: Conversation, model_name: str, planning_mode: bool = False, token_limits: TokenLimits = TokenLimits(4096)): #-> Generator[str, None, None]:
+    with model_lock:
+        yield from _generate_ai_response(conversation, model_name, planning_mode, token_limits)
+
+def _generate_ai_response(conversation: Conversation, model_name: str, planning_mode: bool, token_limits: TokenLimits):
     start_time = time.time()
     global current_model, current_model_name
 
@@ -197,6 +311,7 @@ def generate_ai_response(conversation: Conversation, model_name: str, planning_m
     try:
         # Store the internal planning for inclusion in the final response
         internal_monologue = None
+        planning_html = None
         
         # Generate internal planning only if planning mode is enabled
         if planning_mode:
@@ -207,9 +322,11 @@ def generate_ai_response(conversation: Conversation, model_name: str, planning_m
             
             # Show the internal planning as a separate message
             planning_message = internal_monologue
+            planning_html = render_markdown(planning_message)
             yield json.dumps({
                 "status": "planning",
                 "planning": planning_message,
+                "planning_html": planning_html,
                 "timestamp": datetime.now().isoformat()
             })
         else:
@@ -223,14 +340,14 @@ def generate_ai_response(conversation: Conversation, model_name: str, planning_m
         response_time = time.time() - response_start
         app_logger.info(f"Final response generation took {response_time:.4f} seconds")
 
-        # Add the new message to the conversation
-        save_start = time.time()
+        # Add the new message to the conversation, the save is written in the background so completion is sent straight away
         # Only save the internal planning in the node if planning mode was enabled
         saved_internal_monologue = internal_monologue if planning_mode else None
         ai_node = conversation.add_message(ai_response, "AI", current_model_name, saved_internal_monologue)
-        save_conversation(conversation, CONVERSATIONS_DIR)
-        save_time = time.time() - save_start
-        app_logger.info(f"Saving conversation took {save_time:.4f} seconds")
+        persist_conversation(conversation, ai_node)
+        if planning_html is not None:
+            # Already rendered for the planning message
+            render_cache.store((conversation.id, ai_node.id, 'internal_monologue'), internal_monologue, planning_html)
         
         total_time = time.time() - start_time
         app_logger.info(f"Total AI response generation took {total_time:.4f} seconds")
@@ -238,9 +355,11 @@ def generate_ai_response(conversation: Conversation, model_name: str, planning_m
         yield json.dumps({
             "status": "complete",
             "response": ai_response,
+            "html": render_node_html(ai_node, conversation.id),
             "node_id": ai_node.id,
             "timestamp": ai_node.timestamp.isoformat(),
-            "planning": internal_monologue if planning_mode else None
+            "planning": internal_monologue if planning_mode else None,
+            "planning_html": planning_html
         })
     except ValueError as e:
         app_logger.warning(f"{str(e)}")
@@ -356,6 +475,11 @@ def generate_final_response(model, conversation, internal_monologue: str, token_
     app_logger.info(f"Final response inference took {time.time() - inference_start:.4f} seconds")
     return stripped_response
 
+# Import llama_cpp on first use, later calls get the already imported module
+def get_llama_class():
+    import llama_cpp
+    return llama_cpp.Llama
+
 # Load AI model
 def load_model(model_name):
     global current_model, current_model_name
@@ -397,7 +521,7 @@ def load_model(model_name):
             }
             
             # Load the model with the appropriate configuration
-            current_model = Llama(**model_params)
+            current_model = get_llama_class()(**model_params)
             current_model_name = model_name
             load_model.model_cache[model_name] = current_model
         except Exception as e:
@@ -432,10 +556,195 @@ def validate_model_selection(model_name, operation_name="operation"):
     
     return True, None
 
-# Serve the main HTML page
+# Queue a conversation to be saved, the catalog is updated straight away so listings don't wait for the write.
+# A message that was just added is indexed for search at the same time. Both happen once the save is queued, so a
+# refresh leaves the conversation's entries alone until its file has caught up
+def persist_conversation(conversation: Conversation, new_node: Node = None):
+    persistence.schedule(conversation)
+    catalog.update(conversation)
+    if search_index and new_node:
+        search_index.add_node(conversation, new_node)
+
+# The pack file of an archived conversation, None if the conversation isn't archived
+def get_archived_filename(conversation_id: str):
+    filename = conversation_filename(conversation_id, CONVERSATIONS_DIR)
+    return filename if filename.endswith(ARCHIVE_EXTENSION) else None
+
+# Load a conversation from disk, writing any queued save of it first so the file is up to date.
+# An archived conversation is restored from its pack file first, so it can be changed and saved as usual
+# A conversation that is still in use, e.g. one whose response is being generated, is returned as it is rather than loaded
+# a second time
+def load_persisted_conversation(conversation_id: str):
+    with live_conversations_lock:
+        conversation = live_conversations.get(conversation_id)
+        if conversation is not None:
+            return conversation, None
+        persistence.flush(conversation_id)
+        pack_filename = get_archived_filename(conversation_id)
+        if pack_filename:
+            restore_archived_conversation(pack_filename)
+            app_logger.info(f"Restored archived conversation {conversation_id}")
+        conversation, warning = load_conversation(conversation_id, CONVERSATIONS_DIR)
+        if conversation:
+            live_conversations[conversation.id] = conversation
+    if pack_filename and conversation:
+        catalog.update(conversation)
+    return conversation, warning
+
+# Get the conversation currently open in the UI, take this reference once per request rather than reading the global repeatedly.
+# If the open conversation is archived it is restored here, every caller needs the whole conversation
+def get_active_conversation():
+    global current_conversation, current_archived_id
+    with current_conversation_lock:
+        if current_archived_id is not None:
+            current_conversation, _ = load_persisted_conversation(current_archived_id)
+            current_archived_id = None
+        return current_conversation
+
+# The response for an archived conversation opened in the UI, read from its pack file without loading the conversation.
+# Only the messages on its current branch are read, or only the last limit of them. Internal monologues are always
+# included, they are read in place like the messages
+def serialize_archived_conversation(pack: ConversationPack, limit: Optional[int] = None) -> dict:
+    window, start, total = pack.get_branch_window(limit)
+    return {
+        'conversation_id': pack.id,
+        'conversation_name': pack.name,
+        'version_warning': get_version_warning(pack.version),
+        'revision': pack.revision,
+        **serialize_window(add_rendered_html([serialize_node(node, sibling_count) for node, sibling_count in window], pack.id),
+                           start, total)
+    }
+
+# ETags are built from revisions, which only change when the data does, so an unchanged response is recognised
+# without building it. Catalog revisions start again with each run, the epoch keeps ETags from one run from
+# matching the next
+ETAG_EPOCH = uuid.uuid4().hex[:8]
+
+def conversation_etag(conversation_id: Optional[str], revision: int) -> str:
+    return f"{ETAG_EPOCH}-{conversation_id}-{revision}"
+
+# Answer with 304 Not Modified if the client already has the response with this ETag, otherwise build it.
+# Responses must be revalidated before each use, which the ETag makes cheap for both sides
+def conditional_response(etag: str, build: Callable[[], object]) -> Response:
+    # Weak as well, compressed responses are sent with a weak ETag
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Renderings of messages to HTML, kept across requests and conversation switches for the most recently sent messages.
+# Keyed by conversation id, node id and field, a rendering is only reused while the text it was rendered from is unchanged
+render_cache = RenderCache()
+
+# The text of a message, or its internal monologue with field='internal_monologue', rendered to HTML for the client, so
+# the browser doesn't render the markdown and guess the language of every code block itself.
+# None if there is no text or the renderer's libraries aren't installed, the client then renders the markdown
+def render_message_html(conversation_id: str, node_id: str, text: Optional[str], field: str = 'content') -> Optional[str]:
+    if text is None or not RENDERER_AVAILABLE:
+        return None
+    return render_cache.render((conversation_id, node_id, field), text)
+
+def render_node_html(node: Node, conversation_id: str, field: str = 'content') -> Optional[str]:
+    return render_message_html(conversation_id, node.id, getattr(node, field), field)
+
+# Add the rendered content and internal monologue to serialized nodes, in html and internal_monologue_html. Rendering
+# reads only the serialized text, so it is done after the conversation's lock is released
+def add_rendered_html(branch: List[dict], conversation_id: str) -> List[dict]:
+    if RENDERER_AVAILABLE:
+        for serialized in branch:
+            serialized['html'] = render_message_html(conversation_id, serialized['id'], serialized['content'])
+            if 'has_internal_monologue' not in serialized:
+                serialized['internal_monologue_html'] = render_message_html(
+                    conversation_id, serialized['id'], serialized['internal_monologue'], 'internal_monologue')
+    return branch
+
+# Convert a node to the dictionary sent to the client, including its position among its siblings so the
+# client can show "i of n" and the branch arrows without asking for the siblings.
+# Nodes read from a pack file don't have their siblings loaded, their sibling_count is passed in.
+# Without include_monologue the internal monologue is left out and has_internal_monologue says whether there is one,
+# the client fetches it with /message/get_internal_monologue when it is shown.
+# The rendered HTML is added by add_rendered_html
+def serialize_node(node: Node, sibling_count: int = None, include_monologue: bool = True) -> dict:
+    if sibling_count is None:
+        sibling_count = len(node.parent.children) if node.parent else 1
+    serialized = {
+        'id': node.id,
+        'content': node.content,
+        'sender': node.sender,
+        'timestamp': node.timestamp.isoformat(),
+        'model_name': node.model_name,
+        'internal_monologue': node.internal_monologue if include_monologue else None,
+        'sibling_index': node.sibling_index,
+        'sibling_count': sibling_count
+    }
+    if not include_monologue:
+        serialized['has_internal_monologue'] = node.internal_monologue is not None
+    return serialized
+
+# A window of the current branch: its messages, the position of the first among the branch's messages, the number of
+# messages on the branch, and the cursor to pass as before to fetch the messages above it, None at the top
+def serialize_window(branch: List[dict], start: int, total: int) -> dict:
+    return {'branch': branch, 'start': start, 'total': total, 'earlier_cursor': branch[0]['id'] if start > 0 and branch else None}
+
+# Serialize the current branch for a client that may already show part of it. known_leaf is the id of the last message
+# the client shows and revision the revision it was sent with that branch, both optional. The response always carries the
+# current revision and the number of messages on the branch. When the client's branch can be reused it also carries keep,
+# the number of messages from the top of the branch the client keeps, and branch only holds the messages after them.
+# Otherwise branch is the whole current branch, or with limit only its last limit messages as a window
+def serialize_branch_update(conversation: Conversation, known_leaf: Optional[str] = None, revision: Optional[int] = None,
+                            limit: Optional[int] = None, include_monologues: bool = True) -> dict:
+    with conversation.read_locked():
+        if revision is not None and revision == conversation.revision:
+            # Nothing changed since the client's copy
+            _, _, total = conversation.get_branch_window(0)
+            return {'revision': conversation.revision, 'keep': total, 'total': total, 'branch': []}
+        delta = conversation.get_branch_delta(known_leaf) if known_leaf else None
+        if delta is not None and (limit is None or len(delta[1]) <= limit):
+            keep, tail = delta
+            update = {'revision': conversation.revision, 'keep': keep, 'total': keep + len(tail),
+                      'branch': [serialize_node(node, include_monologue=include_monologues) for node in tail]}
+        else:
+            window, start, total = conversation.get_branch_window(limit)
+            update = {'revision': conversation.revision,
+                      **serialize_window([serialize_node(node, include_monologue=include_monologues) for node in window], start, total)}
+    # Rendered once the lock is released, so rendering doesn't hold up messages being added
+    add_rendered_html(update['branch'], conversation.id)
+    return update
+
+STATIC_DIR = os.path.join(BASE_DIR, STATIC_DIRNAME)
+STATIC_BUILD_DIR = os.path.join(STATIC_DIR, BUILD_DIRNAME)
+# Cache lifetime of built assets, their names change whenever their content does
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Send a static file, or its precompressed copy when the browser accepts that encoding
+def send_static(directory: str, filename: str, cache_control: str) -> Response:
+    served, encoding = find_precompressed(directory, filename, request.accept_encodings)
+    response = send_from_directory(directory, served, mimetype=mimetypes.guess_type(filename)[0])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+# Serve the main HTML page, the built page refers to the hashed assets. It is revalidated on every load
 @app.route('/')
 def index():
-    return send_from_directory(BASE_DIR, 'chat-interface.html')
+    if os.path.isfile(os.path.join(STATIC_BUILD_DIR, PAGE_FILENAME)):
+        return send_static(STATIC_BUILD_DIR, PAGE_FILENAME, 'no-cache')
+    return send_from_directory(BASE_DIR, PAGE_FILENAME)
+
+# Serve built assets, see static_assets.py
+@app.route(f'/{STATIC_DIRNAME}/{BUILD_DIRNAME}/<path:filename>')
+def serve_built_asset(filename):
+    return send_static(STATIC_BUILD_DIR, filename, IMMUTABLE_CACHE_CONTROL)
+
+# Serve asset sources, used when running from source without a build
+@app.route(f'/{STATIC_DIRNAME}/<path:filename>')
+def serve_asset(filename):
+    return send_static(STATIC_DIR, filename, 'no-cache')
 
 ## Model-related routes
 
@@ -471,26 +780,99 @@ def open_models_folder():
 # operations involving more than one conversation use /conversations for example getting a list of all conversations or switching between 2 conversations
 # operations involving one conversation, usually with a supplied conversation id from the client, use /conversation singular
 
-# Get all conversations
+# Get all conversations, read from the catalog rather than the conversation files
+# With a limit the listing is paginated: the response holds one page and the cursor to pass back for the next one
 @app.route('/conversations', methods=['GET'])
 def get_conversations():
-    conversations_with_warnings = load_all_conversations(CONVERSATIONS_DIR)
-    return jsonify([{
-        'id': conv.id,
-        'name': conv.name,
-        'latest_message_timestamp': conv.latest_message_timestamp.isoformat() if conv.latest_message_timestamp else None,
-        'version_warning': warning
-    } for conv, warning in conversations_with_warnings])
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    sort = request.args.get('sort', 'recent')
+    
+    # Read before the listing, if the catalog changes while it is read the next request sees a new revision
+    etag = f"{ETAG_EPOCH}-catalog-{catalog.revision}"
+    
+    def build():
+        conversations, next_cursor = catalog.list(limit=limit, cursor=cursor, sort=sort)
+        if limit is None:
+            return conversations
+        return {'conversations': conversations, 'next_cursor': next_cursor}
+    
+    try:
+        return conditional_response(etag, build)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+# Search message content and conversation names across all conversations, best matches first.
+# The last word matches as a prefix so results can be shown while the user is typing
+@app.route('/search', methods=['GET'])
+def search_conversations():
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 20, type=int)
+    
+    if not search_index:
+        return jsonify({'error': 'Search is not available'}), 503
+    try:
+        return jsonify({'results': search_index.search(query, limit=limit)})
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Search failed: {str(e)}'}), 500
+
+# Stream every conversation, or those given by id parameters or with a message since an ISO date, as JSON lines.
+# Conversations are read one at a time, so exporting a large store doesn't load it into memory
+@app.route('/conversations/export', methods=['GET'])
+def export_all_conversations():
+    ids = set(request.args.getlist('id')) or None
+    try:
+        since = datetime.fromisoformat(request.args['since']) if 'since' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Write queued saves first so the export includes the latest messages
+    persistence.flush()
+    filename = f"conversations-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl"
+    return Response(export_conversations(CONVERSATIONS_DIR, ids, since), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# Import conversations from an export posted as JSON lines, read from the request as it arrives.
+# Conversations that already exist are left unchanged
+@app.route('/conversations/import', methods=['POST'])
+def import_posted_conversations():
+    imported = 0
+    try:
+        for conversation in import_conversations(request.stream, CONVERSATIONS_DIR):
+            catalog.update(conversation)
+            if search_index:
+                search_index.index_conversation(conversation)
+                search_index.mark_saved(conversation)
+            imported += 1
+    except (ValueError, KeyError) as e:
+        return jsonify({'success': False, 'imported': imported, 'error': f'Invalid export: {str(e)}'}), 400
+    return jsonify({'success': True, 'imported': imported})
 
 # Switch to a different conversation
 @app.route('/conversations/switch', methods=['POST'])
 def switch_conversation():
-    global current_conversation
+    global current_conversation, current_archived_id
     conversation_id = request.json['id']
-    if current_conversation:
-        save_conversation(current_conversation, CONVERSATIONS_DIR)
+    # Not get_active_conversation, an archived conversation being left doesn't need restoring
+    with current_conversation_lock:
+        previous_conversation = current_conversation
+    if previous_conversation:
+        persist_conversation(previous_conversation)
     
-    loaded_conversation, version_warning = load_conversation(conversation_id, CONVERSATIONS_DIR)
+    # Archived conversations are shown from their pack file, only the current branch is read
+    pack_filename = get_archived_filename(conversation_id)
+    if pack_filename:
+        try:
+            with ConversationPack(pack_filename) as pack:
+                archived = serialize_archived_conversation(pack, request.json.get('limit'))
+        except (OSError, ValueError) as e:
+            return jsonify({'success': False, 'error': f"Archived conversation could not be read: {str(e)}"}), 404
+        with current_conversation_lock:
+            current_conversation = None
+            current_archived_id = conversation_id
+        return jsonify({'success': True, **archived})
+    
+    loaded_conversation, version_warning = load_persisted_conversation(conversation_id)
     
     if not loaded_conversation:
         # The conversation was deleted due to version incompatibility
@@ -499,56 +881,102 @@ def switch_conversation():
             'error': version_warning or "Conversation could not be loaded"
         }), 404
     
-    current_conversation = loaded_conversation
+    with current_conversation_lock:
+        current_conversation = loaded_conversation
+        current_archived_id = None
     
     return jsonify({
         'success': True,
-        'conversation_id': current_conversation.id,
-        'conversation_name': current_conversation.name,
+        'conversation_id': loaded_conversation.id,
+        'conversation_name': loaded_conversation.name,
         'version_warning': version_warning,
-        'branch': [
-            {
-                'id': node.id,
-                'content': node.content,
-                'sender': node.sender,
-                'timestamp': node.timestamp.isoformat(),
-                'model_name': node.model_name,
-                'internal_monologue': node.internal_monologue
-            } for node in current_conversation.get_current_branch()
-        ]
+        **serialize_branch_update(loaded_conversation, request.json.get('known_leaf'), request.json.get('revision'),
+                                  request.json.get('limit'), request.json.get('monologues', True))
     })
 
 
 # Get the current conversation
 @app.route('/conversations/current', methods=['GET'])
 def get_current_conversation():
-    if current_conversation:
+    limit = request.args.get('limit', type=int)
+    include_monologues = request.args.get('monologues') != '0'
+    with current_conversation_lock:
+        conversation, archived_id = current_conversation, current_archived_id
+    if archived_id:
+        pack_filename = get_archived_filename(archived_id)
+        if pack_filename:
+            with ConversationPack(pack_filename) as pack:
+                return conditional_response(conversation_etag(pack.id, pack.revision), lambda: serialize_archived_conversation(pack, limit))
+        # Restored since it was opened, e.g. by a rename
+        conversation = get_active_conversation()
+    if conversation:
         # Check if the current conversation needs a version update
         version_parts = [int(p) for p in CONVERSATION_VERSION.split('.')]
-        conv_parts = [int(p) for p in current_conversation.version.split('.')] if hasattr(current_conversation, 'version') else [0, 0, 0]
+        conv_parts = [int(p) for p in conversation.version.split('.')] if hasattr(conversation, 'version') else [0, 0, 0]
         
         version_warning = None
         if conv_parts[1] < version_parts[1]:
             # Minor version difference send warning message
-            version_warning = f"This conversation was created with an older version (v{current_conversation.version if hasattr(current_conversation, 'version') else '0.0.0'}). Some features may not work as expected."
+            version_warning = f"This conversation was created with an older version (v{conversation.version if hasattr(conversation, 'version') else '0.0.0'}). Some features may not work as expected."
         
-        return jsonify({
-            'conversation_id': current_conversation.id,
-            'conversation_name': current_conversation.name,
-            'version_warning': version_warning,
-            'branch': [
-                {
-                    'id': node.id,
-                    'content': node.content,
-                    'sender': node.sender,
-                    'timestamp': node.timestamp.isoformat(),
-                    'model_name': node.model_name,
-                    'internal_monologue': node.internal_monologue
-                } for node in current_conversation.get_current_branch()
-            ]
-        })
+        # A revision only describes the conversation it was sent with
+        revision = request.args.get('revision', type=int) if request.args.get('conversation_id') == conversation.id else None
+        # serialize_branch_update holds the read lock only while it serializes, rendering happens after it is released
+        with conversation.read_locked():
+            etag = conversation_etag(conversation.id, conversation.revision)
+            name = conversation.name
+        served = {}
+        def build():
+            update = serialize_branch_update(conversation, request.args.get('known_leaf'), revision, limit, include_monologues)
+            served['revision'] = update['revision']
+            return {'conversation_id': conversation.id, 'conversation_name': name, 'version_warning': version_warning, **update}
+        response = conditional_response(etag, build)
+        # A change between taking the ETag and serializing is sent under the ETag of the revision that was serialized
+        if 'revision' in served:
+            response.set_etag(conversation_etag(conversation.id, served['revision']))
+        return response
     else:
-        return jsonify({'conversation_id': None, 'conversation_name': None, 'branch': [], 'version_warning': None})
+        return conditional_response(conversation_etag(None, 0), lambda: {'conversation_id': None, 'conversation_name': None, 'branch': [], 'version_warning': None})
+
+# Get the messages of the current branch above the message before, at most limit of them, for a client that shows
+# only the end of a long branch. before is the earlier_cursor of the window the client already has
+@app.route('/conversations/current/branch', methods=['GET'])
+def get_current_branch_window():
+    before = request.args.get('before')
+    limit = request.args.get('limit', type=int)
+    include_monologues = request.args.get('monologues') != '0'
+    with current_conversation_lock:
+        conversation, archived_id = current_conversation, current_archived_id
+    if archived_id:
+        pack_filename = get_archived_filename(archived_id)
+        if pack_filename:
+            with ConversationPack(pack_filename) as pack:
+                result = pack.get_branch_window(limit, before)
+                if result is None:
+                    return jsonify({'error': 'Message is not on the current branch'}), 404
+                window, start, total = result
+                return conditional_response(conversation_etag(pack.id, pack.revision), lambda: {
+                    'conversation_id': pack.id,
+                    'revision': pack.revision,
+                    **serialize_window(add_rendered_html([serialize_node(node, sibling_count) for node, sibling_count in window], pack.id),
+                                       start, total)
+                })
+        conversation = get_active_conversation()
+    if not conversation:
+        return jsonify({'error': 'No active conversation'}), 400
+    with conversation.read_locked():
+        result = conversation.get_branch_window(limit, before)
+        if result is None:
+            return jsonify({'error': 'Message is not on the current branch'}), 404
+        window, start, total = result
+        revision = conversation.revision
+        branch = [serialize_node(node, include_monologue=include_monologues) for node in window]
+    # Rendered once the lock is released, so rendering doesn't hold up messages being added
+    return conditional_response(conversation_etag(conversation.id, revision), lambda: {
+        'conversation_id': conversation.id,
+        'revision': revision,
+        **serialize_window(add_rendered_html(branch, conversation.id), start, total)
+    })
 
 # Get sibling messages for a given node
 @app.route('/conversations/get_siblings', methods=['POST'])
@@ -556,19 +984,11 @@ def get_siblings():
     data = request.json
     node_id = data['node_id']
     
-    if current_conversation:
-        siblings = current_conversation.get_siblings(node_id)
+    conversation = get_active_conversation()
+    if conversation:
+        siblings = conversation.get_siblings(node_id)
         return jsonify({
-            'siblings': [
-                {
-                    'id': node.id,
-                    'content': node.content,
-                    'sender': node.sender,
-                    'timestamp': node.timestamp.isoformat(),
-                    'model_name': node.model_name,
-                    'internal_monologue': node.internal_monologue
-                } for node in siblings
-            ]
+            'siblings': [serialize_node(node) for node in siblings]
         })
     
     return jsonify({'siblings': []}), 400
@@ -576,28 +996,38 @@ def get_siblings():
 # Delete a conversation
 @app.route('/conversation/delete', methods=['POST'])
 def delete_conversation():
-    global current_conversation
+    global current_conversation, current_archived_id
     conversation_id = request.json['id']
-    filename = os.path.join(CONVERSATIONS_DIR, f"{conversation_id}.pickle")
     
     try:
-        if os.path.exists(filename):
-            os.remove(filename)
-            if current_conversation and current_conversation.id == conversation_id:
-                current_conversation = None
-            return jsonify({'success': True})
-        else:
-            return jsonify({'error': 'Conversation file not found'}), 404
+        with current_conversation_lock:
+            persistence.discard(conversation_id)
+            with live_conversations_lock:
+                live_conversations.pop(conversation_id, None)
+            if delete_conversation_files(conversation_id, CONVERSATIONS_DIR):
+                catalog.remove(conversation_id)
+                if search_index:
+                    search_index.remove(conversation_id)
+                if current_conversation and current_conversation.id == conversation_id:
+                    current_conversation = None
+                if current_archived_id == conversation_id:
+                    current_archived_id = None
+                return jsonify({'success': True})
+            else:
+                return jsonify({'error': 'Conversation file not found'}), 404
     except Exception as e:
         return jsonify({'error': f'Failed to delete conversation: {str(e)}'}), 500
 
 # Clear the current conversation variable, this does not effect the conversation itself
 @app.route('/conversation/clear', methods=['POST'])
 def clear_conversation():
-    global current_conversation
-    if current_conversation:
-        save_conversation(current_conversation, CONVERSATIONS_DIR)
-    current_conversation = None
+    global current_conversation, current_archived_id
+    with current_conversation_lock:
+        conversation = current_conversation
+        current_conversation = None
+        current_archived_id = None
+    if conversation:
+        persist_conversation(conversation)
     return jsonify({'success': True})
 
 # Rename a conversation
@@ -608,12 +1038,19 @@ def rename_conversation():
     new_name = data['new_name']
     
     try:
-        conversation, warning = load_conversation(conversation_id, CONVERSATIONS_DIR)
-        if not conversation:
-            return jsonify({'success': False, 'error': warning or "Conversation not found"}), 404
+        # Rename the open conversation in place, otherwise its next save would overwrite the new name.
+        # Read without get_active_conversation, renaming another conversation doesn't need an archived one restored
+        with current_conversation_lock:
+            conversation = current_conversation
+        if not conversation or conversation.id != conversation_id:
+            conversation, warning = load_persisted_conversation(conversation_id)
+            if not conversation:
+                return jsonify({'success': False, 'error': warning or "Conversation not found"}), 404
             
         conversation.set_name(new_name)
-        save_conversation(conversation, CONVERSATIONS_DIR)
+        persist_conversation(conversation)
+        if search_index:
+            search_index.rename(conversation)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
@@ -625,34 +1062,29 @@ def switch_branch():
     node_id = data['node_id']
     direction = data['direction']
     
-    if current_conversation:
-        siblings = current_conversation.get_siblings(node_id)
-        current_index = next((i for i, sibling in enumerate(siblings) if sibling.id == node_id), -1)
-        
-        if direction == 'left' and current_index > 0:
-            new_node = siblings[current_index - 1]
-        elif direction == 'right' and current_index < len(siblings) - 1:
-            new_node = siblings[current_index + 1]
-        else:
-            return jsonify({'success': False, 'error': 'Cannot switch branch in this direction'}), 400
-        
-        leaf_node = current_conversation.tree.get_leaf_node(new_node)
-        current_conversation.tree.current_node = leaf_node
-        save_conversation(current_conversation, CONVERSATIONS_DIR)
+    conversation = get_active_conversation()
+    if conversation:
+        # Select the sibling, move to its leaf and read the new branch as one atomic step.
+        # Messages above the switched message are unchanged, so only the branch from the new sibling down is sent,
+        # the client replaces node_id and everything below it
+        with conversation.write_locked():
+            sibling = conversation.switch_branch(node_id, direction)
+            if sibling is None:
+                return jsonify({'success': False, 'error': 'Cannot switch branch in this direction'}), 400
+            branch = [serialize_node(node) for node in conversation.get_current_branch_from(sibling)]
+            sibling_index, sibling_count = conversation.get_sibling_position(sibling)
+            revision = conversation.revision
+        persist_conversation(conversation)
+        add_rendered_html(branch, conversation.id)
         
         return jsonify({
             'success': True,
-            'conversation_id': current_conversation.id,
-            'branch': [
-                {
-                    'id': node.id,
-                    'content': node.content,
-                    'sender': node.sender,
-                    'timestamp': node.timestamp.isoformat(),
-                    'model_name': node.model_name,
-                    'internal_monologue': node.internal_monologue
-                } for node in current_conversation.get_current_branch()
-            ]
+            'conversation_id': conversation.id,
+            'replaced_node_id': node_id,
+            'sibling_index': sibling_index,
+            'sibling_count': sibling_count,
+            'revision': revision,
+            'branch': branch
         })
     
     return jsonify({'success': False, 'error': 'No active conversation'}), 400
@@ -661,7 +1093,7 @@ def switch_branch():
 @app.route('/conversation/add_user_message', methods=['POST'])
 def add_user_message():
     request_start = time.time()
-    global current_session_prompt, current_model, current_conversation, current_model_name
+    global current_session_prompt
     data = request.json
     user_input = data['message']
     model_name = data['model']
@@ -677,44 +1109,51 @@ def add_user_message():
     def generate(user_input, model_name):
         global current_model, current_conversation, current_model_name
         
-        if current_model is None or current_model_name != model_name:
-            yield json.dumps({"status": "loading_model"})
-            model_load_start = time.time()
-            try:
-                current_model = load_model(model_name)
-                current_model_name = model_name
-                app_logger.info(f"Model loading took {time.time() - model_load_start:.4f} seconds")
-            except (ValueError, RuntimeError) as e:
-                error_message = str(e)
-                app_logger.error(f"Model loading failed: {error_message}")
-                yield json.dumps({
-                    'status': 'error',
-                    'message': error_message
-                })
-                return
-        
-        if current_conversation is None:
-            yield json.dumps({"status": "creating_conversation"})
-            naming_start = time.time()
-            naming_prompt = f"{NAMING_PROMPT}\n\nUser's message: {user_input}\n\nTitle:"
-            naming_response = current_model(naming_prompt, max_tokens=10, stop=["\n"], temperature=0.7)
-            conversation_name = naming_response['choices'][0]['text'].strip()
-            current_conversation = create_conversation(conversation_name)
-            app_logger.info(f"Conversation creation and naming took {time.time() - naming_start:.4f} seconds")
+        with model_lock:
+            if current_model is None or current_model_name != model_name:
+                yield json.dumps({"status": "loading_model"})
+                model_load_start = time.time()
+                try:
+                    current_model = load_model(model_name)
+                    current_model_name = model_name
+                    app_logger.info(f"Model loading took {time.time() - model_load_start:.4f} seconds")
+                except (ValueError, RuntimeError) as e:
+                    error_message = str(e)
+                    app_logger.error(f"Model loading failed: {error_message}")
+                    yield json.dumps({
+                        'status': 'error',
+                        'message': error_message
+                    })
+                    return
+            
+            conversation = get_active_conversation()
+            if conversation is None:
+                yield json.dumps({"status": "creating_conversation"})
+                naming_start = time.time()
+                naming_prompt = f"{NAMING_PROMPT}\n\nUser's message: {user_input}\n\nTitle:"
+                naming_response = current_model(naming_prompt, max_tokens=10, stop=["\n"], temperature=0.7)
+                conversation_name = naming_response['choices'][0]['text'].strip()
+                conversation = create_conversation(conversation_name)
+                with live_conversations_lock:
+                    live_conversations[conversation.id] = conversation
+                with current_conversation_lock:
+                    current_conversation = conversation
+                app_logger.info(f"Conversation creation and naming took {time.time() - naming_start:.4f} seconds")
         
-        save_start = time.time()
-        new_node = current_conversation.add_message(user_input, "Human")
-        save_conversation(current_conversation, CONVERSATIONS_DIR)
-        app_logger.info(f"Saving user message took {time.time() - save_start:.4f} seconds")
+        add_start = time.time()
+        new_node = conversation.add_message(user_input, "Human")
+        persist_conversation(conversation, new_node)
+        app_logger.info(f"Adding user message took {time.time() - add_start:.4f} seconds")
         
         total_time = time.time() - request_start
         app_logger.info(f"Total user message processing took {total_time:.4f} seconds")
         
         yield json.dumps({
             "status": "complete",
-            "conversation_id": current_conversation.id,
-            "conversation_name": current_conversation.name,
+            "conversation_id": conversation.id,
+            "conversation_name": conversation.name,
             "human_node_id": new_node.id,
+            "html": render_node_html(new_node, conversation.id),
             "timestamp": new_node.timestamp.isoformat()
         })
     
@@ -734,10 +1173,15 @@ def get_ai_response():
     if not is_valid:
         return error_response
     
-    if current_conversation.id != conversation_id:
-        current_conversation = load_conversation(conversation_id, CONVERSATIONS_DIR)
+    conversation = get_active_conversation()
+    if conversation is None or conversation.id != conversation_id:
+        conversation, warning = load_persisted_conversation(conversation_id)
+        if not conversation:
+            return jsonify({'success': False, 'error': warning or "Conversation not found"}), 404
+        with current_conversation_lock:
+            current_conversation = conversation
     
-    return Response(generate_ai_response(current_conversation, model_name, planning_mode), mimetype='application/json')
+    return Response(generate_ai_response(conversation, model_name, planning_mode), mimetype='application/json')
 
 # Regenerate AI response for a specific message
 @app.route('/message/regenerate', methods=['POST'])
@@ -752,11 +1196,12 @@ def regenerate_response():
     if not is_valid:
         return error_response
     
-    if current_conversation:
-        node_to_regenerate = current_conversation.find_node(node_id)
+    conversation = get_active_conversation()
+    if conversation:
+        node_to_regenerate = conversation.find_node(node_id)
         if node_to_regenerate and node_to_regenerate.parent:
-            current_conversation.tree.current_node = node_to_regenerate.parent
-            return Response(generate_ai_response(current_conversation, model_name, planning_mode), mimetype='application/json')
+            conversation.navigate_to(node_to_regenerate.parent.id)
+            return Response(generate_ai_response(conversation, model_name, planning_mode), mimetype='application/json')
     
     return jsonify({'success': False, 'error': 'Failed to regenerate response'}), 400
 
@@ -768,14 +1213,16 @@ def edit_message():
     new_content = data['new_content']
     sender = data['sender']
     
-    if current_conversation:
-        new_node = current_conversation.edit_message(node_id, new_content)
+    conversation = get_active_conversation()
+    if conversation:
+        new_node = conversation.edit_message(node_id, new_content)
         if new_node:
-            save_conversation(current_conversation, CONVERSATIONS_DIR)
+            persist_conversation(conversation, new_node)
             
             return jsonify({
                 'success': True,
                 'new_node_id': new_node.id,
+                'html': render_node_html(new_node, conversation.id),
                 'timestamp': new_node.timestamp.isoformat(),
             })
     
@@ -788,8 +1235,9 @@ def get_original_content():
     node_id = data['node_id']
     app_logger.info(f"Getting original content for node_id: {node_id}")
     
-    if current_conversation:
-        node = current_conversation.find_node(node_id)
+    conversation = get_active_conversation()
+    if conversation:
+        node = conversation.find_node(node_id)
         if node:
             return jsonify({
                 'success': True,
@@ -798,6 +1246,23 @@ def get_original_content():
     
     return jsonify({'success': False, 'error': 'Node not found'}), 404
 
+# Get the internal monologue of a message, for branches sent without them
+@app.route('/message/get_internal_monologue', methods=['POST'])
+def get_internal_monologue():
+    node_id = request.json['node_id']
+    
+    conversation = get_active_conversation()
+    if conversation:
+        node = conversation.find_node(node_id)
+        if node:
+            return jsonify({
+                'success': True,
+                'internal_monologue': node.internal_monologue,
+                'html': render_node_html(node, conversation.id, 'internal_monologue')
+            })
+    
+    return jsonify({'success': False, 'error': 'Node not found'}), 404
+
 ## Session prompt routes
 # Get the current session prompt
 @app.route('/session_prompt', methods=['GET'])
@@ -845,6 +1310,9 @@ def open_browser():
 # Variable to track if we've already opened the browser
 browser_opened = False
 
+# Set once the first response has been sent, deferred startup work waits for it so it doesn't slow down the first page
+first_request_served = threading.Event()
+
 @app.before_request
 def open_browser_on_first_request():
     """Open browser on the first request to any route - this ensures server is ready"""
@@ -860,16 +1328,97 @@ def open_browser_on_first_request():
         browser_opened = True
         app_logger.info("Browser opening scheduled after first request")
 
+@app.after_request
+def set_first_request_served(response):
+    first_request_served.set()
+    return response
+
+# JSON responses at least this many bytes long are gzip compressed for clients that accept it
+JSON_GZIP_THRESHOLD = 16 * 1024
+
+# Compress large JSON responses such as long branches and listings. Streamed responses are left alone, each line
+# must reach the client as soon as it is written
+@app.after_request
+def compress_json(response):
+    if (response.mimetype != 'application/json' or response.is_streamed or response.direct_passthrough
+            or response.status_code != 200 or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.accept_encodings):
+        return response
+    data = response.get_data()
+    if len(data) < JSON_GZIP_THRESHOLD:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # The compressed body isn't byte for byte the response the ETag was made for
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Wait until the server accepts requests, returns False if it didn't within the timeout
+def wait_for_server(timeout: float = 10.0) -> bool:
+    import urllib.request
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            urllib.request.urlopen('http://localhost:5000/', timeout=1)
+            return True
+        except Exception:
+            time.sleep(0.02)
+    return False
+
 # Function to bootstrap the first request
 def trigger_first_request():
     """Make a request to the server to trigger @app.before_request handlers"""
-    time.sleep(1.0)  # Give the server a moment to start
-    try:
-        import urllib.request
-        urllib.request.urlopen('http://localhost:5000/', timeout=1)
+    if wait_for_server():
         app_logger.debug("Bootstrap request completed")
+    else:
+        app_logger.debug("Bootstrap request failed, the server did not start in time")
+
+# Library version and import verification, run in the background once the first page has been served.
+# Importing llama_cpp here also means the first model load doesn't have to wait for it
+def verify_libraries():
+    first_request_served.wait(timeout=10.0)
+    try:
+        import llama_cpp
+        app_logger.info(f"llama_cpp version: {llama_cpp.__version__}")
+        app_logger.info(f"llama_cpp path: {llama_cpp.__file__}")
+        
+        # Verify llama_cpp functionality
+        if not hasattr(llama_cpp, 'Llama'):
+            app_logger.error("llama_cpp.Llama class not found!")
+        else:
+            app_logger.info("llama_cpp.Llama class verified")
+            
+        # Check for other major dependencies
+        import importlib.metadata
+        app_logger.info(f"Flask version: {importlib.metadata.version('flask')}")
+        app_logger.info(f"Python logging version: {logging.__version__}")
+        
+    except ImportError as e:
+        app_logger.error(f"Failed to import required library: {str(e)}")
     except Exception as e:
-        app_logger.debug(f"Bootstrap request failed: {str(e)}")
+        app_logger.error(f"Error during library verification: {str(e)}")
+
+# Serve the first page, time the deferred llama_cpp import and log how long each stage of startup took
+def profile_startup():
+    if not wait_for_server():
+        app_logger.error("Startup profile failed, the server did not start in time")
+        return
+    mark_startup('first page')
+    first_page = startup_marks[-1][1]
+    try:
+        import llama_cpp
+        mark_startup('llama_cpp import (deferred, after the first page)')
+    except ImportError as e:
+        app_logger.error(f"Failed to import llama_cpp: {str(e)}")
+    
+    report = ["Startup profile:"]
+    for (_, previous), (stage, marked) in zip(startup_marks, startup_marks[1:]):
+        report.append(f"  {stage:<50} {(marked - previous) * 1000:8.1f} ms")
+    report.append(f"  {'first page served after':<50} {(first_page - startup_marks[0][1]) * 1000:8.1f} ms")
+    app_logger.info("\n".join(report))
 
 if __name__ == '__main__':
     app_logger.info("Application started")
@@ -881,34 +1430,19 @@ if __name__ == '__main__':
     app_logger.info(f"Models directory: {MODELS_DIR}")
     app_logger.info(f"Conversations directory: {CONVERSATIONS_DIR}")
     
-    # Library version and import verification
-    if True:  # Toggle for developers
-        try:
-            import llama_cpp
-            app_logger.info(f"llama_cpp version: {llama_cpp.__version__}")
-            app_logger.info(f"llama_cpp path: {llama_cpp.__file__}")
-            
-            # Verify llama_cpp functionality
-            if not hasattr(llama_cpp, 'Llama'):
-                app_logger.error("llama_cpp.Llama class not found!")
-            else:
-                app_logger.info("llama_cpp.Llama class verified")
-                
-            # Check for other major dependencies
-            import flask
-            app_logger.info(f"Flask version: {importlib.metadata.version('flask')}")
-            
-            import logging
-            app_logger.info(f"Python logging version: {logging.__version__}")
-            
-        except ImportError as e:
-            app_logger.error(f"Failed to import required library: {str(e)}")
-        except Exception as e:
-            app_logger.error(f"Error during library verification: {str(e)}")
+    if PROFILE_STARTUP:
+        # The server runs in the background without the reloader, which would start the application a second time
+        server_thread = threading.Thread(target=app.run, kwargs={'host': '127.0.0.1', 'port': 5000, 'threaded': True})
+        server_thread.daemon = True
+        server_thread.start()
+        profile_startup()
+        sys.exit(0)
     
-    # Ensure directories exist
-    os.makedirs(MODELS_DIR, exist_ok=True)
-    os.makedirs(CONVERSATIONS_DIR, exist_ok=True)
+    # Library verification doesn't hold up the server, it runs once the first page has been served
+    if True:  # Toggle for developers
+        verification_thread = threading.Thread(target=verify_libraries)
+        verification_thread.daemon = True
+        verification_thread.start()
     
     # Start a thread to trigger the first request if we're in packaged mode
     if is_packaged() and not os.environ.get('NO_BROWSER_OPEN'):
@@ -917,4 +1451,6 @@ if __name__ == '__main__':
         bootstrap_thread.start()
         app_logger.info("Bootstrap thread started")
     
-    app.run(host='127.0.0.1', port=5000, debug=True, threaded=True)
\ No newline at end of file
+    # The reloader restarts the whole application in a second process, in the packaged app that doubles startup time
+    # for no benefit as its code can't change
+    app.run(host='127.0.0.1', port=5000, debug=True, threaded=True, use_reloader=not is_packaged())
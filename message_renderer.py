@@ -0,0 +1,212 @@
+"""
+Message Renderer - Renders the markdown of messages to HTML with highlighted code, on the server.
+
+The web interface used to render every message it showed with marked and highlight.js, guessing the language of each
+code block in turn, which froze the page for seconds on long branches with a lot of code. Messages are rendered here
+instead, once, and the application keeps the HTML in a RenderCache shared by all conversations.
+
+- Markdown is rendered with markdown-it-py, CommonMark with GitHub's tables and strikethrough, like marked
+- Code blocks are highlighted with Pygments, blocks that don't name a language are only guessed from telltale text
+- Highlighted code uses highlight.js's class names and layout, so the interface's theme styles it as before
+- RenderCache keeps renderings across requests, bounded to the most recently used
+- Both libraries are optional, without them render_markdown returns None and the interface shows the message as plain text
+
+Usage:
+html = render_markdown(content)
+
+cache = RenderCache()
+html = cache.render((conversation_id, node_id, 'content'), content)
+
+"""
+
+import html
+import json
+import threading
+import importlib.util
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+# Checked without importing them, importing both takes longer than the rest of the application's startup. They are
+# imported when the first message is rendered
+RENDERER_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ('markdown_it', 'pygments'))
+
+# Languages a code block that doesn't name one may be recognised as, the ones commonly written in chats. Only each
+# language's quick check for telltale text (e.g. a shebang or <!DOCTYPE>) is run, no code is lexed to guess, so blocks
+# without anything telltale are shown as plain text. Earlier languages win ties
+GUESSED_LANGUAGES = ('python', 'javascript', 'typescript', 'json', 'bash', 'html', 'xml', 'sql', 'java', 'c', 'cpp',
+                     'csharp', 'go', 'rust', 'ruby', 'php', 'kotlin', 'swift', 'yaml', 'ini', 'diff', 'markdown',
+                     'powershell', 'dockerfile', 'makefile', 'lua', 'perl', 'r')
+# Characters from the start of a block its language is guessed from
+GUESS_SAMPLE_LENGTH = 500
+# Renderings a RenderCache keeps by default, the least recently used are dropped beyond it
+RENDER_CACHE_SIZE = 4096
+
+_hljs_classes: Optional[Dict[object, str]] = None
+_token_classes: Dict[object, Optional[str]] = {}
+_guess_lexers = None
+_markdown = None
+
+# highlight.js classes for Pygments token types, a token without its own entry takes its parent's
+def _get_hljs_classes() -> Dict[object, str]:
+    global _hljs_classes
+    if _hljs_classes is None:
+        from pygments.token import Comment, Generic, Keyword, Name, Number, Operator, String
+        _hljs_classes = {
+            Keyword: 'hljs-keyword',
+            Keyword.Constant: 'hljs-literal',
+            Keyword.Type: 'hljs-type',
+            Name.Builtin: 'hljs-built_in',
+            Name.Builtin.Pseudo: 'hljs-variable language_',
+            Name.Function: 'hljs-title function_',
+            Name.Class: 'hljs-title class_',
+            Name.Exception: 'hljs-title class_',
+            Name.Namespace: 'hljs-title',
+            Name.Decorator: 'hljs-meta',
+            Name.Tag: 'hljs-name',
+            Name.Attribute: 'hljs-attr',
+            Name.Variable: 'hljs-variable',
+            Name.Constant: 'hljs-variable constant_',
+            String: 'hljs-string',
+            String.Regex: 'hljs-regexp',
+            String.Escape: 'hljs-char escape_',
+            String.Interpol: 'hljs-subst',
+            Number: 'hljs-number',
+            Comment: 'hljs-comment',
+            Comment.Preproc: 'hljs-meta',
+            Operator: 'hljs-operator',
+            Operator.Word: 'hljs-keyword',
+            Generic.Deleted: 'hljs-deletion',
+            Generic.Inserted: 'hljs-addition',
+            Generic.Heading: 'hljs-section',
+            Generic.Subheading: 'hljs-section',
+            Generic.Emph: 'hljs-emphasis',
+            Generic.Strong: 'hljs-strong',
+            Generic.Prompt: 'hljs-meta',
+        }
+    return _hljs_classes
+
+def _token_class(token_type) -> Optional[str]:
+    if token_type not in _token_classes:
+        hljs_classes = _get_hljs_classes()
+        current = token_type
+        while current is not None and current not in hljs_classes:
+            current = current.parent
+        _token_classes[token_type] = hljs_classes.get(current) if current is not None else None
+    return _token_classes[token_type]
+
+# The lexer for a language recognised in some code, None if nothing in it gives a language away
+def _guess_lexer(code: str):
+    global _guess_lexers
+    from pygments.lexers import get_lexer_by_name
+    if _guess_lexers is None:
+        _guess_lexers = [get_lexer_by_name(language) for language in GUESSED_LANGUAGES]
+    # JSON looks much like object literals in other languages, but is cheap to recognise for certain
+    if code[:1] in ('{', '['):
+        try:
+            json.loads(code)
+            return get_lexer_by_name('json')
+        except ValueError:
+            pass
+    sample = code[:GUESS_SAMPLE_LENGTH]
+    best, best_score = None, 0.0
+    for lexer in _guess_lexers:
+        score = lexer.analyse_text(sample)
+        if score > best_score:
+            best, best_score = lexer, score
+    return best
+
+# The lexer for a code block and the language shown in its label. Blocks that name an unknown language, or none, have
+# their language guessed from the code
+def _find_lexer(code: str, language: str):
+    from pygments.lexers import get_lexer_by_name
+    from pygments.lexers.special import TextLexer
+    from pygments.util import ClassNotFound
+    if language:
+        try:
+            return get_lexer_by_name(language), language
+        except ClassNotFound:
+            pass
+    lexer = _guess_lexer(code)
+    if lexer is None:
+        return TextLexer(), language or "plaintext"
+    return lexer, language or lexer.aliases[0]
+
+# Highlight a code block into the same markup the interface builds with highlight.js, with its language label
+def _highlight_code(code: str, language: str, attributes: str = "") -> str:
+    code = code.strip()
+    language = language.strip()
+    lexer, label = _find_lexer(code, language)
+    # Neighbouring tokens of the same class share a span
+    runs = []
+    for token_type, value in lexer.get_tokens(code):
+        token_class = _token_class(token_type)
+        if runs and runs[-1][0] == token_class:
+            runs[-1][1].append(value)
+        else:
+            runs.append((token_class, [value]))
+    runs = [(token_class, ''.join(values)) for token_class, values in runs]
+    # Lexers end the code with a newline, the block doesn't
+    if runs and runs[-1][1].endswith('\n'):
+        runs[-1] = (runs[-1][0], runs[-1][1][:-1])
+    highlighted = ''.join(_span(token_class, text) for token_class, text in runs if text)
+    return (f'<pre><code class="hljs {html.escape(language)}">{highlighted}</code>'
+            f'<div class="language-label">Language: {html.escape(label)}</div></pre>')
+
+def _span(token_class: Optional[str], text: str) -> str:
+    text = html.escape(text, quote=False)
+    return f'<span class="{token_class}">{text}</span>' if token_class else text
+
+def _render_code_block(self, tokens, index, options, env) -> str:
+    return _highlight_code(tokens[index].content, "")
+
+def _get_markdown():
+    global _markdown
+    if _markdown is None:
+        from markdown_it import MarkdownIt
+        # Raw HTML is passed through and newlines inside a paragraph don't break the line, as with marked's defaults
+        markdown = MarkdownIt('commonmark', {'html': True, 'highlight': _highlight_code})
+        markdown.enable(['table', 'strikethrough'])
+        # Indented code blocks are highlighted like fenced ones
+        markdown.add_render_rule('code_block', _render_code_block)
+        _markdown = markdown
+    return _markdown
+
+# Render a message's markdown to HTML, None when the renderer's libraries aren't installed
+def render_markdown(text: str) -> Optional[str]:
+    if not RENDERER_AVAILABLE:
+        return None
+    return _get_markdown().render(text)
+
+# Renderings of message texts by a key of the caller's choosing, e.g. conversation, node and field. A rendering is only
+# returned while the text it was made from is unchanged, so an edited text is rendered again. Safe to use from several
+# threads, texts are rendered without holding the cache's lock
+class RenderCache:
+    def __init__(self, max_entries: int = RENDER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Hashable, Tuple[str, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    # The rendering of text, from the cache if it was rendered under this key before. None when the renderer's
+    # libraries aren't installed
+    def render(self, key: Hashable, text: str) -> Optional[str]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == text:
+                self._entries.move_to_end(key)
+                return cached[1]
+        html = render_markdown(text)
+        if html is not None:
+            self.store(key, text, html)
+        return html
+
+    # Keep html, already rendered from text, under key
+    def store(self, key: Hashable, text: str, html: str):
+        with self._lock:
+            self._entries[key] = (text, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
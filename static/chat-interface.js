@@ -0,0 +1,2020 @@
+const chatContainer = document.getElementById("chat-container");
+const userInput = document.getElementById("user-input");
+const inputContainer = document.getElementById("input-container");
+const messageBox = document.getElementById("message-box");
+const sendButton = document.getElementById("send-button");
+const modelSelect = document.getElementById("model-select");
+
+let currentModel = "";
+let currentConversationId = null;
+// Revision of the open conversation the shown branch was sent with
+let branchRevision = null;
+// Long branches are loaded a window of messages at a time, from the end. windowStart is the position of the
+// first shown message on the branch, the messages above it are loaded when the user scrolls up to them
+const BRANCH_WINDOW_SIZE = 50;
+let windowStart = 0;
+
+// The chat is a virtualized list. Every message shown in it is kept in chatMessages, in order, but only the ones near
+// the viewport have elements, the others are stood in for by two spacers sized with their heights. Heights are
+// measured when a message is rendered and kept, messages never rendered yet are estimated from the measured ones.
+// Loading, typing and planning indicators aren't part of the list, they are added after it.
+// Each entry is { message, isThought, element, height }, element is null while the message isn't rendered
+let chatMessages = [];
+// Pixels above and below the viewport in which messages are rendered, so scrolling shows them already laid out
+const RENDER_MARGIN = 1500;
+// Height assumed for messages before any has been measured
+const ESTIMATED_MESSAGE_HEIGHT = 150;
+// Kept rendered while its edit box is open, wherever the chat is scrolled
+let editingNodeId = null;
+const chatElementMessages = new WeakMap();
+const topSpacer = createMessageSpacer();
+const bottomSpacer = createMessageSpacer();
+chatContainer.append(topSpacer, bottomSpacer);
+let renderFrame = null;
+let measuredHeightTotal = 0;
+let measuredHeightCount = 0;
+
+function createMessageSpacer() {
+  const spacer = document.createElement("div");
+  spacer.classList.add("message-spacer");
+  return spacer;
+}
+
+// Remeasure rendered messages whose height changed, e.g. when a thought is expanded or an edit box opened
+const messageResizeObserver = new ResizeObserver((resized) => {
+  let changed = false;
+  resized.forEach(({ target }) => {
+    const entry = chatElementMessages.get(target);
+    if (entry && entry.element === target) {
+      changed = measureChatMessage(entry) || changed;
+    }
+  });
+  if (changed) scheduleChatRender();
+});
+
+// The vertical space a rendered message takes, its height and the margin and gap below it. Returns whether it changed
+function measureChatMessage(entry) {
+  // Not laid out, e.g. the chat is hidden
+  if (entry.element.offsetParent === null) return false;
+  const height =
+    entry.element.offsetHeight +
+    parseFloat(getComputedStyle(entry.element).marginBottom) +
+    parseFloat(getComputedStyle(chatContainer).rowGap || 0);
+  if (height === entry.height) return false;
+  if (entry.height === null) {
+    measuredHeightCount += 1;
+  } else {
+    measuredHeightTotal -= entry.height;
+  }
+  measuredHeightTotal += height;
+  entry.height = height;
+  return true;
+}
+
+function chatMessageHeight(entry) {
+  if (entry.height !== null) return entry.height;
+  return measuredHeightCount
+    ? measuredHeightTotal / measuredHeightCount
+    : ESTIMATED_MESSAGE_HEIGHT;
+}
+
+// The range of chatMessages within RENDER_MARGIN of the viewport, as [start, end)
+function visibleChatRange() {
+  const listTop =
+    topSpacer.getBoundingClientRect().top -
+    chatContainer.getBoundingClientRect().top +
+    chatContainer.scrollTop;
+  const top = chatContainer.scrollTop - listTop - RENDER_MARGIN;
+  const bottom =
+    chatContainer.scrollTop -
+    listTop +
+    chatContainer.clientHeight +
+    RENDER_MARGIN;
+  let start = chatMessages.length;
+  let end = chatMessages.length;
+  let offset = 0;
+  for (let i = 0; i < chatMessages.length; i++) {
+    if (offset >= bottom) {
+      end = i;
+      break;
+    }
+    offset += chatMessageHeight(chatMessages[i]);
+    if (start === chatMessages.length && offset > top) start = i;
+  }
+  if (start > end) start = end;
+  // The message being edited stays rendered
+  const editing = editingNodeId ? findChatMessageIndex(editingNodeId) : -1;
+  if (editing !== -1) {
+    start = Math.min(start, editing);
+    end = Math.max(end, editing + 1);
+  }
+  return [start, end];
+}
+
+// Render the messages near the viewport and remove the elements of those that moved away from it
+function renderChatMessages() {
+  const [start, end] = visibleChatRange();
+  chatMessages.forEach((entry, index) => {
+    if (entry.element && (index < start || index >= end)) {
+      measureChatMessage(entry);
+      messageResizeObserver.unobserve(entry.element);
+      entry.element.remove();
+      entry.element = null;
+    }
+  });
+  const created = [];
+  let next = bottomSpacer;
+  for (let i = end - 1; i >= start; i--) {
+    const entry = chatMessages[i];
+    if (!entry.element) {
+      entry.element = createMessageElement(
+        entry.message,
+        entry.isThought,
+        entry.message.expanded
+      );
+      chatElementMessages.set(entry.element, entry);
+      chatContainer.insertBefore(entry.element, next);
+      created.push(entry);
+    }
+    next = entry.element;
+  }
+  let above = 0;
+  let below = 0;
+  chatMessages.forEach((entry, index) => {
+    if (index < start) above += chatMessageHeight(entry);
+    else if (index >= end) below += chatMessageHeight(entry);
+  });
+  topSpacer.style.height = `${above}px`;
+  bottomSpacer.style.height = `${below}px`;
+  created.forEach((entry) => {
+    measureChatMessage(entry);
+    messageResizeObserver.observe(entry.element);
+    if (!entry.isThought) showSiblingPosition(entry);
+  });
+  if (created.length) {
+    // Quick way to apply the disabled state to all new elements correctly
+    setWaitingState(isWaitingForResponse);
+  }
+}
+
+function scheduleChatRender() {
+  if (renderFrame !== null) return;
+  renderFrame = requestAnimationFrame(() => {
+    renderFrame = null;
+    renderChatMessages();
+  });
+}
+
+// Render the chat scrolled to its end. Heights estimated for messages that come into view are corrected once they
+// are rendered, so this settles in a few passes
+function scrollChatToBottom() {
+  for (let pass = 0; pass < 3; pass++) {
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+    renderChatMessages();
+  }
+  chatContainer.scrollTop = chatContainer.scrollHeight;
+}
+
+chatContainer.addEventListener("scroll", scheduleChatRender);
+
+// Heights change with the width of the chat, the ones measured for messages that aren't rendered become estimates again
+window.addEventListener("resize", () => {
+  chatMessages.forEach((entry) => {
+    if (!entry.element && entry.height !== null) {
+      measuredHeightTotal -= entry.height;
+      measuredHeightCount -= 1;
+      entry.height = null;
+    }
+  });
+  scheduleChatRender();
+});
+
+function findChatMessageIndex(id) {
+  for (let i = chatMessages.length - 1; i >= 0; i--) {
+    if (chatMessages[i].message.id === id) return i;
+  }
+  return -1;
+}
+
+function findChatMessage(id) {
+  const index = findChatMessageIndex(id);
+  return index === -1 ? null : chatMessages[index];
+}
+
+function forgetChatMessages(entries) {
+  entries.forEach((entry) => {
+    if (entry.element) {
+      messageResizeObserver.unobserve(entry.element);
+      entry.element.remove();
+    }
+    if (entry.height !== null) {
+      measuredHeightTotal -= entry.height;
+      measuredHeightCount -= 1;
+    }
+  });
+}
+
+// Remove the messages from index to the end of the chat
+function removeChatMessagesFrom(index) {
+  forgetChatMessages(chatMessages.splice(index));
+  scheduleChatRender();
+}
+
+// Remove a single message from the chat, if it is shown
+function removeChatMessage(id) {
+  const index = findChatMessageIndex(id);
+  if (index === -1) return;
+  forgetChatMessages(chatMessages.splice(index, 1));
+  scheduleChatRender();
+}
+
+// Empty the chat, indicators and the load earlier button included
+function clearChat() {
+  forgetChatMessages(chatMessages);
+  chatMessages = [];
+  editingNodeId = null;
+  chatContainer.innerHTML = "";
+  chatContainer.append(topSpacer, bottomSpacer);
+  topSpacer.style.height = "0px";
+  bottomSpacer.style.height = "0px";
+}
+
+// The list entries for a message, its internal thought first if it has one
+function chatEntries(message) {
+  const entries = [];
+  if (
+    message.sender === "AI" &&
+    (message.internal_monologue || message.has_internal_monologue)
+  ) {
+    // Create a thought message, its content is fetched when expanded if it wasn't sent
+    entries.push({
+      message: {
+        id: "thought-" + message.id,
+        content: message.internal_monologue ?? null,
+        html: message.internal_monologue_html,
+        sender: "AI",
+        timestamp: message.timestamp,
+        model_name: message.model_name,
+      },
+      isThought: true,
+      element: null,
+      height: null,
+    });
+  }
+  entries.push({ message, isThought: false, element: null, height: null });
+  return entries;
+}
+
+// Messages of the branch shown in the chat, without internal thoughts and system messages
+function shownBranchMessages() {
+  return chatMessages
+    .filter((entry) => !entry.isThought && entry.message.sender !== "System")
+    .map((entry) => entry.message);
+}
+
+// What this page already shows of a conversation, so the server only sends what changed since
+function knownBranch(conversationId) {
+  const shown = shownBranchMessages();
+  if (conversationId !== currentConversationId || shown.length === 0) {
+    return {};
+  }
+  const known = { known_leaf: shown[shown.length - 1].id };
+  if (branchRevision !== null) known.revision = branchRevision;
+  return known;
+}
+
+// Show a branch sent by the server. With keep, the first keep messages of the branch are still shown and only the
+// messages after them are sent. Otherwise the branch is a window of its last messages, starting at data.start.
+// Returns false if the shown messages no longer match and the branch has to be loaded again
+function showBranch(data) {
+  if (data.keep === undefined) {
+    clearChat();
+    windowStart = data.start ?? 0;
+    showLoadEarlierButton(data.earlier_cursor);
+  } else {
+    const keep = data.keep - windowStart;
+    const shown = shownBranchMessages();
+    if (keep < 0 || shown.length < keep || (keep === 0 && windowStart > 0)) {
+      return false;
+    }
+    if (keep === 0) {
+      clearChat();
+    } else {
+      clearMessagesBelow(shown[keep - 1].id);
+    }
+  }
+  addMessages(data.branch);
+  branchRevision = data.revision ?? null;
+  return true;
+}
+
+// The button above the shown messages that loads the ones above them, cursor is where they continue from
+function showLoadEarlierButton(cursor) {
+  const existing = chatContainer.querySelector(".load-earlier-button");
+  if (existing) existing.remove();
+  if (!cursor) return;
+  const button = document.createElement("button");
+  button.classList.add("load-earlier-button");
+  button.textContent = "Load earlier messages";
+  button.dataset.cursor = cursor;
+  button.addEventListener("click", loadEarlierMessages);
+  chatContainer.prepend(button);
+}
+
+async function loadEarlierMessages() {
+  const button = chatContainer.querySelector(".load-earlier-button");
+  if (!button || button.disabled) return;
+  button.disabled = true;
+  try {
+    const response = await fetch(
+      "/conversations/current/branch?" +
+        new URLSearchParams({
+          before: button.dataset.cursor,
+          limit: BRANCH_WINDOW_SIZE,
+          monologues: 0,
+        })
+    );
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.error || "Failed to load earlier messages");
+    }
+    prependMessages(data.branch);
+    windowStart = data.start;
+    showLoadEarlierButton(data.earlier_cursor);
+  } catch (error) {
+    console.error("Error loading earlier messages:", error);
+    button.disabled = false;
+  }
+}
+
+chatContainer.addEventListener("scroll", () => {
+  if (chatContainer.scrollTop < 100) loadEarlierMessages();
+});
+
+// Fetch an internal monologue left out of a branch when it is first expanded, it is kept with the thought message
+async function loadInternalMonologue(message, thoughtContent) {
+  try {
+    const response = await fetch("/message/get_internal_monologue", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ node_id: message.id.replace(/^thought-/, "") }),
+    });
+    const data = await response.json();
+    if (!data.success) {
+      throw new Error(data.error || "Failed to load planning");
+    }
+    message.content = data.internal_monologue || "";
+    message.html = data.html;
+    thoughtContent.innerHTML = formatMessage(message.content, message.html);
+  } catch (error) {
+    console.error("Error loading internal monologue:", error);
+    thoughtContent.dataset.pending = "true";
+  }
+}
+
+async function loadConversation(conversationId, reuseShown = true) {
+  try {
+    const known = reuseShown ? knownBranch(conversationId) : {};
+    const response = await fetch(`/conversations/switch`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        id: conversationId,
+        ...known,
+        limit: BRANCH_WINDOW_SIZE,
+        monologues: false,
+      }),
+    });
+    const data = await response.json();
+    if (data.success) {
+      if (!showBranch(data)) {
+        return loadConversation(conversationId, false);
+      }
+      currentConversationId = data.conversation_id;
+      highlightActiveConversation();
+
+      // Display version warning if present
+      if (data.version_warning) {
+        addMessage({
+          id: "version-warning-" + Date.now().toString(),
+          content: data.version_warning,
+          sender: "System",
+          timestamp: new Date().toISOString(),
+        });
+      }
+    } else {
+      // Handle conversation loading failure
+      addMessage({
+        id: "error-" + Date.now().toString(),
+        content: data.error || "Failed to load conversation",
+        sender: "System",
+        timestamp: new Date().toISOString(),
+      });
+    }
+  } catch (error) {
+    console.error("Error loading conversation:", error);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error loading conversation:" + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+}
+
+function createMessageElement(
+  message,
+  isThought = false,
+  isExpanded = false
+) {
+  const messageContainer = document.createElement("div");
+  messageContainer.classList.add(
+    "message-container",
+    `${message.sender.toLowerCase()}-message-container`
+  );
+  messageContainer.dataset.nodeId = message.id;
+
+  if (isThought) {
+    const messageElement = document.createElement("div");
+    messageElement.classList.add("message", "ai-thought-message");
+
+    // Create collapsible thought element
+    const thoughtContainer = document.createElement("div");
+    thoughtContainer.classList.add("ai-thought-container");
+    thoughtContainer.style.marginBottom = "0";
+
+    const thoughtHeader = document.createElement("div");
+    thoughtHeader.classList.add("ai-thought-header");
+    thoughtHeader.innerHTML =
+      '💡︎ <span>AI Planning</span> <span class="thought-toggle-icon">' +
+      (isExpanded ? "▲" : "▼") +
+      "</span>";
+
+    const thoughtContent = document.createElement("div");
+    thoughtContent.classList.add("ai-thought-content");
+    const content = message.content;
+    if (content === null) {
+      // Left out of the branch, fetched when first expanded
+      thoughtContent.dataset.pending = "true";
+    } else {
+      thoughtContent.innerHTML = formatMessage(content, message.html);
+    }
+
+    if (!isExpanded) {
+      thoughtContent.style.display = "none";
+    }
+
+    thoughtHeader.addEventListener("click", () => {
+      const isHidden = thoughtContent.style.display === "none";
+      thoughtContent.style.display = isHidden ? "block" : "none";
+      message.expanded = isHidden;
+      thoughtHeader.querySelector(".thought-toggle-icon").textContent =
+        isHidden ? "▲" : "▼";
+      if (isHidden && thoughtContent.dataset.pending) {
+        delete thoughtContent.dataset.pending;
+        loadInternalMonologue(message, thoughtContent);
+      }
+    });
+
+    thoughtContainer.appendChild(thoughtHeader);
+    thoughtContainer.appendChild(thoughtContent);
+    messageElement.appendChild(thoughtContainer);
+    messageContainer.appendChild(messageElement);
+
+    return messageContainer;
+  }
+
+  // Normal message handling (non-thought)
+  const messageElement = document.createElement("div");
+  messageElement.classList.add(
+    "message",
+    `${message.sender.toLowerCase()}-message`
+  );
+
+  // Special handling for System messages - classify as error or information
+  if (message.sender === "System") {
+    const lowerContent = message.content.toLowerCase();
+    const errorPatterns = [
+      "error",
+      "failed",
+      "fail",
+      "not found",
+      "cannot",
+      "unable to",
+      "missing",
+      "invalid",
+    ];
+
+    // Check if message content contains any error patterns
+    const isErrorMessage = errorPatterns.some((pattern) =>
+      lowerContent.includes(pattern)
+    );
+
+    if (isErrorMessage) {
+      // Use error-message class for error messages
+      messageElement.classList.remove("system-message");
+      messageElement.classList.add("error-message");
+    }
+  }
+
+  // Add version-warning class for system messages about version warnings
+  if (
+    message.sender === "System" &&
+    message.content.includes("version")
+  ) {
+    messageElement.classList.add("version-warning");
+  }
+
+  messageElement.innerHTML = formatMessage(message.content, message.html);
+  messageContainer.appendChild(messageElement);
+
+  // Don't add info element for thought messages
+  const infoElement = document.createElement("div");
+  infoElement.classList.add(
+    "message-info",
+    `${message.sender.toLowerCase()}-info`
+  );
+
+  const timestamp = message.timestamp
+    ? message.timestamp
+    : new Date().toISOString();
+  infoElement.appendChild(createTimestampElement(timestamp));
+
+  if (message.sender != "System") {
+    if (message.sender === "AI") {
+      infoElement.appendChild(createSeparator());
+      infoElement.appendChild(createModelNameElement(message.model_name));
+    }
+
+    infoElement.appendChild(createSeparator());
+    const iconContainer = document.createElement("div");
+    iconContainer.classList.add("message-icon-container");
+
+    if (message.sender === "AI") {
+      iconContainer.appendChild(createRegenerateIcon(messageContainer));
+    }
+    iconContainer.appendChild(createEditIcon(messageContainer));
+    iconContainer.appendChild(createCopyIcon(messageContainer));
+    iconContainer.appendChild(createNavArrow("left", messageContainer));
+    iconContainer.appendChild(createSiblingPosition());
+    iconContainer.appendChild(createNavArrow("right", messageContainer));
+
+    infoElement.appendChild(iconContainer);
+  }
+  messageContainer.appendChild(infoElement);
+
+  return messageContainer;
+}
+
+function createSeparator() {
+  const separator = document.createElement("span");
+  separator.classList.add("message-separator");
+  separator.textContent = "\u00A0| ";
+  return separator;
+}
+
+function createTimestampElement(timestamp) {
+  const timestampElement = document.createElement("span");
+  timestampElement.classList.add("timestamp");
+  timestampElement.textContent = new Date(timestamp)
+    .toLocaleString()
+    .replace(",", " |");
+  return timestampElement;
+}
+
+function createModelNameElement(modelName) {
+  const fragment = document.createDocumentFragment();
+
+  // Add a space character, to separate the model name from the previous element
+  const spaceElement = document.createTextNode("\u00A0");
+  fragment.appendChild(spaceElement);
+
+  if (modelName) {
+    const modelElement = document.createElement("span");
+    modelElement.classList.add("model-name");
+    modelElement.textContent = `Model: ${modelName}`;
+    fragment.appendChild(modelElement);
+  }
+
+  return fragment;
+}
+
+function createEditIcon(messageContainer) {
+  const editIcon = document.createElement("span");
+  editIcon.classList.add("message-icon", "edit-icon");
+  editIcon.title = "Edit message";
+  editIcon.innerHTML =
+    '<svg viewBox="0 0 24 24"><path d="M3 17.25V21h3.75L17.81 9.94l-3.75-3.75L3 17.25zM20.71 7.04c.39-.39.39-1.02 0-1.41l-2.34-2.34c-.39-.39-1.02-.39-1.41 0l-1.83 1.83 3.75 3.75 1.83-1.83z"/></svg>';
+  editIcon.addEventListener("click", () => editMessage(messageContainer));
+  return editIcon;
+}
+
+function createNavArrow(direction, messageContainer) {
+  const arrow = document.createElement("span");
+  arrow.classList.add("message-icon", "nav-arrow", `${direction}-arrow`);
+  arrow.title =
+    direction === "left" ? "Previous version" : "Next version";
+  arrow.innerHTML =
+    direction === "left"
+      ? '<svg viewBox="0 0 24 24"><path d="M20 11H7.83l5.59-5.59L12 4l-8 8 8 8 1.41-1.41L7.83 13H20v-2z"/></svg>'
+      : '<svg viewBox="0 0 24 24"><path d="M12 4l-1.41 1.41L16.17 11H4v2h12.17l-5.58 5.59L12 20l8-8-8-8z"/></svg>';
+  arrow.addEventListener("click", () =>
+    navigateBranch(messageContainer, direction)
+  );
+  return arrow;
+}
+
+// Shows "i / n" between the branch arrows when a message has other versions
+function createSiblingPosition() {
+  const position = document.createElement("span");
+  position.classList.add("sibling-position", "hidden");
+  return position;
+}
+
+function createRegenerateIcon(messageContainer) {
+  const regenerateIcon = document.createElement("span");
+  regenerateIcon.classList.add("message-icon", "regenerate-icon");
+  regenerateIcon.title = "Regenerate response";
+  regenerateIcon.innerHTML =
+    '<svg viewBox="0 0 24 24"><path d="M17.65 6.35C16.2 4.9 14.21 4 12 4c-4.42 0-7.99 3.58-7.99 8s3.57 8 7.99 8c3.73 0 6.84-2.55 7.73-6h-2.08c-.82 2.33-3.04 4-5.65 4-3.31 0-6-2.69-6-6s2.69-6 6-6c1.66 0 3.14.69 4.22 1.78L13 11h7V4l-2.35 2.35z"/></svg>';
+  regenerateIcon.addEventListener("click", () =>
+    regenerateResponse(messageContainer)
+  );
+  return regenerateIcon;
+}
+
+function createCopyIcon(messageContainer) {
+  const copyIcon = document.createElement("span");
+  copyIcon.classList.add("message-icon", "copy-icon");
+  copyIcon.title = "Copy message";
+  copyIcon.innerHTML =
+    '<svg viewBox="0 0 24 24"><path d="M16 1H4c-1.1 0-2 .9-2 2v14h2V3h12V1zm3 4H8c-1.1 0-2 .9-2 2v14c0 1.1.9 2 2 2h11c1.1 0 2-.9 2-2V7c0-1.1-.9-2-2-2zm0 16H8V7h11v14z"/></svg>';
+  copyIcon.addEventListener("click", () => copyMessage(messageContainer));
+  return copyIcon;
+}
+
+async function copyMessage(messageContainer) {
+  const nodeId = messageContainer.dataset.nodeId;
+  try {
+    const response = await fetch("/message/get_original_content", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ node_id: nodeId }),
+    });
+    const data = await response.json();
+
+    if (data.success) {
+      await navigator.clipboard.writeText(data.content);
+      showCopiedNotice(messageContainer);
+    } else {
+      console.error("Failed to get original content");
+    }
+  } catch (error) {
+    console.error("Error copying message:", error);
+  }
+}
+
+function showCopiedNotice(messageContainer) {
+  const notice = document.createElement("div");
+  notice.classList.add("copied-notice");
+  notice.textContent = "Copied to clipboard!";
+  messageContainer.appendChild(notice);
+  setTimeout(() => {
+    notice.classList.add("fade-out");
+    setTimeout(() => notice.remove(), 500);
+  }, 2500);
+}
+
+// A message's markdown rendered to HTML. Messages from the server come rendered in html, it is used as is.
+// Without it, when the server lacks markdown-it-py or Pygments, the message is shown as plain text
+function formatMessage(content, html = null) {
+  if (html != null) {
+    return html;
+  }
+  const escaped = content
+    .replace(/&/g, "&amp;")
+    .replace(/</g, "&lt;")
+    .replace(/>/g, "&gt;");
+  return `<p class="plain-text">${escaped}</p>`;
+}
+
+// Add messages at the end of the chat and scroll down to them
+function addMessages(messages) {
+  messages.forEach((message) => chatMessages.push(...chatEntries(message)));
+  scrollChatToBottom();
+  messages.forEach((message) => {
+    if (message.sender !== "System" && message.sibling_count === undefined) {
+      updateSiblingArrows(message.id);
+    }
+  });
+}
+
+function addMessage(message) {
+  addMessages([message]);
+}
+
+// Add earlier messages above the ones shown, which stay where they are on screen
+function prependMessages(messages) {
+  const entries = messages.flatMap(chatEntries);
+  const previousHeight = chatContainer.scrollHeight;
+  chatMessages.unshift(...entries);
+  renderChatMessages();
+  chatContainer.scrollTop += chatContainer.scrollHeight - previousHeight;
+  renderChatMessages();
+}
+
+// Show the branch arrows and position of a message. Messages from the server carry their sibling position,
+// the siblings are only requested for messages that don't, and the position is kept with the message
+async function updateSiblingArrows(nodeId) {
+  const entry = findChatMessage(nodeId);
+  if (!entry || entry.message.sender === "System") return;
+  const message = entry.message;
+
+  try {
+    if (message.sibling_count === undefined) {
+      const response = await fetch("/conversations/get_siblings", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ node_id: nodeId }),
+      });
+      const data = await response.json();
+
+      const siblings = data.siblings;
+      message.sibling_index = siblings.findIndex(
+        (sibling) => sibling.id === nodeId
+      );
+      message.sibling_count = siblings.length;
+    }
+    showSiblingPosition(entry);
+  } catch (error) {
+    console.error("Error updating sibling arrows:", error);
+  }
+}
+
+// Show a message's sibling position on its element, if it is rendered and the position is known
+function showSiblingPosition(entry) {
+  const message = entry.message;
+  if (
+    !entry.element ||
+    message.sender === "System" ||
+    message.sibling_count === undefined
+  ) {
+    return;
+  }
+  const currentIndex = message.sibling_index;
+  const siblingCount = message.sibling_count;
+  const leftArrow = entry.element.querySelector(".left-arrow");
+  const rightArrow = entry.element.querySelector(".right-arrow");
+  const position = entry.element.querySelector(".sibling-position");
+
+  leftArrow.classList.toggle("hidden", currentIndex === 0);
+  rightArrow.classList.toggle("hidden", currentIndex === siblingCount - 1);
+  position.textContent = `${currentIndex + 1} / ${siblingCount}`;
+  position.classList.toggle("hidden", siblingCount < 2);
+}
+
+async function editMessage(messageContainer) {
+  if (isWaitingForResponse) return;
+
+  const messageElement = messageContainer.querySelector(".message");
+  const nodeId = messageContainer.dataset.nodeId;
+  const isHumanMessage = messageContainer.classList.contains(
+    "human-message-container"
+  );
+
+  const originalHeight = messageElement.offsetHeight;
+  const originalWidth = messageElement.offsetWidth;
+
+  try {
+    const response = await fetch("/message/get_original_content", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ node_id: nodeId }),
+    });
+    const data = await response.json();
+
+    if (data.success) {
+      const originalContent = data.content;
+      // Shown again as it was when the edit is cancelled or fails
+      const originalHtml = messageElement.innerHTML;
+      editingNodeId = nodeId;
+
+      messageElement.innerHTML = `
+          <textarea class="edit-message-input">${originalContent}</textarea>
+          <div class="edit-controls">
+              <button class="button cancel-edit">Cancel</button>
+              <button class="button submit-edit">Submit</button>
+          </div>
+      `;
+
+      const textarea = messageElement.querySelector(
+        ".edit-message-input"
+      );
+      textarea.style.height = `${originalHeight}px`;
+      textarea.style.width = `${originalWidth}px`;
+      const cancelButton = messageElement.querySelector(".cancel-edit");
+      const submitButton = messageElement.querySelector(".submit-edit");
+
+      function cancelEdit() {
+        editingNodeId = null;
+        messageElement.innerHTML = originalHtml;
+      }
+
+      cancelButton.addEventListener("click", cancelEdit);
+
+      textarea.addEventListener("keydown", (e) => {
+        if (e.key === "Enter" && !e.shiftKey) {
+          e.preventDefault();
+          submitButton.click();
+        } else if (e.key === "Escape") {
+          e.preventDefault();
+          cancelEdit();
+        }
+      });
+
+      submitButton.addEventListener("click", async () => {
+        setWaitingState(isHumanMessage);
+
+        const newContent = textarea.value;
+        try {
+          // If this is an AI message, we need to remove any associated thought message first
+          if (!isHumanMessage) {
+            // Check if there's an associated thought message (with ID "thought-" + nodeId), if so, remove it
+            removeChatMessage("thought-" + nodeId);
+          }
+
+          const editResponse = await fetch("/message/edit", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({
+              node_id: nodeId,
+              new_content: newContent,
+              sender: isHumanMessage ? "Human" : "AI",
+            }),
+          });
+          const editData = await editResponse.json();
+          if (editData.success) {
+            editingNodeId = null;
+            // The edit is a new message in place of the old one, its sibling position is requested again
+            const editedEntry = findChatMessage(nodeId);
+            if (editedEntry) {
+              Object.assign(editedEntry.message, {
+                id: editData.new_node_id,
+                content: newContent,
+                html: editData.html,
+                timestamp: editData.timestamp,
+                internal_monologue: null,
+                has_internal_monologue: false,
+                sibling_index: undefined,
+                sibling_count: undefined,
+              });
+            }
+            messageContainer.dataset.nodeId = editData.new_node_id;
+            messageElement.innerHTML = formatMessage(
+              newContent,
+              editData.html
+            );
+            updateSiblingArrows(editData.new_node_id);
+            moveConversationToTop(currentConversationId);
+            clearMessagesBelow(editData.new_node_id);
+
+            if (isHumanMessage) {
+              // Check if a model is selected before requesting an AI response
+              if (!currentModel || currentModel.trim() === "") {
+                addMessage({
+                  id: Date.now().toString(),
+                  content:
+                    "Please select an AI model from the dropdown menu to generate a response to your edited message.",
+                  sender: "System",
+                  timestamp: new Date().toISOString(),
+                });
+                return; // Skip generating AI response
+              }
+
+              const aiResponse = await fetch(
+                "/conversation/get_ai_response",
+                {
+                  method: "POST",
+                  headers: { "Content-Type": "application/json" },
+                  body: JSON.stringify({
+                    conversation_id: currentConversationId,
+                    model: currentModel,
+                  }),
+                }
+              );
+
+              const reader = aiResponse.body.getReader();
+              const decoder = new TextDecoder();
+
+              while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                const chunk = decoder.decode(value);
+                const data = JSON.parse(chunk);
+
+                if (data.status === "loading_model") {
+                  showLoadingMessage("Loading AI model...");
+                } else if (data.status === "generating") {
+                  removeLoadingMessage();
+                  showTypingIndicator();
+                } else if (data.status === "complete") {
+                  removeTypingIndicator();
+                  addMessage({
+                    id: data.node_id,
+                    content: data.response,
+                    html: data.html,
+                    sender: "AI",
+                    timestamp: data.timestamp,
+                    model_name: currentModel,
+                  });
+                }
+              }
+            }
+          } else {
+            throw new Error(editData.error || "Failed to edit message");
+          }
+        } catch (error) {
+          console.error("Error editing message:", error);
+          editingNodeId = null;
+          messageElement.innerHTML = originalHtml;
+          addMessage({
+            id: Date.now().toString(),
+            content: "Error editing message: " + error.message,
+            sender: "System",
+            timestamp: null,
+          });
+        } finally {
+          removeTypingIndicator();
+          setWaitingState(false);
+        }
+      });
+
+      textarea.focus();
+    } else {
+      throw new Error(data.error || "Failed to get original content");
+    }
+  } catch (error) {
+    console.error("Error preparing message for editing: ", error);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error preparing message for editing: " + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+}
+
+async function regenerateResponse(messageContainer) {
+  const nodeId = messageContainer.dataset.nodeId;
+
+  // Check if a model is selected
+  if (!currentModel || currentModel.trim() === "") {
+    addMessage({
+      id: Date.now().toString(),
+      content:
+        "Please select an AI model from the dropdown menu before regenerating a response.",
+      sender: "System",
+      timestamp: new Date().toISOString(),
+    });
+    return; // Exit the function early without removing the message
+  }
+
+  // Remove the AI message with its thought, and the messages below it which aren't on the new branch
+  removeMessagesFrom(nodeId);
+
+  setWaitingState(true);
+
+  try {
+    const response = await fetch("/message/regenerate", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        node_id: nodeId,
+        model: currentModel,
+        planning_mode: planningModeEnabled,
+      }),
+    });
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+
+    // Track if we've displayed a thought message that we might need to remove
+    let displayedThoughtId = null;
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      const chunk = decoder.decode(value);
+      const data = JSON.parse(chunk);
+
+      if (data.status === "loading_model") {
+        showLoadingMessage("Loading AI model...");
+      } else if (data.status === "generating") {
+        removeLoadingMessage();
+        showTypingIndicator();
+      } else if (data.status === "planning") {
+        removeLoadingMessage();
+        removeTypingIndicator();
+
+        // Create a temporary thought message ID
+        displayedThoughtId = "planning-" + Date.now().toString();
+
+        // Add the thought as an AI thought message
+        const thoughtElement = createMessageElement(
+          {
+            id: displayedThoughtId,
+            content: data.planning,
+            html: data.planning_html,
+            sender: "AI",
+            timestamp: data.timestamp,
+            model_name: currentModel,
+          },
+          true, // Is thought message
+          true // Is expanded
+        );
+
+        chatContainer.appendChild(thoughtElement);
+        chatContainer.scrollTop = chatContainer.scrollHeight;
+
+        showTypingIndicator();
+      } else if (data.status === "complete") {
+        removeTypingIndicator();
+        setWaitingState(false);
+
+        // Remove the temporary thought display since it will be re-added by addMessage
+        if (displayedThoughtId) {
+          const previousThought = document.querySelector(
+            `[data-node-id="${displayedThoughtId}"]`
+          );
+          if (previousThought) {
+            previousThought.remove();
+          }
+        }
+
+        // Add the complete message with internal_monologue included
+        addMessage({
+          id: data.node_id,
+          content: data.response,
+          html: data.html,
+          sender: "AI",
+          timestamp: data.timestamp,
+          model_name: currentModel,
+          internal_monologue: planningModeEnabled ? data.planning : null,
+          internal_monologue_html: planningModeEnabled
+            ? data.planning_html
+            : null,
+        });
+      } else if (data.status === "error") {
+        throw new Error(data.message);
+      }
+    }
+  } catch (error) {
+    console.error("Error regenerating response:", error);
+    removeTypingIndicator();
+    setWaitingState(false);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error regenerating response: " + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+}
+
+function clearMessagesBelow(nodeId) {
+  const index = findChatMessageIndex(nodeId);
+  if (index !== -1) {
+    removeChatMessagesFrom(index + 1);
+  }
+}
+
+// Remove a message, its internal thought and every message below it
+function removeMessagesFrom(nodeId) {
+  let index = findChatMessageIndex(nodeId);
+  if (index === -1) return;
+  const previous = chatMessages[index - 1];
+  if (previous && previous.message.id === "thought-" + nodeId) {
+    index -= 1;
+  }
+  removeChatMessagesFrom(index);
+}
+
+async function navigateBranch(messageContainer, direction) {
+  try {
+    const response = await fetch("/conversation/switch_branch", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        node_id: messageContainer.dataset.nodeId,
+        direction: direction,
+      }),
+    });
+    const data = await response.json();
+    if (data.success) {
+      // Only the switched message and the messages below it changed, replace those in place
+      removeMessagesFrom(data.replaced_node_id);
+      addMessages(data.branch);
+      branchRevision = data.revision;
+    } else {
+      throw new Error(data.error || "Failed to switch branch");
+    }
+  } catch (error) {
+    console.error("Error navigating branch:", error);
+  }
+}
+
+let isWaitingForResponse = false;
+
+function setWaitingState(waiting) {
+  isWaitingForResponse = waiting;
+  document
+    .querySelectorAll(
+      ".conversation-item, .edit-icon, .nav-arrow, #send-button, #new-chat-button"
+    )
+    .forEach((el) => {
+      el.disabled = waiting;
+      if (waiting && !el.classList.contains("disabled")) {
+        el.classList.add("disabled");
+      } else if (!waiting) {
+        el.classList.remove("disabled");
+      }
+    });
+}
+
+// let firstMessageTimer;
+let isFirstMessage = true;
+
+async function sendMessage() {
+  if (isWaitingForResponse) return;
+  const message = userInput.value.trim();
+  if (message) {
+    // Check if a model is selected
+    if (!currentModel || currentModel.trim() === "") {
+      addMessage({
+        id: Date.now().toString(),
+        content:
+          "Please select an AI model from the dropdown menu before sending a message.",
+        sender: "System",
+        timestamp: new Date().toISOString(),
+      });
+      return; // Exit the function early without clearing the message
+    }
+
+    setWaitingState(true);
+    userInput.value = "";
+    userInput.style.height = "auto";
+
+    try {
+      console.log(currentModel);
+      // First request: Add user message to conversation
+      const userResponse = await fetch("/conversation/add_user_message", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          message: message,
+          model: currentModel,
+          session_prompt: currentSessionPrompt,
+          planning_mode: planningModeEnabled,
+        }),
+      });
+
+      const reader = userResponse.body.getReader();
+      const decoder = new TextDecoder();
+
+      var humanData = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        const chunk = decoder.decode(value);
+        humanData = JSON.parse(chunk);
+
+        if (humanData.status === "creating_conversation") {
+          showLoadingMessage("Creating new conversation...");
+          isFirstMessage = true;
+        } else if (humanData.status === "loading_model") {
+          showLoadingMessage("Loading AI model...");
+        } else if (humanData.status === "error") {
+          throw new Error(humanData.message || "Failed to load AI model");
+        } else if (humanData.status === "complete") {
+          removeLoadingMessage();
+          addMessage({
+            id: humanData.human_node_id,
+            content: message,
+            html: humanData.html,
+            sender: "Human",
+            timestamp: humanData.timestamp,
+          });
+          currentConversationId = humanData.conversation_id;
+          loadConversations();
+        }
+      }
+
+      if (humanData.status === "complete") {
+        const aiResponse = await fetch("/conversation/get_ai_response", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            conversation_id: humanData.conversation_id,
+            model: currentModel,
+            planning_mode: planningModeEnabled,
+          }),
+        });
+
+        const aireader = aiResponse.body.getReader();
+        const aidecoder = new TextDecoder();
+
+        // Track if we've displayed a thought message that we might need to remove
+        let displayedThoughtId = null;
+
+        while (true) {
+          const { done, value } = await aireader.read();
+          if (done) break;
+          const chunk = aidecoder.decode(value);
+          const aiData = JSON.parse(chunk);
+
+          if (aiData.status === "loading_model") {
+            showLoadingMessage("Loading AI model...");
+          } else if (aiData.status === "generating") {
+            removeLoadingMessage();
+            showTypingIndicator();
+            if (isFirstMessage) {
+              startFirstMessageTimer();
+              isFirstMessage = false;
+            }
+          } else if (aiData.status === "planning") {
+            removeLoadingMessage();
+            removeTypingIndicator();
+
+            // Remove previous thought message if it exists
+            if (displayedThoughtId) {
+              const previousThought = document.querySelector(
+                `[data-node-id="${displayedThoughtId}"]`
+              );
+              if (previousThought) {
+                previousThought.remove();
+              }
+            }
+
+            // Create a temporary thought message ID
+            displayedThoughtId = "planning-" + Date.now().toString();
+
+            // Add the thought as an AI thought message instead of a system message
+            const thoughtElement = createMessageElement(
+              {
+                id: displayedThoughtId,
+                content: aiData.planning,
+                html: aiData.planning_html,
+                sender: "AI",
+                timestamp: aiData.timestamp,
+                model_name: currentModel,
+              },
+              true, // Is thought message
+              true // Is expanded
+            );
+
+            chatContainer.appendChild(thoughtElement);
+            chatContainer.scrollTop = chatContainer.scrollHeight;
+
+            showTypingIndicator();
+          } else if (aiData.status === "complete") {
+            clearFirstMessageTimer();
+            removeTypingIndicator();
+            removeLoadingMessage();
+
+            // Remove the temporary thought display since it will be re-added by addMessage
+            if (displayedThoughtId) {
+              const previousThought = document.querySelector(
+                `[data-node-id="${displayedThoughtId}"]`
+              );
+              if (previousThought) {
+                previousThought.remove();
+              }
+            }
+
+            // Add the complete AI message with internal_monologue included
+            addMessage({
+              id: aiData.node_id,
+              content: aiData.response,
+              html: aiData.html,
+              sender: "AI",
+              timestamp: aiData.timestamp,
+              model_name: currentModel,
+              internal_monologue: planningModeEnabled
+                ? aiData.planning
+                : null,
+              internal_monologue_html: planningModeEnabled
+                ? aiData.planning_html
+                : null,
+            });
+          } else if (aiData.status === "error") {
+            throw new Error(aiData.message);
+          }
+        }
+      }
+    } catch (error) {
+      console.error("Error:", error);
+      removeTypingIndicator();
+      addMessage({
+        id: Date.now().toString(),
+        content:
+          "An error occurred while processing your request: " +
+          error.message,
+        sender: "System",
+        timestamp: new Date().toISOString(),
+      });
+    } finally {
+      clearFirstMessageTimer();
+      removeTypingIndicator();
+      removeLoadingMessage();
+      setWaitingState(false);
+    }
+  }
+}
+
+function startFirstMessageTimer() {
+  firstMessageTimer = setTimeout(() => {
+    showLoadingMessage(
+      "The first message in a conversation may take longer to generate. Please be patient..."
+    );
+  }, 10000); // Show this message after 10 seconds
+}
+
+function clearFirstMessageTimer() {
+  if (firstMessageTimer) {
+    clearTimeout(firstMessageTimer);
+    firstMessageTimer = null;
+  }
+}
+
+function showLoadingMessage(message) {
+  removeLoadingMessage();
+  const loadingElement = document.createElement("div");
+  loadingElement.className = "system-message loading-indicator"; // Add loading-indicator class for tracking
+  loadingElement.textContent = message;
+  chatContainer.appendChild(loadingElement);
+  chatContainer.scrollTop = chatContainer.scrollHeight;
+}
+
+function removeLoadingMessage() {
+  const loadingElement = chatContainer.querySelector(
+    ".system-message.loading-indicator"
+  );
+  if (loadingElement) {
+    loadingElement.remove();
+  }
+}
+
+function showTypingIndicator() {
+  const typingIndicator = document.createElement("div");
+  typingIndicator.className =
+    "message-container ai-message-container typing-indicator";
+  typingIndicator.innerHTML =
+    '<div class="message ai-message typing-message"><div class="typing-dots"><span></span><span></span><span></span></div></div>';
+  chatContainer.appendChild(typingIndicator);
+  chatContainer.scrollTop = chatContainer.scrollHeight;
+}
+
+function removeTypingIndicator() {
+  const typingIndicator = document.querySelector(".typing-indicator");
+  const typingMessage = document.querySelector(".typing-message");
+  if (typingIndicator) {
+    if (typingMessage) {
+      typingMessage.classList.add("fade-out");
+    }
+    setTimeout(() => {
+      typingIndicator.remove();
+    }, 300); // Matches the fadeDownOut animation duration
+  }
+}
+
+userInput.addEventListener("input", function () {
+  this.style.height = "auto";
+  this.style.height = this.scrollHeight + "px";
+
+  const maxHeight = messageBox.offsetHeight - 30;
+  if (this.scrollHeight > maxHeight) {
+    this.style.height = maxHeight + "px";
+    this.style.overflowY = "auto";
+  } else {
+    this.style.overflowY = "hidden";
+  }
+});
+
+sendButton.addEventListener("click", sendMessage);
+
+userInput.addEventListener("keydown", (e) => {
+  if (e.key === "Enter" && !e.shiftKey && !isWaitingForResponse) {
+    e.preventDefault();
+    sendMessage();
+  }
+});
+
+function selectModel(modelName) {
+  const modelOption = modelSelect.querySelector(
+    `option[value="${modelName}"]`
+  );
+  if (modelOption) {
+    modelOption.selected = true;
+    currentModel = modelName;
+  }
+}
+
+const noModelsGuide = document.getElementById("no-models-guide");
+const noModelsMessage = document.getElementById("no-models-message");
+const helpButton = document.getElementById("help-button");
+const closeGuideButton = document.getElementById("close-guide-button");
+
+function showGuide(noModelsInstalled = false) {
+  if (noModelsGuide.style.display === "flex") {
+    return;
+  }
+  noModelsGuide.style.display = "flex";
+  if (noModelsInstalled) {
+    noModelsMessage.style.display = "flex";
+    closeGuideButton.style.display = "flex";
+  } else {
+    noModelsMessage.style.display = "none";
+    closeGuideButton.style.display = "flex";
+  }
+}
+
+function hideGuide() {
+  noModelsGuide.style.display = "none";
+}
+
+helpButton.addEventListener("click", () => showGuide(false));
+
+closeGuideButton.addEventListener("click", hideGuide);
+
+async function loadModels() {
+  try {
+    const response = await fetch("/models");
+    if (!response.ok) {
+      if (response.status === 404) {
+        // This is the case when no models are found
+        showGuide(true);
+        return;
+      }
+      // For other errors, throw to be caught in the catch block
+      const errorData = await response.json();
+      throw new Error(errorData.error || "Failed to load AI models.");
+    }
+    const data = await response.json();
+    hideGuide();
+    modelSelect.innerHTML = data.models
+      .map((model) => `<option value="${model}">${model}</option>`)
+      .join("");
+    if (data.current_model && data.current_model !== "None") {
+      selectModel(data.current_model);
+    } else if (data.models.length > 0) {
+      selectModel(data.models[0]);
+    }
+  } catch (error) {
+    console.error("Error loading conversation:", error);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error loading conversation:" + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+}
+
+modelSelect.addEventListener("change", (e) => {
+  currentModel = e.target.value;
+  addMessage({
+    id: Date.now().toString(),
+    content: `Switched to model: ${currentModel}`,
+    sender: "System",
+    timestamp: null,
+  });
+});
+
+// conversation system scripts
+const conversationList = document.getElementById("conversation-list");
+
+function createConversationItem(conv) {
+  const item = document.createElement("div");
+  item.classList.add("conversation-item");
+  item.dataset.conversationId = conv.id;
+
+  // Add warning indicator if there's a version warning
+  if (conv.version_warning) {
+    const warningIcon = document.createElement("span");
+    warningIcon.classList.add("conversation-warning-icon");
+    warningIcon.textContent = "⚠️";
+    warningIcon.title = conv.version_warning;
+    item.appendChild(warningIcon);
+  }
+  const text = document.createElement("span");
+  text.classList.add("conversation-name");
+  text.textContent = conv.name;
+  item.appendChild(text);
+
+  const buttonsContainer = document.createElement("div");
+  buttonsContainer.classList.add("conversation-buttons");
+
+  const editButton = document.createElement("button");
+  editButton.classList.add("conversation-button", "edit-button");
+  editButton.innerHTML =
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24"><path d="M3 17.25V21h3.75L17.81 9.94l-3.75-3.75L3 17.25zM20.71 7.04c.39-.39.39-1.02 0-1.41l-2.34-2.34c-.39-.39-1.02-.39-1.41 0l-1.83 1.83 3.75 3.75 1.83-1.83z"/></svg>';
+  editButton.addEventListener("click", (e) => {
+    e.stopPropagation();
+    startEditingConversationName(item, text);
+  });
+  buttonsContainer.appendChild(editButton);
+
+  const deleteButton = document.createElement("button");
+  deleteButton.classList.add("conversation-button", "delete-button");
+  deleteButton.innerHTML =
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24"><path d="M6 19c0 1.1.9 2 2 2h8c1.1 0 2-.9 2-2V7H6v12zM19 4h-3.5l-1-1h-5l-1 1H5v2h14V4z"/></svg>';
+  deleteButton.addEventListener("click", (e) => {
+    e.stopPropagation();
+    deleteConversation(conv.id);
+  });
+  buttonsContainer.appendChild(deleteButton);
+
+  item.appendChild(buttonsContainer);
+
+  item.addEventListener("click", () => loadConversation(conv.id));
+  return item;
+}
+
+function startEditingConversationName(item, textElement) {
+  item.removeEventListener("click", item.clickHandler);
+
+  const input = document.createElement("textarea");
+  input.classList.add("conversation-name", "edit-conversation-input");
+  input.value = textElement.textContent;
+  // input.rows = 1;
+  // input.style.height = `${textElement.offsetHeight}px`;
+  input.style.width = `${textElement.offsetWidth}px`;
+
+  input.addEventListener("keydown", (e) => {
+    if (e.key === "Enter" && !e.shiftKey) {
+      e.preventDefault();
+      finishEditingConversationName(item, input, textElement);
+    }
+  });
+
+  input.addEventListener("blur", () => {
+    finishEditingConversationName(item, input, textElement);
+  });
+
+  // Stop propagation of the click event to the parent elements
+  input.addEventListener("click", (e) => {
+    e.stopPropagation();
+  });
+
+  item.replaceChild(input, textElement);
+  input.focus();
+}
+
+async function finishEditingConversationName(item, input, textElement) {
+  const newName = input.value.trim();
+  const oldName = textElement.textContent;
+
+  if (newName !== oldName) {
+    try {
+      const response = await fetch("/conversation/rename", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          conversation_id: item.dataset.conversationId,
+          new_name: newName,
+        }),
+      });
+
+      if (response.ok) {
+        textElement.textContent = newName;
+      } else {
+        console.error("Failed to rename conversation");
+      }
+    } catch (error) {
+      console.error("Error renaming conversation:", error);
+    }
+  }
+
+  item.replaceChild(textElement, input);
+  item.clickHandler = () => loadConversation(item.dataset.conversationId);
+  item.addEventListener("click", item.clickHandler);
+}
+
+document
+  .getElementById("new-chat-button")
+  .addEventListener("click", clearCurrentConversation);
+
+async function clearCurrentConversation() {
+  try {
+    await fetch("/conversation/clear", { method: "POST" });
+    clearChat();
+    currentConversationId = null;
+    highlightActiveConversation();
+  } catch (error) {
+    console.error("Error clearing conversation:", error);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error clearing conversation:" + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+}
+
+function groupConversationsByDate(conversations) {
+  const groups = {};
+  const today = new Date();
+  const yesterday = new Date(today);
+  yesterday.setDate(yesterday.getDate() - 1);
+
+  conversations.forEach((conversation) => {
+    console.log("Conversation:", conversation); // Debug log
+    if (conversation.latest_message_timestamp) {
+      const date = new Date(conversation.latest_message_timestamp);
+      console.log("Parsed date:", date); // Debug log
+      let key;
+
+      if (date.toDateString() === today.toDateString()) {
+        key = "Today";
+      } else if (date.toDateString() === yesterday.toDateString()) {
+        key = "Yesterday";
+      } else if (
+        today.getTime() - date.getTime() <
+        7 * 24 * 60 * 60 * 1000
+      ) {
+        key = date.toLocaleDateString("en-US", { weekday: "long" });
+      } else {
+        key = date.toLocaleDateString("en-US", {
+          year: "numeric",
+          month: "short",
+          day: "numeric",
+        });
+      }
+
+      if (!groups[key]) {
+        groups[key] = [];
+      }
+      groups[key].push(conversation);
+    } else {
+      console.log("No timestamp for conversation:", conversation.id); // Debug log
+      if (!groups["No date"]) {
+        groups["No date"] = [];
+      }
+      groups["No date"].push(conversation);
+    }
+  });
+
+  console.log("Grouped conversations:", groups); // Debug log
+  return groups;
+}
+
+async function loadConversations() {
+  try {
+    const response = await fetch("/conversations");
+    const conversations = await response.json();
+    const groupedConversations = groupConversationsByDate(conversations);
+
+    const conversationList = document.getElementById("conversation-list");
+    const newChatButton =
+      conversationList.querySelector("#new-chat-button");
+    conversationList.innerHTML = "";
+    conversationList.appendChild(newChatButton);
+
+    Object.entries(groupedConversations).forEach(([date, convs]) => {
+      const dateElement = document.createElement("div");
+      dateElement.classList.add("conversation-date-separator");
+      dateElement.textContent = date;
+      conversationList.appendChild(dateElement);
+
+      convs.forEach((conv) => {
+        conversationList.appendChild(createConversationItem(conv));
+      });
+    });
+
+    // disable conversion entries if necessary
+    setWaitingState(isWaitingForResponse);
+
+    highlightActiveConversation();
+  } catch (error) {
+    console.error("Error loading conversations:", error);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error loading conversations:" + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+}
+
+function moveConversationToTop(conversationId) {
+  const conversationItem = document.querySelector(
+    `.conversation-item[data-conversation-id="${conversationId}"]`
+  );
+  if (conversationItem) {
+    const conversationList = document.getElementById("conversation-list");
+    const newChatButton =
+      conversationList.querySelector("#new-chat-button");
+    conversationList.insertBefore(
+      conversationItem,
+      newChatButton.nextSibling
+    );
+  }
+}
+
+async function deleteConversation(id) {
+  try {
+    await fetch("/conversation/delete", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ id: id }),
+    });
+    await loadConversations();
+    if (currentConversationId === id) {
+      clearChat();
+      currentConversationId = null;
+    }
+  } catch (error) {
+    console.error("Error deleting conversation:", error);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error deleting conversation:" + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+}
+
+function highlightActiveConversation() {
+  document.querySelectorAll(".conversation-item").forEach((item) => {
+    item.classList.remove("active");
+    if (item.dataset.conversationId === currentConversationId) {
+      item.classList.add("active");
+    }
+  });
+}
+
+async function loadCurrentConversation(reuseShown = true) {
+  try {
+    const known = reuseShown ? knownBranch(currentConversationId) : {};
+    if (known.known_leaf) known.conversation_id = currentConversationId;
+    const response = await fetch(
+      "/conversations/current?" +
+        new URLSearchParams({
+          ...known,
+          limit: BRANCH_WINDOW_SIZE,
+          monologues: 0,
+        })
+    );
+    const data = await response.json();
+    if (data.conversation_id) {
+      if (!showBranch(data)) {
+        return loadCurrentConversation(false);
+      }
+      currentConversationId = data.conversation_id;
+      highlightActiveConversation();
+
+      // Display version warning if present
+      if (data.version_warning) {
+        addMessage({
+          id: "version-warning-" + Date.now().toString(),
+          content: data.version_warning,
+          sender: "System",
+          timestamp: new Date().toISOString(),
+        });
+      }
+    }
+  } catch (error) {
+    console.error("Error loading current conversation:", error);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error loading current conversation:" + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+}
+
+// Modals
+
+function showModal(modal) {
+  modal.style.display = "block";
+  modal.querySelector(".modal-content").classList.remove("closing");
+}
+
+function hideModal(modal) {
+  const modalContent = modal.querySelector(".modal-content");
+  modalContent.classList.add("closing");
+  modalContent.addEventListener("animationend", function handler() {
+    modal.style.display = "none";
+    modalContent.classList.remove("closing");
+    modalContent.removeEventListener("animationend", handler);
+  });
+}
+
+// Model Modal (try to say that fast 5 times)
+const addModelButton = document.getElementById("add-model-button");
+
+const modelsFolderSpans = document.querySelectorAll(
+  ".models-folder-path"
+);
+const openFolderButtons = document.querySelectorAll(
+  ".open-folder-button"
+);
+const addModelModal = document.getElementById("add-model-modal");
+const closeAddModelModal = document.getElementById(
+  "close-add-model-modal"
+);
+const modelsFolderInput = document.getElementById("models-folder");
+// const modelUrlInput = document.getElementById("model-url");
+// const downloadModelButton = document.getElementById(
+//   "download-model-button"
+// );
+
+addModelButton.addEventListener("click", () => {
+  showModal(addModelModal);
+  loadModelsFolderPath();
+});
+
+closeAddModelModal.addEventListener("click", () => {
+  hideModal(addModelModal);
+});
+
+openFolderButtons.forEach((button) => {
+  button.addEventListener("click", async () => {
+    try {
+      await fetch("/models/open_folder", { method: "POST" });
+    } catch (error) {
+      console.error("Error opening models folder:", error);
+    }
+  });
+});
+
+async function loadModelsFolderPath() {
+  try {
+    const response = await fetch("/models/folder_path");
+    const data = await response.json();
+    modelsFolderSpans.forEach((span) => {
+      span.textContent = data.path;
+    });
+  } catch (error) {
+    console.error("Error loading models folder path:", error);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error loading models folder path:" + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+}
+
+//Session Prompt modal
+const sessionPromptButton = document.getElementById(
+  "session-prompt-button"
+);
+const sessionPromptModal = document.getElementById(
+  "session-prompt-modal"
+);
+const sessionPromptInput = document.getElementById(
+  "session-prompt-input"
+);
+const saveSessionPromptButton = document.getElementById(
+  "save-session-prompt"
+);
+const closeSessionPromptModal = document.getElementById(
+  "close-session-prompt-modal"
+);
+
+let currentSessionPrompt = "";
+
+async function loadSessionPrompt() {
+  try {
+    const response = await fetch("/session_prompt");
+    const data = await response.json();
+    currentSessionPrompt = data.session_prompt;
+    sessionPromptInput.value = currentSessionPrompt;
+  } catch (error) {
+    console.error("Error loading Session Prompt:", error);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error loading Session Prompt:" + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+}
+
+sessionPromptButton.addEventListener("click", () => {
+  showModal(sessionPromptModal);
+});
+
+closeSessionPromptModal.addEventListener("click", () => {
+  hideModal(sessionPromptModal);
+});
+
+saveSessionPromptButton.addEventListener("click", async () => {
+  currentSessionPrompt = sessionPromptInput.value.trim();
+
+  fetch("/session_prompt/set", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ session_prompt: currentSessionPrompt }),
+  })
+    .then((response) => response.json())
+    .then((data) => {
+      if (data.success) {
+        console.log("Session Prompt updated successfully");
+        sessionPromptModal.style.display = "none";
+        addMessage({
+          id: Date.now().toString(),
+          content: "Session Prompt updated",
+          sender: "System",
+          timestamp: null,
+        });
+      } else {
+        console.error("Failed to update Session Prompt:", data.error);
+      }
+    })
+    .catch((error) => {
+      console.error("Error updating Session Prompt:", error);
+      addMessage({
+        id: Date.now().toString(),
+        content: "Error updating Session Prompt:" + error.message,
+        sender: "System",
+        timestamp: null,
+      });
+    });
+});
+
+// load default Session Prompt
+const loadDefaultPromptButton = document.getElementById(
+  "load-default-prompt"
+);
+
+loadDefaultPromptButton.addEventListener("click", async () => {
+  try {
+    const response = await fetch("/session_prompt/default");
+    const data = await response.json();
+    sessionPromptInput.value = data.default_session_prompt;
+  } catch (error) {
+    console.error("Error loading default Session Prompt:", error);
+    addMessage({
+      id: Date.now().toString(),
+      content: "Error loading default Session Prompt:" + error.message,
+      sender: "System",
+      timestamp: null,
+    });
+  }
+});
+
+// Initialize the chat interface
+loadModels();
+loadSessionPrompt();
+loadConversations();
+loadModelsFolderPath();
+loadCurrentConversation();
+
+let planningModeEnabled =
+  localStorage.getItem("planningModeEnabled") === "true";
+
+// Initialize UI state based on saved preferences
+function initializePlanningToggle() {
+  const planningToggle = document.getElementById("Planning-toggle");
+  if (planningModeEnabled) {
+    planningToggle.classList.add("active");
+  } else {
+    planningToggle.classList.remove("active");
+  }
+}
+
+// Handle planning toggle button click
+document
+  .getElementById("Planning-toggle")
+  .addEventListener("click", function () {
+    planningModeEnabled = !planningModeEnabled;
+    localStorage.setItem("planningModeEnabled", planningModeEnabled);
+
+    if (planningModeEnabled) {
+      this.classList.add("active");
+      addMessage({
+        id: Date.now().toString(),
+        content:
+          "AI planning mode enabled. You'll see the AI's internal thought process before responses.",
+        sender: "System",
+        timestamp: null,
+      });
+    } else {
+      this.classList.remove("active");
+      addMessage({
+        id: Date.now().toString(),
+        content:
+          "AI planning mode disabled. The AI will respond directly without showing its thought process.",
+        sender: "System",
+        timestamp: null,
+      });
+    }
+  });
+
+// Initialize UI state
+initializePlanningToggle();
@@ -0,0 +1,132 @@
+"""
+Static Assets - Builds the web interface's stylesheet, script and vendored libraries for serving.
+
+chat-interface.html loads chat-interface.css, chat-interface.js and the vendored highlight.js theme from the static
+directory. Building them:
+
+- Writes every file under static/ to static/build/ with a content-hashed name, e.g. chat-interface.3f2a91c0d4e7.js
+- Writes a gzip copy of each text asset next to it, and a brotli copy when the brotli module is installed
+- Writes static/build/chat-interface.html with its references rewritten to the hashed names, and its compressed copies
+- Vendored files are committed in static/vendor, neither the build nor the application fetches anything from a CDN
+
+A hashed name only ever holds the same content, so hashed assets can be cached by browsers indefinitely, while the page
+is revalidated on each load and picks up new names after a rebuild. Without a build the application serves the
+sources as they are.
+
+Usage:
+python static_assets.py
+
+"""
+
+import os
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+from typing import Container, Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIRNAME = "static"
+BUILD_DIRNAME = "build"
+MANIFEST_FILENAME = "manifest.json"
+PAGE_FILENAME = "chat-interface.html"
+
+# Vendored files by their path under static/, with the release they were taken from. They are committed with the
+# source, the build only checks they are there
+VENDOR_ASSETS = {
+    'vendor/atom-one-dark.min.css': "highlight.js 11.7.0 atom-one-dark theme",
+}
+
+# Only text compresses well, images and fonts are already compressed
+COMPRESSED_EXTENSIONS = ('.html', '.css', '.js', '.json', '.svg', '.txt')
+# Encodings of the precompressed copies, in order of preference, with their file extensions
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+class AssetError(Exception):
+    pass
+
+def hashed_name(path: str, data: bytes) -> str:
+    base, extension = os.path.splitext(path)
+    return f"{base}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+
+# Write an asset and its precompressed copies. Copies that come out no smaller than the asset are skipped
+def _write_asset(filename: str, data: bytes):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'wb') as f:
+        f.write(data)
+    if not filename.endswith(COMPRESSED_EXTENSIONS):
+        return
+    # mtime=0 so the same asset always compresses to the same bytes
+    copies = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        copies.append(('.br', brotli.compress(data, quality=11)))
+    for extension, compressed in copies:
+        if len(compressed) < len(data):
+            with open(filename + extension, 'wb') as f:
+                f.write(compressed)
+
+# Build static/build from static/ and the page in base_dir. Returns the manifest of source paths to hashed names
+def build_assets(base_dir: str) -> Dict[str, str]:
+    static_dir = os.path.join(base_dir, STATIC_DIRNAME)
+    build_dir = os.path.join(static_dir, BUILD_DIRNAME)
+    missing = [path for path in VENDOR_ASSETS if not os.path.exists(os.path.join(static_dir, *path.split('/')))]
+    if missing:
+        raise AssetError(f"Vendored libraries missing from {static_dir}: {', '.join(missing)}")
+
+    # Built names change with every change to an asset, so old builds are removed rather than accumulating
+    if os.path.exists(build_dir):
+        shutil.rmtree(build_dir)
+    manifest: Dict[str, str] = {}
+    for directory, subdirectories, filenames in os.walk(static_dir):
+        if directory == static_dir and BUILD_DIRNAME in subdirectories:
+            subdirectories.remove(BUILD_DIRNAME)
+        for name in filenames:
+            filename = os.path.join(directory, name)
+            path = os.path.relpath(filename, static_dir).replace(os.sep, '/')
+            with open(filename, 'rb') as f:
+                data = f.read()
+            manifest[path] = hashed_name(path, data)
+            _write_asset(os.path.join(build_dir, *manifest[path].split('/')), data)
+
+    with open(os.path.join(base_dir, PAGE_FILENAME), 'r', encoding='utf-8') as f:
+        page = f.read()
+    for path, built in manifest.items():
+        page = page.replace(f'"/{STATIC_DIRNAME}/{path}"', f'"/{STATIC_DIRNAME}/{BUILD_DIRNAME}/{built}"')
+    _write_asset(os.path.join(build_dir, PAGE_FILENAME), page.encode('utf-8'))
+
+    with open(os.path.join(build_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+# The file to send for a request accepting the given encodings: the best precompressed copy that exists, otherwise the
+# file itself. Returns (filename, content encoding or None)
+def find_precompressed(directory: str, filename: str, accepted: Container[str]) -> Tuple[str, Optional[str]]:
+    if filename.endswith(COMPRESSED_EXTENSIONS):
+        for encoding, extension in ENCODINGS:
+            if encoding in accepted and os.path.isfile(os.path.join(directory, filename + extension)):
+                return filename + extension, encoding
+    return filename, None
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the web interface's assets with hashed names and precompressed copies")
+    parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        manifest = build_assets(base_dir)
+    except AssetError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    for path, built in sorted(manifest.items()):
+        print(f"{path} -> {built}")
+    if brotli is None:
+        print("brotli is not installed, only gzip copies were written")
+
+if __name__ == "__main__":
+    main()